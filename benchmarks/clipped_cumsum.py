@@ -0,0 +1,46 @@
+# %%
+"""
+Microbenchmark of the clipped cumulative sum: ``numpy_function.clipped_cumsum`` against
+``utility.array_kernels.clipped_cumsum`` (chunked NumPy evaluation, or compiled loop when numba is installed).
+Shapes are the ones of the first stage post-processing (daily timestamps x scenarios x basins) and of the
+battery state of charge (quarter hours of a year).
+"""
+import timeit
+import numpy as np
+import polars as pl
+
+from numpy_function import clipped_cumsum as numpy_function_clipped_cumsum
+
+from utility.array_kernels import clipped_cumsum
+from utility.data_preprocessing import print_pl
+
+NB_REPEAT = 5
+SHAPES: dict[str, tuple[int, ...]] = {
+    "first stage (T, Ω, B)": (366, 200, 3),
+    "first stage, one basin (T, Ω)": (366, 200),
+    "reduced first stage (T, Ω, B)": (366, 30, 3),
+    "hourly scenarios (T, Ω)": (8784, 30),
+    "battery soc (T,)": (35040,),
+}
+
+# %%
+rng = np.random.default_rng(42)
+results: list[dict] = []
+for name, shape in SHAPES.items():
+    a = rng.normal(0, 0.05, size=shape)
+    # The original kernel only takes 1-D and 2-D arrays
+    a_2d = a.reshape(shape[0], -1)
+    assert np.allclose(
+        clipped_cumsum(a, xmin=0, xmax=1).reshape(a_2d.shape),
+        numpy_function_clipped_cumsum(a_2d, xmin=0, xmax=1)
+    )
+    original_time = min(timeit.repeat(
+        lambda: numpy_function_clipped_cumsum(a_2d, xmin=0, xmax=1), number=1, repeat=NB_REPEAT
+    ))
+    kernel_time = min(timeit.repeat(lambda: clipped_cumsum(a, xmin=0, xmax=1), number=1, repeat=NB_REPEAT))
+    results.append({
+        "shape": name, "numpy_function [ms]": original_time * 1e3, "array_kernels [ms]": kernel_time * 1e3,
+        "speedup": original_time / kernel_time
+    })
+
+print_pl(pl.DataFrame(results), float_precision=2)
@@ -0,0 +1,72 @@
+# %%
+"""
+Report of the decoupled second stage mode (``DataConfig.decoupled_days``) against the exact sequential run:
+computation time, adjusted income and deviation of the basin volumes. The decoupled simulations start from the
+first stage basin volume expectation and are solved in NB_WORKERS processes, then reconciled sequentially.
+"""
+import copy
+import time
+import polars as pl
+
+from smallflex_data_schema import SmallflexInputSchema
+
+from pipelines.data_configs import DataConfig
+from pipelines.data_manager import HydroDataManager
+from pipelines.pipeline_manager.first_stage_stochastic_pipeline import first_stage_stochastic_pipeline
+from pipelines.pipeline_manager.second_stage_stochastic_pipeline import second_stage_stochastic_pipeline
+from pipelines.pipeline_manager.vpp_design_scheme import HYDROPOWER_MASK
+from pipelines.result_manager import second_stage_volume_deviation
+from utility.data_preprocessing import print_pl
+
+from config import settings
+
+HYDRO = "DTP"
+NB_WORKERS = 8
+
+# %%
+if __name__ == "__main__":
+    smallflex_input_schema: SmallflexInputSchema = SmallflexInputSchema().duckdb_to_schema(
+        file_path=settings.input_files.duckdb_input
+    )
+    data_config: DataConfig = DataConfig(
+        total_scenarios_synthesized=smallflex_input_schema.discharge_volume_synthesized["scenario"].max(),  # type: ignore
+        nb_workers=NB_WORKERS,
+    )
+    _, basin_volume_expectation, _ = first_stage_stochastic_pipeline(
+        data_config=data_config,
+        smallflex_input_schema=smallflex_input_schema,
+        hydro_power_mask=HYDROPOWER_MASK[HYDRO],
+    )
+
+    results: dict[str, tuple[pl.DataFrame, float, float]] = {}
+    for decoupled_days in [False, True]:
+        mode_config = copy.deepcopy(data_config)
+        mode_config.decoupled_days = decoupled_days
+        tic = time.time()
+        optimization_results, adjusted_income, _ = second_stage_stochastic_pipeline(
+            data_config=mode_config,
+            smallflex_input_schema=smallflex_input_schema,
+            basin_volume_expectation=basin_volume_expectation,
+            hydro_power_mask=HYDROPOWER_MASK[HYDRO],
+        )
+        results["decoupled" if decoupled_days else "sequential"] = (
+            optimization_results, adjusted_income, time.time() - tic
+        )
+
+    # %%
+    print_pl(pl.DataFrame(
+        [
+            (mode, adjusted_income / 1e3, duration, adjusted_income / results["sequential"][1] - 1)
+            for mode, (_, adjusted_income, duration) in results.items()
+        ],
+        schema=["mode", "adjusted_income [kCHF]", "time [s]", "income deviation"], orient="row"
+    ), float_precision=3)
+
+    basin_idx = HydroDataManager(
+        data_config=data_config, smallflex_input_schema=smallflex_input_schema,
+        hydro_power_mask=HYDROPOWER_MASK[HYDRO],
+    ).water_basin["B"].to_list()
+    print_pl(second_stage_volume_deviation(
+        optimization_results=results["decoupled"][0], reference_results=results["sequential"][0],
+        basin_idx=basin_idx,
+    ), float_precision=4)
@@ -0,0 +1,46 @@
+# %%
+"""
+Import time of the optimization entry points, each measured in a fresh interpreter since worker processes pay it
+once per process. The optimization pipelines import their plotting dependencies only when a figure is requested,
+so the HEAVY_MODULES columns must stay False.
+"""
+import statistics
+import subprocess
+import sys
+import polars as pl
+
+from utility.data_preprocessing import print_pl
+
+NB_REPEAT = 5
+ENTRY_POINTS: list[str] = [
+    "pipelines.pipeline_manager.first_stage_stochastic_pipeline",
+    "pipelines.pipeline_manager.second_stage_stochastic_pipeline",
+    "pipelines.pipeline_manager.study_tasks",
+    "pipelines.pipeline_manager.vpp_design_scheme",
+]
+HEAVY_MODULES: list[str] = ["plotly", "matplotlib", "altair", "sklearn_extra", "plotly_calplot"]
+
+IMPORT_SCRIPT = """
+import sys, time
+tic = time.perf_counter()
+import {module}
+print(time.perf_counter() - tic)
+print(",".join(str(name in sys.modules) for name in {heavy_modules}))
+"""
+
+# %%
+results: list[dict] = []
+for module in ENTRY_POINTS:
+    durations: list[float] = []
+    for _ in range(NB_REPEAT):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT.format(module=module, heavy_modules=HEAVY_MODULES)],
+            capture_output=True, text=True, check=True
+        ).stdout.splitlines()
+        durations.append(float(output[-2]))
+    results.append({
+        "module": module, "import time [s]": statistics.median(durations),
+        **dict(zip(HEAVY_MODULES, map(lambda loaded: loaded == "True", output[-1].split(","))))
+    })
+
+print_pl(pl.DataFrame(results), float_precision=2)
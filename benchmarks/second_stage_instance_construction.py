@@ -0,0 +1,80 @@
+# %%
+"""
+Benchmark of the second stage instance construction time: rule based constraints against the
+linear-expression formulation (``DataConfig.linear_formulation``).
+Both models are instantiated with the same data for the first NB_SIMS simulations of the year.
+"""
+import time
+import polars as pl
+from tqdm.auto import tqdm
+
+from general_function import pl_to_dict
+from smallflex_data_schema import SmallflexInputSchema
+
+from pipelines.data_configs import DataConfig
+from pipelines.model_manager.deterministic_second_stage import DeterministicSecondStage
+from pipelines.pipeline_manager.first_stage_stochastic_pipeline import first_stage_stochastic_pipeline
+from pipelines.pipeline_manager.vpp_design_scheme import HYDROPOWER_MASK
+from optimization_model.deterministic_second_stage.model import deterministic_second_stage_model
+from timeseries_preparation.deterministic_data import process_timeseries_data
+from utility.data_preprocessing import print_pl
+
+from config import settings
+
+NB_SIMS = 30
+HYDRO = "DTP"
+
+# %%
+smallflex_input_schema: SmallflexInputSchema = SmallflexInputSchema().duckdb_to_schema(
+    file_path=settings.input_files.duckdb_input
+)
+data_config: DataConfig = DataConfig(
+    total_scenarios_synthesized=smallflex_input_schema.discharge_volume_synthesized["scenario"].max(),  # type: ignore
+    model_reduction=False,
+)
+
+_, basin_volume_expectation, _ = first_stage_stochastic_pipeline(
+    data_config=data_config,
+    smallflex_input_schema=smallflex_input_schema,
+    hydro_power_mask=HYDROPOWER_MASK[HYDRO],
+)
+# %%
+second_stage: DeterministicSecondStage = DeterministicSecondStage(
+    data_config=data_config,
+    smallflex_input_schema=smallflex_input_schema,
+    hydro_power_mask=HYDROPOWER_MASK[HYDRO],
+)
+timeseries = process_timeseries_data(
+    smallflex_input_schema=smallflex_input_schema,
+    data_config=data_config,
+    basin_index_mapping=pl_to_dict(second_stage.water_basin["uuid", "B"]),
+)
+second_stage.set_timeseries(timeseries=timeseries, basin_volume_expectation=basin_volume_expectation)
+second_stage.generate_constant_parameters()
+
+models = {
+    formulation: deterministic_second_stage_model(
+        with_ancillary=data_config.with_ancillary,
+        with_battery=data_config.battery_capacity > 0,
+        linear_formulation=formulation == "linear_expression",
+    ) for formulation in ["rule", "linear_expression"]
+}
+construction_time: list[dict] = []
+for second_stage.sim_idx in tqdm(range(min(NB_SIMS, second_stage.nb_sims)), desc="Instantiating models"):
+    second_stage.calculate_second_stage_states()
+    second_stage.generate_model_instance()
+    for formulation, model in models.items():
+        tic = time.perf_counter()
+        model.create_instance({None: second_stage.data})  # type: ignore
+        construction_time.append({
+            "sim_idx": second_stage.sim_idx, "formulation": formulation, "time": time.perf_counter() - tic
+        })
+
+print_pl(
+    pl.DataFrame(construction_time).group_by("formulation").agg(
+        pl.col("time").mean().alias("mean_time_s"), 
+        pl.col("time").max().alias("max_time_s"),
+        pl.col("time").sum().alias("total_time_s"),
+    ),
+    float_precision=4
+)
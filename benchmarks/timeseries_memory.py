@@ -0,0 +1,79 @@
+# %%
+"""
+Memory footprint of the timeseries frames: previous schema (Float64 values, Int64 indices and list columns for the
+composite keys of the Pyomo parameters) against ``utility.compact_schema.compact_timeseries``. Shapes are the ones
+of the first stage (daily timestamps x scenarios x basins) and of the hourly second stage.
+"""
+import timeit
+import numpy as np
+import polars as pl
+from polars import col as c
+
+from general_function import pl_to_dict_with_tuple
+
+from utility.compact_schema import compact_timeseries, pl_to_dict_with_index
+from utility.data_preprocessing import print_pl
+
+NB_REPEAT = 5
+NB_DAYS = 366
+NB_SCENARIOS = 200
+NB_BASINS = 3
+NB_HOURS = 8784
+
+# %%
+rng = np.random.default_rng(42)
+first_stage = pl.DataFrame({
+    "T": np.repeat(np.arange(NB_DAYS), NB_SCENARIOS * NB_BASINS).astype(np.uint32),
+    "Ω": np.tile(np.repeat(np.arange(NB_SCENARIOS), NB_BASINS), NB_DAYS),
+    "B": np.tile(np.arange(NB_BASINS), NB_DAYS * NB_SCENARIOS).astype(np.uint32),
+    "discharge_volume": rng.gamma(2, 1e4, size=NB_DAYS * NB_SCENARIOS * NB_BASINS),
+    "market_price": rng.normal(80, 30, size=NB_DAYS * NB_SCENARIOS * NB_BASINS),
+    "probability": np.full(NB_DAYS * NB_SCENARIOS * NB_BASINS, 1 / NB_SCENARIOS),
+})
+second_stage = pl.DataFrame({
+    "T": np.arange(NB_HOURS, dtype=np.uint32),
+    "F": np.arange(NB_HOURS) // 4,
+    "sim_idx": np.arange(NB_HOURS) // (24 * 7),
+    **{
+        col: rng.normal(50, 20, size=NB_HOURS)
+        for col in [
+            "market_price", "market_price_lower_quantile", "market_price_upper_quantile", "ancillary_market_price",
+            "short_imbalance", "long_imbalance", "pv_power", "wind_power", "discharge_volume_0"
+        ]
+    }
+})
+previous = {
+    "first stage": first_stage.with_columns(
+        pl.concat_list("T", "Ω", "B").alias("TΩB"), pl.concat_list("T", "Ω").alias("TΩ")
+    ),
+    "second stage": second_stage.with_columns(pl.concat_list("T", "F").alias("TF")),
+}
+compact = {
+    "first stage": compact_timeseries(first_stage),
+    "second stage": compact_timeseries(second_stage),
+}
+# %%
+results: list[dict] = []
+for name in previous:
+    results.append({
+        "frame": name, "rows": previous[name].height,
+        "previous [MB]": previous[name].estimated_size("mb"), "compact [MB]": compact[name].estimated_size("mb"),
+        "ratio": previous[name].estimated_size() / compact[name].estimated_size(),
+    })
+print_pl(pl.DataFrame(results), float_precision=2)
+
+# %%
+# Generation of the Pyomo parameter data of the first stage discharge volume
+previous_time = min(timeit.repeat(
+    lambda: pl_to_dict_with_tuple(previous["first stage"][["TΩB", "discharge_volume"]]), number=1, repeat=NB_REPEAT
+))
+compact_time = min(timeit.repeat(
+    lambda: pl_to_dict_with_index(compact["first stage"], index=["T", "Ω", "B"], value="discharge_volume"),
+    number=1, repeat=NB_REPEAT
+))
+assert pl_to_dict_with_index(compact["first stage"], index=["T", "Ω", "B"], value="discharge_volume").keys() == \
+    pl_to_dict_with_tuple(previous["first stage"][["TΩB", "discharge_volume"]]).keys()
+print_pl(pl.DataFrame([{
+    "parameter": "discharge_volume (TΩB)", "previous [ms]": previous_time * 1e3,
+    "compact [ms]": compact_time * 1e3, "speedup": previous_time / compact_time
+}]), float_precision=2)
@@ -1,41 +1,25 @@
-import os
-
-import json
-import numpy as np
 import polars as pl
 from polars import col as c
-from polars import selectors as cs
-import pyomo.environ as pyo
-from datetime import timedelta, datetime
-from itertools import product
-from tqdm.auto import tqdm
-from typing import Optional, Literal
 
-from general_function import pl_to_dict, build_non_existing_dirs, dict_to_duckdb
+from general_function import build_non_existing_dirs
 
 from smallflex_data_schema import SmallflexInputSchema
-from pipelines.data_configs import DataConfig
-from pipelines.model_manager.stochastic_first_stage import StochasticFirstStage
-from pipelines.model_manager.stochastic_second_stage import StochasticSecondStage
-
-from timeseries_preparation.read_custom_file_timeseries import (
-    read_and_validate_custom_file,
-)
-
-from data_display.baseline_plots import (
-    plot_scenario_results,
-    plot_second_stage_result,
-    plot_first_stage_result,
-)
-
-from pipelines.pipeline_manager.first_stage_stochastic_pipeline import (
-    first_stage_stochastic_pipeline,
-)
-from pipelines.pipeline_manager.second_stage_stochastic_pipeline import (
-    second_stage_stochastic_pipeline,
+from pipelines.data_configs import DataConfig, SECOND_STAGE_FIELDS
+from pipelines.study_runner import StudyRunner
+from pipelines.pipeline_manager.study_tasks import (
+    load_input_schema,
+    replace_basin_max_volume,
+    first_stage_data_config,
+    first_stage_slots,
+    first_stage_timeseries_task,
+    first_stage_task,
+    basin_volume_expectation_task,
+    second_stage_stochastic_task,
 )
 
 from utility.data_preprocessing import print_pl
+from utility.result_store import build_result_views
+from data_display.deferred_plots import plot_study_results
 
 from config import settings
 
@@ -43,7 +27,10 @@ from config import settings
 def downstream_basin_volume_analysis(
     design_name: str = "downstream_basin_volume",
     basin_volume_size_list: list[float] = [5e4, 1e5, 2e5, 5e5, 1e6, 2e6, 5e6],
-    hydropower_mask = c("name").is_in(["Aegina continuous turbine", "Aegina pump"])
+    hydropower_mask = c("name").is_in(["Aegina continuous turbine", "Aegina pump"]),
+    nb_workers: int = 1,
+    resume: bool = False,
+    deferred_plot: bool = False,
     ):
     # Load smallflex input schema and set data config
     smallflex_input_schema: (
@@ -54,6 +41,7 @@ def downstream_basin_volume_analysis(
     data_config: DataConfig = DataConfig(
         nb_scenarios=200,
         total_scenarios_synthesized=smallflex_input_schema.discharge_volume_synthesized["scenario"].max(),  # type: ignore
+        nb_workers=nb_workers,
     )
 
     # Create output directories
@@ -61,59 +49,81 @@ def downstream_basin_volume_analysis(
     plot_folder = f"{settings.output_files.results_plot}/{design_name}"
     build_non_existing_dirs(output_folder)
     build_non_existing_dirs(plot_folder)
-    
-    results_data: dict[str, pl.DataFrame] = {}
-    income_list: list = []
-    
-    for basin_volume_size in tqdm(basin_volume_size_list, position=0, desc="Basin volume size sensitivity analysis"):
-        
-        water_basin = smallflex_input_schema.water_basin.with_columns(
-            pl.when(c("name") == "Aegina downstream basin")
-            .then(pl.lit(basin_volume_size))
-            .otherwise(c("volume_max"))
-            .alias("volume_max")
-        )
 
-        smallflex_input_schema = smallflex_input_schema.replace_table(**{"water_basin": water_basin})
-        
-        _, basin_volume_expectation, _ = first_stage_stochastic_pipeline(
-            data_config=data_config,
-            smallflex_input_schema=smallflex_input_schema,
-            hydro_power_mask=hydropower_mask,
-            plot_result=False,
-            custom_market_prices=None,
+    runner = StudyRunner(nb_workers=data_config.nb_workers, thread_budget=data_config.thread_budget)
+    input_node = runner.add_node(
+        "smallflex_input_schema", load_input_schema, file_path=settings.input_files.duckdb_input,
+        shared=data_config.nb_workers > 1,
+    )
+    second_stage_nodes: dict[float, str] = {}
+    first_stage_config = first_stage_data_config(
+        data_config=data_config, nb_first_stages=len(basin_volume_size_list)
+    )
+    first_stage_nb_slots = first_stage_slots(data_config=data_config, nb_first_stages=len(basin_volume_size_list))
+    for basin_volume_size in basin_volume_size_list:
+        schema_node = runner.add_node(
+            f"smallflex_input_schema_{basin_volume_size}", replace_basin_max_volume,
+            inputs={"smallflex_input_schema": input_node},
+            basin_name="Aegina downstream basin", volume_max=basin_volume_size,
+        )
+        timeseries_node = runner.add_node(
+            f"first_stage_timeseries_{basin_volume_size}", first_stage_timeseries_task,
+            inputs={"smallflex_input_schema": schema_node}, ignored_fields=SECOND_STAGE_FIELDS,
+            data_config=data_config, hydro_power_mask=hydropower_mask,
+        )
+        first_stage_node = runner.add_node(
+            f"first_stage_{basin_volume_size}", first_stage_task,
+            inputs={"smallflex_input_schema": schema_node, "timeseries": timeseries_node},
+            ignored_fields=SECOND_STAGE_FIELDS,
+            data_config=first_stage_config, nb_slots=first_stage_nb_slots, hydro_power_mask=hydropower_mask,
+        )
+        basin_volume_expectation_node = runner.add_node(
+            f"basin_volume_expectation_{basin_volume_size}", basin_volume_expectation_task,
+            inputs={"first_stage_result": first_stage_node}, data_config=data_config,
         )
-        
-        second_stage_optimization_results, adjusted_income, fig = (
-            second_stage_stochastic_pipeline(
-                data_config=data_config,
-                smallflex_input_schema=smallflex_input_schema,
-                basin_volume_expectation=basin_volume_expectation,
-                hydro_power_mask=hydropower_mask,
-                plot_result=True,
-                custom_market_prices=None,
-            )
+        second_stage_nodes[basin_volume_size] = runner.add_node(
+            f"second_stage_{basin_volume_size}", second_stage_stochastic_task,
+            inputs={
+                "smallflex_input_schema": schema_node,
+                "basin_volume_expectation": basin_volume_expectation_node,
+            },
+            data_config=data_config, hydro_power_mask=hydropower_mask,
+            store_folder=settings.output_files.result_store, study=design_name,
+            scenario=f"basin_volume_size_{basin_volume_size}",
+            plot_file=f"{plot_folder}/basin_volume_size_{basin_volume_size}_results.html",
+            deferred_plot=deferred_plot,
+            checkpoint_file=f"{output_folder}/checkpoints/{basin_volume_size}.pkl",
+            resume_from=f"{output_folder}/checkpoints/{basin_volume_size}.pkl" if resume else None,
         )
 
-        income_list.append((basin_volume_size, adjusted_income / 1e3))
-        
-        if fig is not None:
-            fig.write_html(f"{plot_folder}/{basin_volume_size}_results.html")
-            
-        results_data[f"basin_volume_size_{basin_volume_size}"] = second_stage_optimization_results
-    results_data["adjusted_income"] = pl.DataFrame(
+    second_stage_results = runner.run(targets=list(second_stage_nodes.values()))
+
+    if deferred_plot:
+        plot_study_results(
+            store_folder=settings.output_files.result_store, study=design_name, year=data_config.year,
+            plot_folder=plot_folder, nb_workers=data_config.nb_workers,
+        )
+
+    income_list: list = [
+        (basin_volume_size, second_stage_results[second_stage_node] / 1e3)
+        for basin_volume_size, second_stage_node in second_stage_nodes.items()
+    ]
+    adjusted_income = pl.DataFrame(
     income_list, schema=["basin_volume_size", "adjusted_income"], orient="row"
     )
-    min_income = results_data["adjusted_income"]["adjusted_income"].min()
-    results_data["adjusted_income"] = results_data["adjusted_income"].with_columns(
+    min_income = adjusted_income["adjusted_income"].min()
+    adjusted_income = adjusted_income.with_columns(
         (100*c("adjusted_income")/min_income).alias("relative_income")
     )
-    print_pl(results_data["adjusted_income"], float_precision=2)
+    print_pl(adjusted_income, float_precision=2)
     
-    results_data["adjusted_income"].write_csv(f"{output_folder}/income_results.csv")
+    adjusted_income.write_csv(f"{output_folder}/income_results.csv")
 
-    dict_to_duckdb(results_data, f"{output_folder}/results.duckdb")
+    build_result_views(
+        store_folder=settings.output_files.result_store, study=design_name,
+        file_path=f"{output_folder}/results.duckdb", summary_tables={"adjusted_income": adjusted_income}
+    )
 
     
 if __name__ == "__main__":
-    downstream_basin_volume_analysis()
\ No newline at end of file
+    downstream_basin_volume_analysis()
@@ -12,6 +12,7 @@ class OutputFiles:
     baseline: str
     output: str
     results_plot: str
+    result_store: str
 
 @ts.settings
 class Settings:
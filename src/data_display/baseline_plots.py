@@ -1,7 +1,6 @@
 from datetime import timedelta, datetime
 
 from typing import Optional
-from matplotlib.pylab import f
 import plotly.graph_objs as go
 import plotly.express as px
 import polars as pl
@@ -9,7 +8,8 @@ from polars import col as c
 import numpy as np
 from polars import selectors as cs
 from plotly.subplots import make_subplots
-from numpy_function import clipped_cumsum
+from utility.array_kernels import clipped_cumsum
+from utility.scenario_cube import ScenarioCube
 from general_function import pl_to_dict
 from pipelines.data_configs import DataConfig
 import numpy as np
@@ -18,6 +18,136 @@ import numpy as np
 COLORS = px.colors.qualitative.Plotly
 
 
+########################################################################################################################
+# Fast rendering #######################################################################################################
+########################################################################################################################
+# When ``max_points`` is given to the plot functions, the lines are drawn with WebGL (Scattergl) and downsampled
+# to at most ``max_points`` points: lines with LTTB (largest triangle three buckets), power bars with min-max
+# buckets drawn as filled step lines, so that the peaks are kept. Stacked bars and the quantile bands of the
+# stochastic scenarios are filled between traces, which are downsampled with shared indices.
+# Without ``max_points``, every point is drawn with the SVG traces.
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices of the points kept by the largest triangle three buckets downsampling."""
+    nb_points = len(y)
+    if max_points >= nb_points or max_points < 3:
+        return np.arange(nb_points)
+    y = np.nan_to_num(y)
+    edges = np.linspace(1, nb_points - 1, max_points - 1).astype(np.int64)
+    indices = np.empty(max_points, dtype=np.int64)
+    indices[0], indices[-1] = 0, nb_points - 1
+    previous = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else nb_points
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        indices[i + 1] = previous
+    return indices
+
+
+def min_max_indices(y: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices of the minimum and maximum of each bucket, in order."""
+    nb_points = len(y)
+    if max_points >= nb_points:
+        return np.arange(nb_points)
+    y = np.nan_to_num(y)
+    edges = np.linspace(0, nb_points, max(max_points // 2, 1) + 1).astype(np.int64)
+    indices = [
+        start + np.array([np.argmin(y[start:end]), np.argmax(y[start:end])])
+        for start, end in zip(edges[:-1], edges[1:]) if end > start
+    ]
+    return np.unique(np.concatenate(indices))
+
+
+def to_numeric(x: np.ndarray) -> np.ndarray:
+    return x.astype("datetime64[ns]").astype(np.float64) if np.issubdtype(x.dtype, np.datetime64) \
+        else x.astype(np.float64)
+
+
+def line_trace(x: pl.Series, y: pl.Series, max_points: Optional[int] = None, **kwargs) -> go.Scatter:
+    if max_points is None:
+        return go.Scatter(x=x.to_list(), y=y.to_list(), **kwargs)
+    x_array, y_array = x.to_numpy(), y.cast(pl.Float64).to_numpy()
+    indices = lttb_indices(x=to_numeric(x_array), y=y_array, max_points=max_points)
+    return go.Scattergl(x=x_array[indices], y=y_array[indices], **kwargs)
+
+
+def bar_trace(x: pl.Series, y: pl.Series, max_points: Optional[int] = None, **kwargs) -> go.Bar:
+    """Bar trace drawn from zero, for overlaid bars (see ``stacked_bar_traces`` for stacked bars)."""
+    if max_points is None:
+        return go.Bar(x=x.to_list(), y=y.to_list(), **kwargs)
+    # WebGL has no bar trace: bars are drawn as filled step lines
+    marker = kwargs.pop("marker", {})
+    kwargs.pop("width", None)
+    kwargs.pop("offsetgroup", None)
+    x_array, y_array = x.to_numpy(), y.cast(pl.Float64).to_numpy()
+    indices = min_max_indices(y=y_array, max_points=max_points)
+    return go.Scattergl(
+        x=x_array[indices], y=y_array[indices], mode="lines", fill="tozeroy",
+        line=dict(color=marker.get("color"), width=0, shape="hv"), **kwargs
+    )
+
+
+def shared_indices(y_list: list[np.ndarray], max_points: int) -> np.ndarray:
+    """Min-max indices of several series, shared so that their traces can be filled between each other."""
+    return np.unique(np.concatenate([
+        min_max_indices(y=y, max_points=max(max_points // len(y_list), 2)) for y in y_list
+    ]))
+
+
+def stacked_bar_traces(
+    x: pl.Series, y_list: list[pl.Series], trace_kwargs: list[dict], max_points: Optional[int] = None
+) -> list[go.Bar]:
+    """
+    Bar traces stacked on top of each other (``barmode="stack"``: each value is added to the sum of the previous
+    ones). With ``max_points``, the cumulated sums are drawn as step lines filled to the previous trace.
+    """
+    if max_points is None:
+        return [go.Bar(x=x.to_list(), y=y.to_list(), **kwargs) for y, kwargs in zip(y_list, trace_kwargs)]
+    x_array = x.to_numpy()
+    y_array = np.nan_to_num(np.vstack([y.cast(pl.Float64).to_numpy() for y in y_list]))
+    stacked = np.cumsum(y_array, axis=0)
+    indices = shared_indices(y_list=list(stacked), max_points=max_points)
+    traces: list[go.Bar] = []
+    for i, kwargs in enumerate(trace_kwargs):
+        kwargs = dict(kwargs)
+        marker = kwargs.pop("marker", {})
+        kwargs.pop("width", None)
+        kwargs.pop("offsetgroup", None)
+        traces.append(go.Scattergl(
+            x=x_array[indices], y=stacked[i, indices], mode="lines", fill="tozeroy" if i == 0 else "tonexty",
+            fillcolor=marker.get("color"), line=dict(color=marker.get("color"), width=0, shape="hv"),
+            customdata=y_array[i, indices], hovertemplate="%{customdata:.3f}", **kwargs
+        ))
+    return traces
+
+
+def band_traces(
+    x: pl.Series, lower: np.ndarray, upper: np.ndarray, max_points: Optional[int] = None, **kwargs
+) -> list[go.Scatter]:
+    """Band filled between a lower and an upper line, downsampled with shared indices."""
+    x_array = x.to_numpy()
+    if max_points is None:
+        indices = np.arange(len(x_array))
+    else:
+        indices = shared_indices(y_list=[lower, upper], max_points=max_points)
+    trace_type = go.Scatter if max_points is None else go.Scattergl
+    showlegend = kwargs.pop("showlegend", True)
+    return [
+        trace_type(
+            x=x_array[indices], y=bound[indices], mode="lines", fill="tonexty" if i == 1 else None,
+            showlegend=showlegend and i == 1, **kwargs
+        )
+        for i, bound in enumerate([lower, upper])
+    ]
+
+
 def remove_spillage_effects(
     results: pl.DataFrame, water_basin: pl.DataFrame
 ) -> pl.DataFrame:
@@ -60,12 +190,14 @@ def plot_second_stage_market_price(
     showlegend: bool,
     with_quantiles: bool = True,
     col: int = 1,
+    max_points: Optional[int] = None,
 ) -> go.Figure:
     if with_quantiles and (not results.select(cs.contains("quantile")).is_empty()):
         fig.add_trace(
-            go.Scatter(
-                x=results["timestamp"].to_list(),
-                y=results["market_price_lower_quantile"].to_list(),
+            line_trace(
+                x=results["timestamp"],
+                y=results["market_price_lower_quantile"],
+                max_points=max_points,
                 legendgroup="market_price",
                 name="Market price quantiles",
                 mode="lines",
@@ -78,9 +210,10 @@ def plot_second_stage_market_price(
         )
 
         fig.add_trace(
-            go.Scatter(
-                x=results["timestamp"].to_list(),
-                y=results["market_price_upper_quantile"].to_list(),
+            line_trace(
+                x=results["timestamp"],
+                y=results["market_price_upper_quantile"],
+                max_points=max_points,
                 legendgroup="market_price",
                 name="quantile",
                 mode="lines",
@@ -93,9 +226,10 @@ def plot_second_stage_market_price(
         )
 
     fig.add_trace(
-        go.Scatter(
-            x=(results["timestamp"]).to_list(),
-            y=results["market_price"].to_list(),
+        line_trace(
+            x=(results["timestamp"]),
+            y=results["market_price"],
+            max_points=max_points,
             legendgroup="market_price",
             name="Day ahead",
             mode="lines",
@@ -107,9 +241,10 @@ def plot_second_stage_market_price(
     )
     if with_ancillary:
         fig.add_trace(
-            go.Scatter(
-                x=(results["timestamp"]).to_list(),
-                y=results["ancillary_market_price"].to_list(),
+            line_trace(
+                x=(results["timestamp"]),
+                y=results["ancillary_market_price"],
+                max_points=max_points,
                 legendgroup="market_price",
                 name="FCR clear price",
                 mode="lines",
@@ -135,6 +270,7 @@ def plot_basin_volume(
     row: int,
     showlegend: bool,
     col: int = 1,
+    max_points: Optional[int] = None,
 ) -> go.Figure:
     name = ["Upstream reservoir", "Downstream reservoir"]
 
@@ -144,9 +280,10 @@ def plot_basin_volume(
         results.select(cs.starts_with("basin_volume")).columns
     ):
         fig.add_trace(
-            go.Scatter(
-                x=results["timestamp"].to_list(),
-                y=(results[col_name] * 100).to_list(),
+            line_trace(
+                x=results["timestamp"],
+                y=(results[col_name] * 100),
+                max_points=max_points,
                 mode="lines",
                 line=dict(color=COLORS[i]),
                 showlegend=showlegend,
@@ -179,7 +316,7 @@ def plot_second_stage_basin_volume(
     row: int,
     showlegend: bool,
     col: int = 1,
-    
+    max_points: Optional[int] = None,
 ) -> go.Figure:
 
     basin_idx = water_basin["B"].to_list()
@@ -225,9 +362,10 @@ def plot_second_stage_basin_volume(
     ).columns
     for col_name in inner_quantiles:
         fig.add_trace(
-            go.Scatter(
-                x=basin_volume_expectation["timestamp"].to_list(),
-                y=(basin_volume_expectation[col_name] * 100).to_list(),
+            line_trace(
+                x=basin_volume_expectation["timestamp"],
+                y=(basin_volume_expectation[col_name] * 100),
+                max_points=max_points,
                 mode="lines",
                 name=col,
                 line=dict(width=0.5, color="red", dash="dash"),
@@ -243,9 +381,10 @@ def plot_second_stage_basin_volume(
         basin_volume_expectation.select(cs.contains(f"quantile_0")).columns
     ):
         fig.add_trace(
-            go.Scatter(
-                x=basin_volume_expectation["timestamp"].to_list(),
-                y=(basin_volume_expectation[col_name] * 100).to_list(),
+            line_trace(
+                x=basin_volume_expectation["timestamp"],
+                y=(basin_volume_expectation[col_name] * 100),
+                max_points=max_points,
                 mode="lines",
                 line=dict(width=0.5, color="red", dash="dash"),
                 showlegend=(i == 1) & showlegend,
@@ -259,9 +398,10 @@ def plot_second_stage_basin_volume(
         )
 
     fig.add_trace(
-        go.Scatter(
-            x=basin_volume_expectation["timestamp"].to_list(),
-            y=(basin_volume_expectation["mean"] * 100).to_list(),
+        line_trace(
+            x=basin_volume_expectation["timestamp"],
+            y=(basin_volume_expectation["mean"] * 100),
+            max_points=max_points,
             mode="lines",
             name="Scheduled reservoir level",
             legendgroup="basin_volume",
@@ -273,9 +413,10 @@ def plot_second_stage_basin_volume(
         col=col,
     )
     fig.add_trace(
-        go.Scatter(
-            x=cleaned_basin_volume["timestamp"].to_list(),
-            y=(cleaned_basin_volume["basin_volume_0"] * 100).to_list(),
+        line_trace(
+            x=cleaned_basin_volume["timestamp"],
+            y=(cleaned_basin_volume["basin_volume_0"] * 100),
+            max_points=max_points,
             mode="lines",
             line=dict(color=COLORS[0]),
             showlegend=showlegend,
@@ -308,6 +449,7 @@ def plot_hydro_power(
     timestep: timedelta,
     showlegend: bool,
     col: int = 1,
+    max_points: Optional[int] = None,
 ) -> go.Figure:
     hydro_name = results.select(
         cs.starts_with("hydro_power").and_(~cs.contains("forecast"))
@@ -317,9 +459,10 @@ def plot_hydro_power(
     for i, col_name in enumerate(hydro_name):
 
         fig.add_trace(
-            go.Bar(
-                x=results["timestamp"].to_list(),
-                y=results[col_name].to_list(),
+            bar_trace(
+                x=results["timestamp"],
+                y=results[col_name],
+                max_points=max_points,
                 marker=dict(color=COLORS[i], line=dict(color=COLORS[i])),
                 width=timestep.total_seconds() * 1000,
                 showlegend=showlegend,
@@ -346,13 +489,15 @@ def plot_ancillary_reserve(
     showlegend: bool,
     with_battery: bool = True,
     col: int = 1,
+    max_points: Optional[int] = None,
 ) -> go.Figure:
 
     if results["hydro_ancillary_reserve"].sum() > 0:
         fig.add_trace(
-            go.Bar(
-                x=results["timestamp"].to_list(),
-                y=results["hydro_ancillary_reserve"].to_list(),
+            bar_trace(
+                x=results["timestamp"],
+                y=results["hydro_ancillary_reserve"],
+                max_points=max_points,
                 marker=dict(color=COLORS[0], line=dict(color=COLORS[0])),
                 showlegend=showlegend,
                 width=timestep.total_seconds() * 1000,
@@ -365,9 +510,10 @@ def plot_ancillary_reserve(
 
     if with_battery:
         fig.add_trace(
-            go.Bar(
-                x=results["timestamp"].to_list(),
-                y=results["battery_ancillary_reserve"].to_list(),
+            bar_trace(
+                x=results["timestamp"],
+                y=results["battery_ancillary_reserve"],
+                max_points=max_points,
                 marker=dict(color=COLORS[1], line=dict(color=COLORS[1])),
                 width=timestep.total_seconds() * 1000,
                 showlegend=showlegend,
@@ -386,12 +532,14 @@ def plot_ancillary_reserve(
 
 
 def plot_battery_soc(
-    results: pl.DataFrame, fig: go.Figure, row: int, showlegend: bool, col: int = 1, 
+    results: pl.DataFrame, fig: go.Figure, row: int, showlegend: bool, col: int = 1,
+    max_points: Optional[int] = None,
 ) -> go.Figure:
     fig.add_trace(
-        go.Scatter(
-            x=results["timestamp"].to_list(),
-            y=(100*results["battery_soc"]).to_list(),
+        line_trace(
+            x=results["timestamp"],
+            y=(100*results["battery_soc"]),
+            max_points=max_points,
             mode="lines",
             line=dict(color=COLORS[0]),
             showlegend=showlegend,
@@ -410,13 +558,15 @@ def plot_battery_soc(
 
 
 def plot_battery_power(
-    results: pl.DataFrame, fig: go.Figure, row: int, timestep: timedelta, showlegend: bool, col: int = 1
+    results: pl.DataFrame, fig: go.Figure, row: int, timestep: timedelta, showlegend: bool, col: int = 1,
+    max_points: Optional[int] = None,
 ) -> go.Figure:
 
     fig.add_trace(
-        go.Bar(
-            x=results["timestamp"].to_list(),
-            y=results["battery_discharging_power"].to_list(),
+        bar_trace(
+            x=results["timestamp"],
+            y=results["battery_discharging_power"],
+            max_points=max_points,
             marker=dict(color=COLORS[0], line=dict(width=0)),
             showlegend=showlegend,
             width=timestep.total_seconds() * 1000,
@@ -428,9 +578,10 @@ def plot_battery_power(
     )
 
     fig.add_trace(
-        go.Bar(
-            x=results["timestamp"].to_list(),
-            y=results["battery_charging_power"].to_list(),
+        bar_trace(
+            x=results["timestamp"],
+            y=results["battery_charging_power"],
+            max_points=max_points,
             marker=dict(color=COLORS[1], line=dict(width=0)),
             showlegend=showlegend,
             width=timedelta(hours=1).total_seconds() * 1000,
@@ -454,8 +605,13 @@ def plot_scenario_results(
     water_basin: pl.DataFrame,
     fig: Optional[go.Figure] = None,
     col: int = 1,
-    tick_size: int = 20
+    tick_size: int = 20,
+    max_points: Optional[int] = None,
 ) -> go.Figure:
+    """
+    Plot the stochastic scenarios of the first stage. With ``max_points``, the scenarios are drawn as their 5-95th
+    and 25-75th quantile bands instead of one trace per scenario, and the traces are drawn with WebGL.
+    """
     row_titles=[
         "<b>Price [Euro]<b>",
         "<b>Discharge volume [m³/day]<b>",
@@ -480,8 +636,8 @@ def plot_scenario_results(
     _, cols = fig._get_subplot_rows_columns()
     showlegend = col == len(cols)
     
-    volume_range = pl_to_dict(water_basin["B", "volume_range"])
-    start_volume_mapping = pl_to_dict(water_basin["B", "start_volume"])
+    water_basin = water_basin.sort("B")
+    basin_idx: list[int] = water_basin["B"].to_list()
     
     name_mapping = {
         "market_price": "<b>Market Price [Euro]</b>",
@@ -489,73 +645,72 @@ def plot_scenario_results(
         "basin_volume_0": "<b>Reservoir level [%]</b>"
     }
 
-    optimization_results = optimization_results.with_columns(
-        (c("discharge_volume_0") / 1e6).alias("discharge_volume_0")
+    scenario_cube = ScenarioCube.from_frame(
+        optimization_results,
+        names={"market_price": None, "discharge_volume": "B", "basin_volume": "B", "spilled_volume": "B"}
     )
-    
-    optimization_results = optimization_results.sort(["Ω", "T"]).with_columns(
-        (
-            (
-                (c(f"spilled_volume_{col_name}") / volume_range[col_name]).shift(1)
-                + c(f"basin_volume_{col_name}").diff().over("Ω")
-            ).fill_null(start_volume_mapping[col_name])
-        ).alias(f"basin_volume_{col_name}")
-        for col_name in start_volume_mapping.keys()
+    # Spilled volume is added back to the basin volume variations
+    basin_position = np.searchsorted(scenario_cube.axes["basin_volume"].to_numpy(), basin_idx)
+    basin_volume = scenario_cube.values["basin_volume"][:, :, basin_position]
+    volume_variation = np.empty_like(basin_volume)
+    volume_variation[0] = water_basin["start_volume"].to_numpy()
+    volume_variation[1:] = (
+        scenario_cube.values["spilled_volume"][:-1, :, basin_position] / water_basin["volume_range"].to_numpy()
+        + np.diff(basin_volume, axis=0)
     )
-    
-    new_optimization_results = optimization_results.drop(
-        [f"basin_volume_{col_name}" for col_name in start_volume_mapping.keys()]
-    )
-    for col_name in start_volume_mapping.keys():
-        basin_volume_df = optimization_results.pivot(
-            on="Ω", values=f"basin_volume_{col_name}", index="T"
-        )
+    scenario_cube.values["basin_volume"] = clipped_cumsum(volume_variation, xmin=0, xmax=1)
+    scenario_cube.axes["basin_volume"] = water_basin["B"].cast(pl.UInt32)
 
-        new_basin_volume_df = (
-            pl.DataFrame(
-                clipped_cumsum(basin_volume_df.drop("T").to_numpy(), xmin=0, xmax=1),
-                schema=basin_volume_df.drop("T").columns,
-            )
-            .with_columns(basin_volume_df["T"])
-            .unpivot(variable_name="Ω", value_name=f"basin_volume_{col_name}", index="T")
-            .with_columns(c("Ω").cast(pl.UInt32))
-        )
-        new_optimization_results = new_optimization_results.join(
-            new_basin_volume_df, on=["T", "Ω"], how="left"
-        )
-    optimization_results = new_optimization_results
-    
-    
+    scenario_values: dict[str, np.ndarray] = {
+        "market_price": scenario_cube.select("market_price"),
+        "discharge_volume_0": scenario_cube.select("discharge_volume", 0) / 1e6,
+        "basin_volume_0": scenario_cube.select("basin_volume", 0),
+    }
+    T = scenario_cube.T
 
     for idx, col_name in enumerate(name_mapping.keys()):
-
-        data = optimization_results.pivot(index="T", on="Ω", values=col_name)
-        
-        for i, senario in enumerate(data.drop("T").columns):
-            fig.add_trace(
-                go.Scatter(
-                    x=data["T"].to_list(),
-                    y=data[senario].to_list(),
-                    mode="lines",
-                    opacity=0.3,
-                    name=f"Scenarios",
-                    line=dict(color="grey"),
-                    showlegend=showlegend & (i == 0) & (idx==0),
+        values = scenario_values[col_name]
+        # Nearest rank quantiles, as pl.Expr.quantile
+        sorted_values = np.sort(values, axis=1)
+        rank = lambda quantile: int(np.floor(quantile * (values.shape[1] - 1) + 0.5))
+
+        if max_points is None:
+            for i in range(values.shape[1]):
+                fig.add_trace(
+                    go.Scatter(
+                        x=T.to_list(),
+                        y=values[:, i].tolist(),
+                        mode="lines",
+                        opacity=0.3,
+                        name=f"Scenarios",
+                        line=dict(color="grey"),
+                        showlegend=showlegend & (i == 0) & (idx==0),
+                        legendgroup="stochastic_scenario",
+                    ),
+                    row=idx + 1,
+                    col=col,
+                )
+        else:
+            for (lower, upper), opacity in [((0.05, 0.95), 0.2), ((0.25, 0.75), 0.35)]:
+                for trace in band_traces(
+                    x=T,
+                    lower=sorted_values[:, rank(lower)],
+                    upper=sorted_values[:, rank(upper)],
+                    max_points=max_points,
+                    name=f"Scenarios {lower * 100:.0f}-{upper * 100:.0f}th quantiles",
+                    line=dict(color="grey", width=0),
+                    fillcolor=f"rgba(128, 128, 128, {opacity})",
+                    showlegend=showlegend & (idx==0),
                     legendgroup="stochastic_scenario",
-                ),
-                row=idx + 1,
-                col=col,
-            )
-        
-        stat_data = (
-            optimization_results.group_by("T")
-            .agg(
-                c(col_name).median().alias("Median"),
-                c(col_name).quantile(0.15).alias("15th-quantile"),
-                c(col_name).quantile(0.85).alias("85th-quantile"),
-            )
-            .sort("T")
-        )
+                ):
+                    fig.add_trace(trace, row=idx + 1, col=col)
+
+        stat_data = pl.DataFrame({
+            "T": T,
+            "Median": np.median(values, axis=1),
+            "15th-quantile": sorted_values[:, rank(0.15)],
+            "85th-quantile": sorted_values[:, rank(0.85)],
+        })
 
         mean_stat_data = stat_data.with_columns(
             c("Median", "15th-quantile", "85th-quantile")
@@ -574,9 +729,10 @@ def plot_scenario_results(
 
         for stat_name in stat_data.drop("T").columns:
             fig.add_trace(  
-                go.Scatter(
-                    x=stat_data["T"].to_list(),
-                    y=stat_data[stat_name].to_list(),
+                line_trace(
+                    x=stat_data["T"],
+                    y=stat_data[stat_name],
+                    max_points=max_points,
                     mode="lines",
                     name=stat_name,
                     line=dict(color="red" if stat_name == "Median" else "orange"),
@@ -593,10 +749,7 @@ def plot_scenario_results(
         )    
     
 
-    hydro_name = optimization_results.select(cs.starts_with("hydro_power")).columns
-
-    
-    ticks_df = optimization_results.filter(
+    ticks_df = pl.DataFrame([T, scenario_cube.timestamp]).filter(
         (c("timestamp").dt.month().is_in([2, 4, 6, 8, 10, 12]))
     ).filter(c("timestamp").dt.month().is_first_distinct())\
     .with_columns(
@@ -632,8 +785,12 @@ def plot_second_stage_result(
     tick_size: int = 20,
     fig: Optional[go.Figure] = None,
     col: int = 1,
+    max_points: Optional[int] = None,
 ) -> go.Figure:
-
+    """
+    Plot the second stage results. With ``max_points``, the traces are drawn with WebGL and downsampled to
+    ``max_points`` points, so that full year results open instantly in the browser.
+    """
     with_battery = results.select(cs.contains("battery")).shape[1] > 0
     with_ancillary = results.select(cs.contains("ancillary_reserve")).shape[1] > 0
     timestep = results["timestamp"].diff()[1]
@@ -676,7 +833,8 @@ def plot_second_stage_result(
         fig=fig,
         row=row_idx,
         showlegend=showlegend,
-        col=col
+        col=col,
+        max_points=max_points,
     )
     row_idx += 1
     fig = plot_second_stage_basin_volume(
@@ -686,10 +844,14 @@ def plot_second_stage_result(
         fig=fig,
         row=row_idx,
         showlegend=showlegend,
-        col=col
+        col=col,
+        max_points=max_points,
     )
     row_idx += 1
-    fig = plot_hydro_power(results=results, fig=fig, row=row_idx, timestep=timestep, showlegend=showlegend, col=col)
+    fig = plot_hydro_power(
+        results=results, fig=fig, row=row_idx, timestep=timestep, showlegend=showlegend, col=col,
+        max_points=max_points
+    )
     row_idx += 1
     if with_ancillary:
         fig = plot_ancillary_reserve(
@@ -699,15 +861,19 @@ def plot_second_stage_result(
             timestep=timestep,
             with_battery=with_battery,
             showlegend=showlegend,
-            col=col
+            col=col,
+            max_points=max_points,
         )
         row_idx += 1
     if with_battery and display_battery:
         fig = plot_battery_power(
-            results=results, fig=fig, row=row_idx, timestep=timestep, showlegend=showlegend,col=col
+            results=results, fig=fig, row=row_idx, timestep=timestep, showlegend=showlegend,col=col,
+            max_points=max_points
         )
         row_idx += 1
-        fig = plot_battery_soc(results=results, fig=fig, row=row_idx, showlegend=showlegend,col=col)
+        fig = plot_battery_soc(
+            results=results, fig=fig, row=row_idx, showlegend=showlegend,col=col, max_points=max_points
+        )
         row_idx += 1
 
     ticks_df = results.filter(
@@ -739,6 +905,7 @@ def plot_first_stage_result(
     tick_size: int = 20,
     fig: Optional[go.Figure] = None,
     col: int = 1,
+    max_points: Optional[int] = None,
 ) -> go.Figure:
 
     timestep = results["timestamp"].diff()[1]
@@ -774,6 +941,7 @@ def plot_first_stage_result(
         row=1,
         col=col,
         showlegend=showlegend,
+        max_points=max_points,
     )
     fig = plot_basin_volume(
         results=results,
@@ -782,6 +950,7 @@ def plot_first_stage_result(
         row=2,
         col=col,
         showlegend=showlegend,
+        max_points=max_points,
     )
     fig = plot_hydro_power(
         results=results,
@@ -790,6 +959,7 @@ def plot_first_stage_result(
         timestep=timestep,
         col=col,
         showlegend=showlegend,
+        max_points=max_points,
     )
     
     ticks_df = results.filter(
@@ -879,7 +1049,9 @@ def plot_reservoir_level_measurement(basin_height_measurement: pl.DataFrame, bas
         tickfont=dict(size=20))
     return fig
 
-def plot_battery_arbitrage(results: pl.DataFrame, tick_size: int = 20) -> go.Figure:
+def plot_battery_arbitrage(
+    results: pl.DataFrame, tick_size: int = 20, max_points: Optional[int] = None
+) -> go.Figure:
 
     with_ancillary = results.select(cs.contains("ancillary_reserve")).shape[1] > 0
     timestep = results["timestamp"].diff()[1]
@@ -916,15 +1088,18 @@ def plot_battery_arbitrage(results: pl.DataFrame, tick_size: int = 20) -> go.Fig
             row=1,
             col=1,
             showlegend=True,
+            max_points=max_points,
         )
 
-    fig = plot_hydro_power(results=results, fig=fig, row=2, timestep=timestep, showlegend=True, col=1)
+    fig = plot_hydro_power(
+        results=results, fig=fig, row=2, timestep=timestep, showlegend=True, col=1, max_points=max_points
+    )
 
 
     fig = plot_battery_power(
-        results=results, fig=fig, row=3, timestep=timestep, showlegend=True,col=1
+        results=results, fig=fig, row=3, timestep=timestep, showlegend=True,col=1, max_points=max_points
     )
-    fig = plot_battery_soc(results=results, fig=fig, row=4, showlegend=True,col=1)
+    fig = plot_battery_soc(results=results, fig=fig, row=4, showlegend=True,col=1, max_points=max_points)
     
     for ann in fig.layout.annotations: # type: ignore
         if ann.text in row_titles:
@@ -938,7 +1113,8 @@ def plot_battery_arbitrage(results: pl.DataFrame, tick_size: int = 20) -> go.Fig
                 timestep=timestep,
                 with_battery=True,
                 showlegend=True,
-                col=1
+                col=1,
+                max_points=max_points,
             )
 
     for i in range(1, len(row_titles) + 1):
@@ -959,6 +1135,7 @@ def plot_imbalance_management(
     col: int = 1,
     showlegend: bool = True,
     tick_size: int = 20,
+    max_points: Optional[int] = None,
 ) -> go.Figure:
     
     nb_graphs = 7
@@ -980,9 +1157,10 @@ def plot_imbalance_management(
     for i, (col_name, display_name) in enumerate(market_mapping.items(), start=0):
         
         fig.add_trace(
-            go.Scatter(
-                x=(results["timestamp"]).to_list(),
-                y=results[col_name].to_list(),
+            line_trace(
+                x=(results["timestamp"]),
+                y=results[col_name],
+                max_points=max_points,
                 legendgroup="market_price",
                 name=display_name,
                 mode="lines",
@@ -1008,47 +1186,31 @@ def plot_imbalance_management(
 
     for i, (col_name, display_name) in enumerate(power_mapping.items(), start=2):
         
-        fig.add_trace(
-            go.Bar(
-                x=results["timestamp"].to_list(),
-                y=results[f"{col_name}_forecast"].to_list(),
-                name="Forecast",
-                marker=dict(color=COLORS[0], line=dict(width=0)),
-                showlegend=showlegend,
-                legendgroup=col_name,
-                width=timestep.total_seconds() * 1000
-            ),
-            row=i,
-            col=col,
-        )
-        
-
-        fig.add_trace(
-            go.Bar(
-                x=results["timestamp"].to_list(),
-                y=results.select(c(f"{col_name}_diff").clip(lower_bound=0))[f"{col_name}_diff"].to_list(),
-                name="Excess power" if col_name != "hydro_power" else "Power increase",
-                marker=dict(color=COLORS[2], line=dict(width=0)),
-                showlegend=showlegend,
-                legendgroup=col_name,
-                width=timestep.total_seconds() * 1000
-            ),
-            row=i,
-            col=col,
-        )
-        fig.add_trace(
-            go.Bar(
-                x=results["timestamp"].to_list(),
-                y=results.select(c(f"{col_name}_diff").clip(upper_bound=0))[f"{col_name}_diff"].to_list(),
-                name="Power shortage" if col_name != "hydro_power" else "Power decrease",
-                marker=dict(color=COLORS[1], line=dict(width=0)),
-                showlegend=showlegend,
-                legendgroup=col_name,
-                width=timestep.total_seconds() * 1000
-            ),
-            row=i,
-            col=col,
+        # Excess power and shortage are stacked on the forecast
+        bar_kwargs: dict = dict(
+            showlegend=showlegend, legendgroup=col_name, width=timestep.total_seconds() * 1000
         )
+        for trace in stacked_bar_traces(
+            x=results["timestamp"],
+            y_list=[
+                results[f"{col_name}_forecast"],
+                results.select(c(f"{col_name}_diff").clip(lower_bound=0))[f"{col_name}_diff"],
+                results.select(c(f"{col_name}_diff").clip(upper_bound=0))[f"{col_name}_diff"],
+            ],
+            trace_kwargs=[
+                dict(name="Forecast", marker=dict(color=COLORS[0], line=dict(width=0)), **bar_kwargs),
+                dict(
+                    name="Excess power" if col_name != "hydro_power" else "Power increase",
+                    marker=dict(color=COLORS[2], line=dict(width=0)), **bar_kwargs
+                ),
+                dict(
+                    name="Power shortage" if col_name != "hydro_power" else "Power decrease",
+                    marker=dict(color=COLORS[1], line=dict(width=0)), **bar_kwargs
+                ),
+            ],
+            max_points=max_points,
+        ):
+            fig.add_trace(trace, row=i, col=col)
         fig.update_traces(
             selector=dict(legendgroup=col_name),
             legendgrouptitle_text=display_name,
@@ -1061,14 +1223,16 @@ def plot_imbalance_management(
         results=results,
         row=6,
         col=col,
-        showlegend=showlegend
+        showlegend=showlegend,
+        max_points=max_points,
     )
     plot_battery_soc(
         fig=fig,
         results=results,
         row=7,
         col=col,
-        showlegend=showlegend
+        showlegend=showlegend,
+        max_points=max_points,
     )
 
 
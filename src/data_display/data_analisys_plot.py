@@ -1,4 +1,4 @@
-from altair import Opacity
+from typing import TYPE_CHECKING
 import polars as pl
 from polars import col as c
 
@@ -8,15 +8,17 @@ from plotly.subplots import make_subplots
 import plotly.graph_objs as go
 import plotly.express as px
 
-
-from sklearn_extra.cluster import KMedoids
-from plotly_calplot import calplot
-import pandas as pd
+if TYPE_CHECKING:
+    from sklearn_extra.cluster import KMedoids
 
 from general_function import build_non_existing_dirs
 from datetime import timedelta, date
 
-def plot_discharge_flow_analysis(data: pl.DataFrame, kmedoid: KMedoids, plot_folder: str, year: int, n_clusters: int):
+def plot_discharge_flow_analysis(data: pl.DataFrame, kmedoid: "KMedoids", plot_folder: str, year: int, n_clusters: int):
+    # Only needed by the calendar plot
+    import pandas as pd
+    from plotly_calplot import calplot
+
     fig = make_subplots(rows=n_clusters + 4, cols=1, vertical_spacing=0.02)
     colors = px.colors.qualitative.Plotly[:n_clusters]
     
@@ -0,0 +1,99 @@
+"""
+Figures of the design studies generated from the result store, after the optimization.
+
+Plotting a full year of results takes a significant time and each HTML file normally embeds the whole
+plotly.js bundle. The figures are therefore generated in a separate parallel step, and every HTML file of
+a plot folder refers to one shared ``plotly.min.js`` file written in the same folder.
+"""
+import os
+from glob import glob
+from typing import Optional
+
+import polars as pl
+from plotly.offline import get_plotlyjs
+from tqdm.auto import tqdm
+
+from general_function import build_non_existing_dirs, generate_log
+
+from data_display.baseline_plots import plot_second_stage_result
+from utility.resource_manager import worker_pool
+from utility.result_store import RESULT_FILE_NAME, partition_folder
+
+log = generate_log(name=__name__)
+
+PLOTLY_JS_FILE_NAME: str = "plotly.min.js"
+# Points per trace of the deferred figures (see the fast rendering of ``data_display.baseline_plots``)
+MAX_POINTS: int = 2000
+
+
+def write_shared_plotlyjs(plot_folder: str) -> None:
+    """Write the plotly.js bundle referred by the HTML files written with ``include_plotlyjs="directory"``."""
+    build_non_existing_dirs(plot_folder)
+    file_path = f"{plot_folder}/{PLOTLY_JS_FILE_NAME}"
+    if not os.path.exists(file_path):
+        with open(file_path, "w", encoding="utf-8") as file:
+            file.write(get_plotlyjs())
+
+
+def plot_stored_second_stage_result(folder: str, plot_file: str, max_points: Optional[int] = MAX_POINTS) -> str:
+    """
+    Plot the second stage results of one result store partition, written with their plot inputs.
+
+    Returns:
+        str: Path of the HTML file.
+    """
+    fig = plot_second_stage_result(
+        results=pl.read_parquet(f"{folder}/{RESULT_FILE_NAME}"),
+        water_basin=pl.read_parquet(f"{folder}/water_basin.parquet"),
+        basin_volume_expectation=pl.read_parquet(f"{folder}/basin_volume_expectation.parquet"),
+        max_points=max_points,
+    )
+    fig.write_html(plot_file, include_plotlyjs="directory")
+    return plot_file
+
+
+def plot_study_results(
+    store_folder: str, study: str, year: int, plot_folder: str, nb_workers: int = 1,
+    scenario_list: Optional[list[str]] = None, max_points: Optional[int] = MAX_POINTS
+) -> list[str]:
+    """
+    Generate the figures of every scenario of a study whose plot inputs were written in the result store.
+
+    Args:
+        store_folder (str): Root folder of the result store.
+        study (str): Name of the study.
+        year (int): Simulated year.
+        plot_folder (str): Folder of the HTML files, named ``{scenario}_results.html``.
+        nb_workers (int): Number of worker processes. Defaults to 1.
+        scenario_list (Optional[list[str]]): Scenarios to plot. Defaults to every scenario with plot inputs.
+        max_points (Optional[int]): Points per trace, drawn with WebGL. None draws every point with SVG traces.
+
+    Returns:
+        list[str]: Paths of the HTML files.
+    """
+    if scenario_list is None:
+        scenario_list = sorted(
+            os.path.basename(os.path.dirname(os.path.dirname(file_path))).removeprefix("scenario=")
+            for file_path in glob(f"{store_folder}/study={study}/scenario=*/year={year}/water_basin.parquet")
+        )
+    plot_tasks: dict[str, str] = {
+        partition_folder(store_folder=store_folder, study=study, scenario=scenario, year=year):
+            f"{plot_folder}/{scenario}_results.html"
+        for scenario in scenario_list
+    }
+    write_shared_plotlyjs(plot_folder)
+    log.info(f"Plot {len(plot_tasks)} scenarios of study {study} in {plot_folder}")
+
+    if nb_workers <= 1:
+        return [
+            plot_stored_second_stage_result(folder=folder, plot_file=plot_file, max_points=max_points)
+            for folder, plot_file in tqdm(plot_tasks.items(), desc="Plot results")
+        ]
+    with worker_pool(nb_workers=nb_workers) as executor:
+        futures = [
+            executor.submit(
+                plot_stored_second_stage_result, folder=folder, plot_file=plot_file, max_points=max_points
+            )
+            for folder, plot_file in plot_tasks.items()
+        ]
+        return [future.result() for future in tqdm(futures, desc="Plot results")]
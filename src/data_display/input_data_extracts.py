@@ -0,0 +1,135 @@
+"""
+Parquet extracts of the input data displayed by the Streamlit input explorer.
+
+Loading the whole DuckDB input schema at every page load is slow, so the timeseries displayed by the explorer
+are preprocessed once (display columns, index in the displayed year) and written to one Parquet file per view,
+sorted by the column used to select the displayed figure. Each page then only reads the rows of its figure.
+The extracts are rebuilt when the DuckDB input file is newer than them.
+"""
+import os
+from datetime import date
+
+import polars as pl
+from polars import col as c
+
+from general_function import pl_to_dict, build_non_existing_dirs, generate_log
+from smallflex_data_schema import SmallflexInputSchema
+
+log = generate_log(name=__name__)
+
+EXTRACT_TABLES: list[str] = [
+    "market_price", "discharge_flow", "power_production", "basin_height", "hydro_power_plant",
+    "hydro_power_performance_table",
+]
+
+
+def generate_date_mapping(time_step: str)-> dict:
+    date_mapping = pl_to_dict(
+        pl.DataFrame(pl.datetime_range(
+            start=date(2022, 1, 1), end=date(2023, 1, 1), interval=time_step,
+            eager=True, closed="left").alias("timestamp")
+        ).with_row_index("index")\
+        .filter(~((c("timestamp").dt.month() == 2) & (c("timestamp").dt.day() == 29)))\
+        .with_columns(
+            c("timestamp").dt.to_string(format="%m-%d %H:%M").alias("date_str"),
+        )["date_str", "index"])
+    return date_mapping
+
+
+def times_series_preprocessing(data: pl.DataFrame) -> pl.DataFrame:
+    return (
+        data
+        .filter(~((c("timestamp").dt.month() == 2) & (c("timestamp").dt.day() == 29)))\
+        .with_columns(
+            c("timestamp").dt.year().alias("year"),
+            c("timestamp").dt.to_string(format="%y-%m-%d %Hh").alias("displayed_date"),
+            c("timestamp").dt.to_string(format="%m-%d %H:%M").alias("date_str"),
+        )
+    )
+
+
+def market_time_step(market: str) -> str:
+    return "1h" if market in ["DA", "IDA"] else "4h"
+
+
+def add_date_index(data: pl.DataFrame, time_step: str) -> pl.DataFrame:
+    return data.with_columns(
+        c("date_str").replace_strict(generate_date_mapping(time_step=time_step), default=None).alias("index"),
+    )
+
+
+def build_input_data_extracts(duckdb_file: str, extract_folder: str) -> None:
+    """
+    Write the Parquet extracts of the input explorer.
+
+    Args:
+        duckdb_file (str): DuckDB input file.
+        extract_folder (str): Folder of the extracts.
+    """
+    log.info(f"Build input data extracts of {duckdb_file} in {extract_folder}")
+    small_flex_input_schema: SmallflexInputSchema = SmallflexInputSchema().duckdb_to_schema(file_path=duckdb_file)
+    build_non_existing_dirs(extract_folder)
+
+    market_price = times_series_preprocessing(small_flex_input_schema.market_price_measurement)
+    market_price = pl.concat([
+        add_date_index(market_price.filter(c("market") == market), time_step=market_time_step(market))
+        for market in market_price["market"].unique().to_list()
+    ])
+
+    discharge_flow = add_date_index(
+        times_series_preprocessing(small_flex_input_schema.discharge_flow_measurement), time_step="1h"
+    )
+
+    name_mapping = pl_to_dict(small_flex_input_schema.wind_power_plant[["uuid", "name"]])
+    name_mapping.update(pl_to_dict(small_flex_input_schema.hydro_power_plant[["uuid", "name"]]))
+    power_production = add_date_index(
+        times_series_preprocessing(small_flex_input_schema.power_production_measurement.with_columns(
+            c("power_plant_fk").replace_strict(name_mapping, default=None).alias("name")
+        )),
+        time_step="15m"
+    )
+
+    basin_height = small_flex_input_schema.basin_height_measurement.with_columns(
+        c("timestamp").dt.to_string(format="%Y-%m-%d %H:%M").alias("date_str"),
+        c("timestamp").dt.year().alias("year"),
+        c("water_basin_fk").replace_strict(
+            pl_to_dict(small_flex_input_schema.water_basin[["uuid", "name"]]), default=None
+        ).alias("name")
+    )
+
+    extracts: dict[str, pl.DataFrame] = {
+        "market_price": market_price.select(
+            "market", "country", "direction", "unit", "timestamp", "year", "index", "avg", "displayed_date"
+        ).sort("market", "country", "timestamp"),
+        "discharge_flow": discharge_flow.select(
+            "river", "timestamp", "year", "index", "value", "displayed_date"
+        ).sort("river", "timestamp"),
+        "power_production": power_production.select(
+            "name", "timestamp", "year", "index", "avg_active_power", "displayed_date"
+        ).sort("name", "timestamp"),
+        "basin_height": basin_height.select("name", "timestamp", "year", "date_str", "height").sort("name", "timestamp"),
+        "hydro_power_plant": small_flex_input_schema.hydro_power_plant.select("uuid", "name", "control"),
+        "hydro_power_performance_table": small_flex_input_schema.hydro_power_performance_table,
+    }
+    for table_name, data in extracts.items():
+        data.write_parquet(f"{extract_folder}/{table_name}.parquet", compression="zstd", row_group_size=100_000)
+
+
+def extracts_up_to_date(duckdb_file: str, extract_folder: str) -> bool:
+    extract_files = [f"{extract_folder}/{table_name}.parquet" for table_name in EXTRACT_TABLES]
+    if not all(os.path.exists(file_path) for file_path in extract_files):
+        return False
+    return min(os.path.getmtime(file_path) for file_path in extract_files) >= os.path.getmtime(duckdb_file)
+
+
+def read_extract(extract_folder: str, table_name: str, **filters) -> pl.DataFrame:
+    """Read the rows of an extract matching the filters (column name to value)."""
+    data = pl.scan_parquet(f"{extract_folder}/{table_name}.parquet")
+    for column, value in filters.items():
+        data = data.filter(c(column) == value)
+    return data.collect()
+
+
+def extract_values(extract_folder: str, table_name: str, columns: list[str]) -> pl.DataFrame:
+    """Distinct values of the selection columns of an extract."""
+    return pl.scan_parquet(f"{extract_folder}/{table_name}.parquet").select(columns).unique().sort(columns).collect()
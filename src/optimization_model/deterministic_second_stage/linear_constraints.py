@@ -0,0 +1,128 @@
+r"""
+Linear-expression formulation of the second stage hydro constraints (sections 2.5.2 to 2.5.4).
+
+The constraints are the same as in :mod:`optimization_model.deterministic_second_stage.constraints`, but every
+rule builds its body directly as a ``LinearExpression`` from coefficient and variable lists instead of going
+through Pyomo operator overloading. The coefficients which do not depend on the timestamp (flow to basin
+volume factors, inverse of the basin volume range) are computed once per instance by ``build_coefficient_arrays``, so each
+rule call only gathers the variables of its timestamp.
+"""
+import pyomo.environ as pyo
+from pyomo.core.expr.numeric_expr import LinearExpression
+
+
+def build_coefficient_arrays(model):
+    nb_sec_hours = pyo.value(model.nb_hours) * pyo.value(model.nb_sec)
+    model._big_m = pyo.value(model.big_m)
+    model._volume_factor = {b: 1 / model.basin_volume_range[b] for b in model.B}
+    model._flow_volume_factor = {
+        b: [
+            (h, nb_sec_hours * model.water_factor[b, h] * model._volume_factor[b])
+            for h in model.H if model.water_factor[b, h] != 0
+        ] for b in model.B
+    }
+    model._basin_max_volume = {b: model.max_basin_volume[b, model.S_B[b].last()] for b in model.B}
+
+
+def basin_volume_balance(model, t, b, next_volume):
+    flow_volume_factor = model._flow_volume_factor[b]
+    return LinearExpression(
+        constant=0,
+        linear_coefs=[1, -1, model._volume_factor[b]] + [-factor for _, factor in flow_volume_factor],
+        linear_vars=[next_volume, model.basin_volume[t, b], model.spilled_volume[t, b]]
+            + [model.flow[t, h] for h, _ in flow_volume_factor],
+    ) == model.discharge_volume[t, b] * model._volume_factor[b]
+
+########################################################################################################################
+# 2.5.2 Water basin volume evolution ###################################################################################
+########################################################################################################################
+
+
+def linear_basin_volume_evolution(model, t, b):
+    if t == model.T.first():
+        return model.basin_volume[t, b] == model.start_basin_volume[b]
+    return basin_volume_balance(model, t - 1, b, next_volume=model.basin_volume[t, b])
+
+
+def linear_basin_end_volume_constraint(model, b):
+    return basin_volume_balance(model, model.T.last(), b, next_volume=model.end_basin_volume[b])
+
+########################################################################################################################
+# 2.5.3. Water basin state #############################################################################################
+########################################################################################################################
+
+
+def linear_basin_max_state_constraint(model, t, b, s):
+    return LinearExpression(
+        constant=0,
+        linear_coefs=[1, model._basin_max_volume[b]],
+        linear_vars=[model.basin_volume[t, b], model.basin_state[t, b, s]],
+    ) <= model.max_basin_volume[b, s] + model._basin_max_volume[b]
+
+
+def linear_basin_min_state_constraint(model, t, b, s):
+    return LinearExpression(
+        constant=0,
+        linear_coefs=[1, -model.min_basin_volume[b, s]],
+        linear_vars=[model.basin_volume[t, b], model.basin_state[t, b, s]],
+    ) >= 0
+
+
+def linear_basin_state_constraint(model, t, b):
+    return LinearExpression(
+        constant=0,
+        linear_coefs=[1] * len(model.S_B[b]),
+        linear_vars=[model.basin_state[t, b, s] for s in model.S_B[b]],
+    ) == 1
+
+########################################################################################################################
+# 2.5.4. Hydropower plants #############################################################################################
+########################################################################################################################
+
+
+def linear_max_flow_by_state_constraint(model, t, h, b, s):
+    return LinearExpression(
+        constant=0,
+        linear_coefs=[1, -model.max_flow[h, s]],
+        linear_vars=[model.flow_by_state[t, h, s], model.basin_state[t, b, s]],
+    ) <= 0
+
+
+def linear_flow_constraint(model, t, h):
+    return LinearExpression(
+        constant=0,
+        linear_coefs=[1] + [-1] * len(model.S_H[h]),
+        linear_vars=[model.flow[t, h]] + [model.flow_by_state[t, h, s] for s in model.S_H[h]],
+    ) == 0
+
+
+def linear_hydro_power_constraint(model, t, h):
+    return LinearExpression(
+        constant=0,
+        linear_coefs=[1] + [-model.alpha[h, s] for s in model.S_H[h]],
+        linear_vars=[model.hydro_power[t, h]] + [model.flow_by_state[t, h, s] for s in model.S_H[h]],
+    ) == 0
+
+
+def linear_max_active_flow_by_state_constraint(model, t, h, s):
+    return LinearExpression(
+        constant=0,
+        linear_coefs=[1, -model._big_m],
+        linear_vars=[model.flow_by_state[t, h, s], model.discrete_hydro_on[t, h]],
+    ) <= 0
+
+
+def linear_max_inactive_flow_by_state_constraint(model, t, h, b, s):
+    return LinearExpression(
+        constant=0,
+        linear_coefs=[1, -model.max_flow[h, s], -model._big_m],
+        linear_vars=[model.flow_by_state[t, h, s], model.basin_state[t, b, s], model.discrete_hydro_on[t, h]],
+    ) >= - model._big_m
+
+
+def linear_max_inactive_flow_without_basin_state_constraint(model, t, h, b, s):
+    return LinearExpression(
+        constant=0,
+        linear_coefs=[1, -model._big_m],
+        linear_vars=[model.flow_by_state[t, h, s], model.discrete_hydro_on[t, h]],
+    ) >= model.max_flow[h, s] - model._big_m
@@ -1,35 +1,88 @@
 import pyomo.environ as pyo
 from optimization_model.deterministic_second_stage.objective_functions import *
 from optimization_model.deterministic_second_stage.constraints import *
+from optimization_model.deterministic_second_stage.linear_constraints import *
 from optimization_model.deterministic_second_stage.sets import *
 from optimization_model.deterministic_second_stage.parameters import *
 from optimization_model.deterministic_second_stage.variables import *
 
-def second_stage_common_constraints(model: pyo.AbstractModel, with_ancillary: bool) -> pyo.AbstractModel:
+def second_stage_hydro_constraints(model: pyo.AbstractModel, with_basin_state: bool = True) -> pyo.AbstractModel:
     ####################################################################################################################
     ### Basin volume evolution constraints #############################################################################  
     #################################################################################################################### 
     model.basin_volume_evolution = pyo.Constraint(model.T, model.B, rule=basin_volume_evolution)
     model.basin_end_volume_constraint = pyo.Constraint(model.B, rule=basin_end_volume_constraint)
-    model.basin_max_end_volume_constraint = pyo.Constraint(model.B, rule=basin_max_end_volume_constraint)
-    model.basin_min_end_volume_constraint = pyo.Constraint(model.B, rule=basin_min_end_volume_constraint)
     ####################################################################################################################
     ### Basin volume boundary constraints used to determine the state of each basin ####################################
     ####################################################################################################################
-    model.basin_max_state_constraint = pyo.Constraint(model.T, model.BS, rule=basin_max_state_constraint)
-    model.basin_min_state_constraint = pyo.Constraint(model.T, model.BS, rule=basin_min_state_constraint)
-    model.basin_state_constraint = pyo.Constraint(model.T, model.B, rule=basin_state_constraint)
-    model.end_basin_volume_mean_constraint = pyo.Constraint(model.UP_B, rule=end_basin_volume_mean_constraint)
-    model.end_basin_volume_upper_limit_constraint = pyo.Constraint(model.UP_B, model.Q, rule=end_basin_volume_upper_limit_constraint)
-    model.end_basin_volume_lower_limit_constraint = pyo.Constraint(model.UP_B, model.Q, rule=end_basin_volume_lower_limit_constraint)
+    if with_basin_state:
+        model.basin_max_state_constraint = pyo.Constraint(model.T, model.BS, rule=basin_max_state_constraint)
+        model.basin_min_state_constraint = pyo.Constraint(model.T, model.BS, rule=basin_min_state_constraint)
+        model.basin_state_constraint = pyo.Constraint(model.T, model.B, rule=basin_state_constraint)
+    else:
+        model.basin_max_volume_constraint = pyo.Constraint(model.T, model.B, rule=basin_max_volume_constraint)
+        model.basin_min_volume_constraint = pyo.Constraint(model.T, model.B, rule=basin_min_volume_constraint)
     ####################################################################################################################
     ### basin volume per state constraints used to determine the state of each basin ###################################
     ####################################################################################################################
     model.max_active_flow_by_state_constraint = pyo.Constraint(model.T, model.DHS, rule=max_active_flow_by_state_constraint)
-    model.max_inactive_flow_by_state_constraint = pyo.Constraint(model.T, model.DHBS, rule=max_inactive_flow_by_state_constraint)
-    model.max_flow_by_state_constraint = pyo.Constraint(model.T, model.HBS, rule=max_flow_by_state_constraint)
+    if with_basin_state:
+        model.max_inactive_flow_by_state_constraint = pyo.Constraint(model.T, model.DHBS, rule=max_inactive_flow_by_state_constraint)
+        model.max_flow_by_state_constraint = pyo.Constraint(model.T, model.HBS, rule=max_flow_by_state_constraint)
+    else:
+        model.max_inactive_flow_by_state_constraint = pyo.Constraint(model.T, model.DHBS, rule=max_inactive_flow_without_basin_state_constraint)
+        model.max_flow_by_state_constraint = pyo.Constraint(model.T, model.HBS, rule=max_flow_without_basin_state_constraint)
     model.flow_constraint = pyo.Constraint(model.T, model.H, rule=flow_constraint)
     model.hydro_power_constraint = pyo.Constraint(model.T, model.H, rule=hydro_power_constraint)
+    return model
+
+def second_stage_linear_hydro_constraints(model: pyo.AbstractModel, with_basin_state: bool = True) -> pyo.AbstractModel:
+    # Same constraints as second_stage_hydro_constraints with bodies built from coefficient lists
+    model.coefficient_arrays = pyo.BuildAction(rule=build_coefficient_arrays)
+    ####################################################################################################################
+    ### Basin volume evolution constraints #############################################################################  
+    #################################################################################################################### 
+    model.basin_volume_evolution = pyo.Constraint(model.T, model.B, rule=linear_basin_volume_evolution)
+    model.basin_end_volume_constraint = pyo.Constraint(model.B, rule=linear_basin_end_volume_constraint)
+    ####################################################################################################################
+    ### Basin volume boundary constraints used to determine the state of each basin ####################################
+    ####################################################################################################################
+    if with_basin_state:
+        model.basin_max_state_constraint = pyo.Constraint(model.T, model.BS, rule=linear_basin_max_state_constraint)
+        model.basin_min_state_constraint = pyo.Constraint(model.T, model.BS, rule=linear_basin_min_state_constraint)
+        model.basin_state_constraint = pyo.Constraint(model.T, model.B, rule=linear_basin_state_constraint)
+    else:
+        model.basin_max_volume_constraint = pyo.Constraint(model.T, model.B, rule=basin_max_volume_constraint)
+        model.basin_min_volume_constraint = pyo.Constraint(model.T, model.B, rule=basin_min_volume_constraint)
+    ####################################################################################################################
+    ### basin volume per state constraints used to determine the state of each basin ###################################
+    ####################################################################################################################
+    model.max_active_flow_by_state_constraint = pyo.Constraint(model.T, model.DHS, rule=linear_max_active_flow_by_state_constraint)
+    if with_basin_state:
+        model.max_inactive_flow_by_state_constraint = pyo.Constraint(model.T, model.DHBS, rule=linear_max_inactive_flow_by_state_constraint)
+        model.max_flow_by_state_constraint = pyo.Constraint(model.T, model.HBS, rule=linear_max_flow_by_state_constraint)
+    else:
+        model.max_inactive_flow_by_state_constraint = pyo.Constraint(model.T, model.DHBS, rule=linear_max_inactive_flow_without_basin_state_constraint)
+        model.max_flow_by_state_constraint = pyo.Constraint(model.T, model.HBS, rule=max_flow_without_basin_state_constraint)
+    model.flow_constraint = pyo.Constraint(model.T, model.H, rule=linear_flow_constraint)
+    model.hydro_power_constraint = pyo.Constraint(model.T, model.H, rule=linear_hydro_power_constraint)
+    return model
+
+def second_stage_common_constraints(
+    model: pyo.AbstractModel, with_ancillary: bool, with_basin_state: bool = True, linear_formulation: bool = False
+    ) -> pyo.AbstractModel:
+    if linear_formulation:
+        model = second_stage_linear_hydro_constraints(model, with_basin_state=with_basin_state)
+    else:
+        model = second_stage_hydro_constraints(model, with_basin_state=with_basin_state)
+    ####################################################################################################################
+    ### Basin end volume constraints ###################################################################################
+    ####################################################################################################################
+    model.basin_max_end_volume_constraint = pyo.Constraint(model.B, rule=basin_max_end_volume_constraint)
+    model.basin_min_end_volume_constraint = pyo.Constraint(model.B, rule=basin_min_end_volume_constraint)
+    model.end_basin_volume_mean_constraint = pyo.Constraint(model.UP_B, rule=end_basin_volume_mean_constraint)
+    model.end_basin_volume_upper_limit_constraint = pyo.Constraint(model.UP_B, model.Q, rule=end_basin_volume_upper_limit_constraint)
+    model.end_basin_volume_lower_limit_constraint = pyo.Constraint(model.UP_B, model.Q, rule=end_basin_volume_lower_limit_constraint)
     ####################################################################################################################
     ### Ancillary services constraints ##################################################################################
     ####################################################################################################################
@@ -64,11 +117,18 @@ def deterministic_second_stage_battery_constraints(model: pyo.AbstractModel, wit
 
     return model
 
-def deterministic_second_stage_model(with_ancillary: bool, with_battery: bool) -> pyo.AbstractModel:
+def deterministic_second_stage_model(
+    with_ancillary: bool, with_battery: bool, with_basin_state: bool = True, linear_formulation: bool = False,
+    mutable_parameters: bool = False
+    ) -> pyo.AbstractModel:
     model: pyo.AbstractModel = pyo.AbstractModel() # type: ignore
     model = second_stage_sets(model, with_ancillary=with_ancillary)
-    model = second_stage_parameters(model, with_ancillary=with_ancillary)
-    model = second_stage_variables(model, with_ancillary=with_ancillary, with_battery=with_battery)
+    model = second_stage_parameters(
+        model, with_ancillary=with_ancillary, mutable_parameters=mutable_parameters
+    )
+    model = second_stage_variables(
+        model, with_ancillary=with_ancillary, with_battery=with_battery, with_basin_state=with_basin_state
+    )
     if with_battery:
         if with_ancillary:
             model.objective = pyo.Objective(rule=second_stage_objective_with_battery_with_ancillary, sense=pyo.maximize)
@@ -82,7 +142,10 @@ def deterministic_second_stage_model(with_ancillary: bool, with_battery: bool) -
             model.objective = pyo.Objective(rule=second_stage_objective_without_battery_without_ancillary, sense=pyo.maximize)
         model.total_power_constraint = pyo.Constraint(model.T, rule=total_power_constraint_without_battery)
             
-    model = second_stage_common_constraints(model, with_ancillary=with_ancillary)
+    model = second_stage_common_constraints(
+        model, with_ancillary=with_ancillary, with_basin_state=with_basin_state, 
+        linear_formulation=linear_formulation
+    )
     
     
     
@@ -1,50 +1,53 @@
 import pyomo.environ as pyo
 
 
-def second_stage_parameters(model: pyo.AbstractModel, with_ancillary: bool) -> pyo.AbstractModel:
+def second_stage_parameters(
+    model: pyo.AbstractModel, with_ancillary: bool, mutable_parameters: bool = False
+    ) -> pyo.AbstractModel:
+    # Time varying parameters are mutable when a single instance is updated in place between simulations
     
-    model.market_price = pyo.Param(model.T)
+    model.market_price = pyo.Param(model.T, mutable=mutable_parameters)
     model.nb_hours = pyo.Param(default=1)
     model.nb_sec = pyo.Param(default=3600) # s
     model.nb_timestamp_per_ancillary = pyo.Param() # -
     
     model.rated_alpha = pyo.Param(model.UP_B) # MW/(m^3/s)
-    model.overage_market_price = pyo.Param()
-    model.shortage_market_price = pyo.Param()
-    model.bound_penalty_factor = pyo.Param(model.Q, default=1) # -
+    model.overage_market_price = pyo.Param(mutable=mutable_parameters)
+    model.shortage_market_price = pyo.Param(mutable=mutable_parameters)
+    model.bound_penalty_factor = pyo.Param(model.Q, default=1, mutable=mutable_parameters) # -
     model.basin_volume_range = pyo.Param(model.B) # m^3
     
-    model.expected_end_basin_volume = pyo.Param(model.B) # MWh
-    model.end_basin_volume_upper_limit = pyo.Param(model.B, model.Q) # MWh
-    model.end_basin_volume_lower_limit = pyo.Param(model.B, model.Q) # MWh
+    model.expected_end_basin_volume = pyo.Param(model.B, mutable=mutable_parameters) # MWh
+    model.end_basin_volume_upper_limit = pyo.Param(model.B, model.Q, mutable=mutable_parameters) # MWh
+    model.end_basin_volume_lower_limit = pyo.Param(model.B, model.Q, mutable=mutable_parameters) # MWh
 
-    model.start_basin_volume = pyo.Param(model.B, default=0) # m^3
+    model.start_basin_volume = pyo.Param(model.B, default=0, mutable=mutable_parameters) # m^3
     
 
     model.spilled_factor = pyo.Param(model.B, default=1) # m^3
     
-    model.min_basin_volume = pyo.Param(model.BS, default=0) # m^3
-    model.max_basin_volume = pyo.Param(model.BS, default=0) # m^3 
-    model.discharge_volume = pyo.Param(model.T, model.B, default=0) # m^3
+    model.min_basin_volume = pyo.Param(model.BS, default=0, mutable=mutable_parameters) # m^3
+    model.max_basin_volume = pyo.Param(model.BS, default=0, mutable=mutable_parameters) # m^3 
+    model.discharge_volume = pyo.Param(model.T, model.B, default=0, mutable=mutable_parameters) # m^3
     
     model.water_factor = pyo.Param(model.B, model.H, default=0) # m^3
 
-    model.max_flow = pyo.Param(model.HS, default=0) #m^3/s 
-    model.alpha = pyo.Param(model.HS, default=0) #MW/(Mm^3/s)
+    model.max_flow = pyo.Param(model.HS, default=0, mutable=mutable_parameters) #m^3/s 
+    model.alpha = pyo.Param(model.HS, default=0, mutable=mutable_parameters) #MW/(Mm^3/s)
     
     model.big_m = pyo.Param(default=1e6)  # Big M value for constraints
-    model.total_positive_flex_power = pyo.Param(default=0)
-    model.total_negative_flex_power = pyo.Param(default=0)
+    model.total_positive_flex_power = pyo.Param(default=0, mutable=mutable_parameters)
+    model.total_negative_flex_power = pyo.Param(default=0, mutable=mutable_parameters)
     
-    model.pv_power = pyo.Param(model.T, default=0) # MW
-    model.wind_power = pyo.Param(model.T, default=0) # MW
+    model.pv_power = pyo.Param(model.T, default=0, mutable=mutable_parameters) # MW
+    model.wind_power = pyo.Param(model.T, default=0, mutable=mutable_parameters) # MW
     
     model.battery_capacity = pyo.Param() # MWh
     model.battery_rated_power = pyo.Param() # MW
     model.battery_efficiency = pyo.Param() # -
-    model.start_battery_soc = pyo.Param() # %
+    model.start_battery_soc = pyo.Param(mutable=mutable_parameters) # %
     
     if with_ancillary:
-        model.ancillary_market_price = pyo.Param(model.F)
+        model.ancillary_market_price = pyo.Param(model.F, mutable=mutable_parameters)
     
     return model
\ No newline at end of file
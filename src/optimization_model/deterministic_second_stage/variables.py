@@ -1,6 +1,6 @@
 import pyomo.environ as pyo
 
-def second_stage_variables(model, with_ancillary: bool, with_battery: bool):
+def second_stage_variables(model, with_ancillary: bool, with_battery: bool, with_basin_state: bool = True):
     
     model.basin_volume = pyo.Var(model.T, model.B, within=pyo.NonNegativeReals)
     model.spilled_volume = pyo.Var(model.T, model.B, within=pyo.NonNegativeReals)
@@ -13,7 +13,8 @@ def second_stage_variables(model, with_ancillary: bool, with_battery: bool):
     model.end_basin_volume_lower_overage = pyo.Var(model.UP_B, model.Q, within=pyo.NonNegativeReals) # m^3
     model.end_basin_volume_lower_shortage = pyo.Var(model.UP_B, model.Q, within=pyo.NonNegativeReals) # m^3
 
-    model.basin_state = pyo.Var(model.T, model.BS, within=pyo.Binary)
+    if with_basin_state:
+        model.basin_state = pyo.Var(model.T, model.BS, within=pyo.Binary)
 
     model.flow = pyo.Var(model.T, model.H, within=pyo.NonNegativeReals) # m^3
     model.flow_by_state = pyo.Var(model.T, model.HS, within=pyo.NonNegativeReals)
@@ -134,7 +134,7 @@ r"""
 
 def objective(model):
     market_price = sum(
-        sum(
+        model.probability[ω] * sum(
             model.market_price[t, ω]
             * model.nb_hours[t]
             * sum(model.hydro_power[t, ω, h] for h in model.H)
@@ -3,6 +3,8 @@ import pyomo.environ as pyo
 def first_stage_parameters(model):
     
     model.market_price = pyo.Param(model.T, model.Ω)
+    # Probability of each scenario, uniform unless the scenario set was reduced
+    model.probability = pyo.Param(model.Ω, initialize=lambda model, ω: 1 / len(model.Ω))
     # model.ancillary_market_price = pyo.Param(model.T, model.Ω)
     model.discharge_volume = pyo.Param(model.T, model.Ω, model.B, default=0) # m^3
     
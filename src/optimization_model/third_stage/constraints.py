@@ -89,6 +89,21 @@ r"""
     \sum_{s~\in~S_B\{b\}} State^{t,~b,~s} = 1 \qquad \forall \{t~\in~T~\vert~b~\in~B \}
     \end{align} 
 
+2.5.3.1 Basins with a single state
+++++++++++++++++++++++++++++++++++
+
+When every basin has a single state (after collapsing the states without effect on the hydro powerplants),
+:math:`State^{t,~b,~s} = 1` and the basin state constraints are replaced by volume bounds.
+
+.. math::
+    :label: basin-volume-bound-2
+    :nowrap:
+    
+    \begin{align}
+    V_\text{MIN}^{b,~S_B^\text{0}\{b\}} \leq V_\text{BAS}^{t,~b} \leq V_\text{MAX}^{b,~S_B^\text{END}\{b\}} 
+    \qquad \forall \{t~\in~T~\vert~b~\in~B \}
+    \end{align}
+
 2.5.4 Hydro powerplants
 ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
@@ -307,6 +322,14 @@ def basin_state_constraint(model, t, b):
     return sum(model.basin_state[t, b, s] for s in model.S_B[b]) == 1
 
 
+def basin_max_volume_constraint(model, t, b):
+    return model.basin_volume[t, b] <= model.max_basin_volume[b, model.S_B[b].last()]
+
+
+def basin_min_volume_constraint(model, t, b):
+    return model.basin_volume[t, b] >= model.min_basin_volume[b, model.S_B[b].first()]
+
+
 ########################################################################################################################
 # 2.5.4. Hydropower plants #############################################################################################
 ########################################################################################################################
@@ -340,6 +363,17 @@ def max_inactive_flow_by_state_constraint(model, t, h, b, s):
     ] - model.big_m * (1 - model.discrete_hydro_on[t, h])
 
 
+def max_flow_without_basin_state_constraint(model, t, h, b, s):
+    return model.flow_by_state[t, h, s] <= model.max_flow[h, s]
+
+
+def max_inactive_flow_without_basin_state_constraint(model, t, h, b, s):
+
+    return model.flow_by_state[t, h, s] >= (
+        model.max_flow[h, s] - model.big_m * (1 - model.discrete_hydro_on[t, h])
+    )
+
+
 ########################################################################################################################
 # 2.5.6 Battery  #######################################################################################################
 ########################################################################################################################
@@ -5,7 +5,7 @@ from optimization_model.third_stage.sets import *
 from optimization_model.third_stage.parameters import *
 from optimization_model.third_stage.variables import *
 
-def third_stage_common_constraints(model: pyo.AbstractModel) -> pyo.AbstractModel:
+def third_stage_common_constraints(model: pyo.AbstractModel, with_basin_state: bool = True) -> pyo.AbstractModel:
     ####################################################################################################################
     ### Basin volume evolution constraints #############################################################################  
     #################################################################################################################### 
@@ -20,15 +20,23 @@ def third_stage_common_constraints(model: pyo.AbstractModel) -> pyo.AbstractMode
     ####################################################################################################################
     ### Basin volume boundary constraints used to determine the state of each basin ####################################
     ####################################################################################################################
-    model.basin_max_state_constraint = pyo.Constraint(model.T, model.BS, rule=basin_max_state_constraint)
-    model.basin_min_state_constraint = pyo.Constraint(model.T, model.BS, rule=basin_min_state_constraint)
-    model.basin_state_constraint = pyo.Constraint(model.T, model.B, rule=basin_state_constraint)
+    if with_basin_state:
+        model.basin_max_state_constraint = pyo.Constraint(model.T, model.BS, rule=basin_max_state_constraint)
+        model.basin_min_state_constraint = pyo.Constraint(model.T, model.BS, rule=basin_min_state_constraint)
+        model.basin_state_constraint = pyo.Constraint(model.T, model.B, rule=basin_state_constraint)
+    else:
+        model.basin_max_volume_constraint = pyo.Constraint(model.T, model.B, rule=basin_max_volume_constraint)
+        model.basin_min_volume_constraint = pyo.Constraint(model.T, model.B, rule=basin_min_volume_constraint)
     ####################################################################################################################
     ### basin volume per state constraints used to determine the state of each basin ###################################
     ####################################################################################################################
     model.max_active_flow_by_state_constraint = pyo.Constraint(model.T, model.DHS, rule=max_active_flow_by_state_constraint)
-    model.max_inactive_flow_by_state_constraint = pyo.Constraint(model.T, model.DHBS, rule=max_inactive_flow_by_state_constraint)
-    model.max_flow_by_state_constraint = pyo.Constraint(model.T, model.HBS, rule=max_flow_by_state_constraint)
+    if with_basin_state:
+        model.max_inactive_flow_by_state_constraint = pyo.Constraint(model.T, model.DHBS, rule=max_inactive_flow_by_state_constraint)
+        model.max_flow_by_state_constraint = pyo.Constraint(model.T, model.HBS, rule=max_flow_by_state_constraint)
+    else:
+        model.max_inactive_flow_by_state_constraint = pyo.Constraint(model.T, model.DHBS, rule=max_inactive_flow_without_basin_state_constraint)
+        model.max_flow_by_state_constraint = pyo.Constraint(model.T, model.HBS, rule=max_flow_without_basin_state_constraint)
     model.flow_constraint = pyo.Constraint(model.T, model.H, rule=flow_constraint)
     model.hydro_power_constraint = pyo.Constraint(model.T, model.H, rule=hydro_power_constraint)
     
@@ -46,12 +54,12 @@ def third_stage_battery_constraints(model: pyo.AbstractModel) -> pyo.AbstractMod
 
     return model
 
-def third_stage_model(with_battery: bool) -> pyo.AbstractModel:
+def third_stage_model(with_battery: bool, with_basin_state: bool = True) -> pyo.AbstractModel:
     model: pyo.AbstractModel = pyo.AbstractModel() # type: ignore
     model = third_stage_sets(model)
     model = third_stage_parameters(model)
-    model = third_stage_variables(model, with_battery=with_battery)
-    model = third_stage_common_constraints(model)
+    model = third_stage_variables(model, with_battery=with_battery, with_basin_state=with_basin_state)
+    model = third_stage_common_constraints(model, with_basin_state=with_basin_state)
     if with_battery:
         model = third_stage_battery_constraints(model)
         model.objective = pyo.Objective(rule=third_stage_objective_with_battery, sense=pyo.minimize)
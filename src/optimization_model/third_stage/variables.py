@@ -1,6 +1,6 @@
 import pyomo.environ as pyo
 
-def third_stage_variables(model, with_battery: bool = True):
+def third_stage_variables(model, with_battery: bool = True, with_basin_state: bool = True):
     
     model.basin_volume = pyo.Var(model.T, model.B, within=pyo.NonNegativeReals)
     model.spilled_volume = pyo.Var(model.T, model.B, within=pyo.NonNegativeReals)
@@ -9,7 +9,8 @@ def third_stage_variables(model, with_battery: bool = True):
     model.flow = pyo.Var(model.T, model.H, within=pyo.NonNegativeReals) # m^3
     model.hydro_power = pyo.Var(model.T, model.H, within=pyo.Reals)  # MWh
     
-    model.basin_state = pyo.Var(model.T, model.BS, within=pyo.Binary)
+    if with_basin_state:
+        model.basin_state = pyo.Var(model.T, model.BS, within=pyo.Binary)
     model.flow_by_state = pyo.Var(model.T, model.HS, within=pyo.NonNegativeReals)
     model.discrete_hydro_on = pyo.Var(model.T, model.DH, within=pyo.Binary)
 
@@ -1,9 +1,11 @@
 from dataclasses import dataclass, field
 from datetime import timedelta
-from typing import Literal
-import pyomo.environ as pyo
+from typing import Literal, Optional
 from numpy.random import default_rng, Generator
 
+from utility.solver_backend import build_solver
+from utility.resource_manager import compute_thread_budget, worker_pool
+
 
 @dataclass
 class BatteryConfig:
@@ -25,6 +27,11 @@ class HydroConfig:
     d_height: float = 0.01
     first_stage_max_powered_flow_ratio: float= 0.75
     hydro_participation_to_imbalance: bool = True
+    model_reduction: bool = True
+    linear_formulation: bool = False
+    # Binary variables of the second and third stages (basin states, discrete turbines and battery charge) are
+    # relaxed to continuous variables, the stages are then linear programs
+    relax_integer: bool = False
 
 @dataclass
 class DgrConfig:
@@ -46,20 +53,49 @@ class MarketConfig:
     market_price_window_size: int = 56 # in days
     with_ancillary: bool = True
 
+# Fields which only change the second and third stages. A first stage can be shared between configurations
+# which only differ by these fields.
+SECOND_STAGE_FIELDS: tuple[str, ...] = (
+    "basin_volume_quantile", "basin_volume_quantile_min", "bound_penalty_factor",
+    "hydro_participation_to_imbalance", "model_reduction", "linear_formulation", "relax_integer",
+    "battery_capacity", "battery_rated_power", "imbalance_battery_capacity", "imbalance_battery_rated_power",
+    "battery_efficiency", "start_battery_soc",
+    "market_price_lower_quantile", "market_price_upper_quantile", "market_price_window_size",
+    "with_ancillary", "ancillary_market", "fcr_value",
+    "second_stage_sim_horizon", "second_stage_look_ahead", "second_stage_timestep", "ancillary_market_timestep",
+    "decoupled_days",
+    "verbose", "time_limit", "nb_workers", "thread_budget", "solver_threads", "checkpoint_interval",
+)
+# Fields which only change the end basin volume bounds and the objective coefficients of the second stage. The
+# second stages of configurations which only differ by these fields can be solved as one parametric sweep (see
+# DeterministicSecondStage.solve_parametric_sweep).
+SWEEP_FIELDS: tuple[str, ...] = ("basin_volume_quantile", "basin_volume_quantile_min", "bound_penalty_factor")
+
 @dataclass
 class DataConfig(BatteryConfig, HydroConfig, MarketConfig, DgrConfig):
 
     first_stage_timestep: timedelta = timedelta(days=1)
     second_stage_sim_horizon: timedelta = timedelta(days=1)
+    second_stage_look_ahead: timedelta = timedelta(0)
     second_stage_timestep: timedelta = timedelta(hours=1)
     ancillary_market_timestep: timedelta = timedelta(hours=4)
     nb_scenarios: int = 100
     total_scenarios_synthesized: int = 100
+    # Number of scenarios kept by the first stage scenario reduction, None keeps the nb_scenarios scenarios
+    nb_reduced_scenarios: Optional[int] = None
+    scenario_reduction_method: Literal["fast_forward", "k_medoids"] = "fast_forward"
+    # Second stage simulations started from the first stage expectation and solved independently (approximate)
+    decoupled_days: bool = False
     year: int = 2024
 
     verbose: bool = False
     time_limit: float = 20
+    mip_gap: Optional[float] = None
+    solver_threads: Optional[int] = None
     solver_name: str = 'gurobi'
+    nb_workers: int = 1
+    checkpoint_interval: int = 10 # number of simulations between two checkpoints
+    thread_budget: Optional[int] = None
     seed: int = 42
 
 
@@ -67,25 +103,59 @@ class DataConfig(BatteryConfig, HydroConfig, MarketConfig, DgrConfig):
 
         self.rng: Generator = default_rng(self.seed)
 
-        self.first_stage_solver= pyo.SolverFactory(self.solver_name)
-        self.second_stage_solver= pyo.SolverFactory(self.solver_name)
+        if self.thread_budget is None and self.nb_workers > 1:
+            self.thread_budget = compute_thread_budget(nb_workers=self.nb_workers)
+        self.build_solvers()
         
         assert len(self.basin_volume_quantile) == len(self.bound_penalty_factor)
         # assert self.second_stage_sim_horizon.total_seconds()%self.first_stage_timestep.total_seconds() == 0
         assert self.second_stage_sim_horizon.total_seconds()%self.second_stage_timestep.total_seconds() == 0
         assert self.ancillary_market_timestep.total_seconds()%self.second_stage_timestep.total_seconds() == 0
         assert self.second_stage_sim_horizon.total_seconds()%self.ancillary_market_timestep.total_seconds() == 0
+        assert self.second_stage_look_ahead.total_seconds()%self.second_stage_sim_horizon.total_seconds() == 0
         assert self.total_scenarios_synthesized >= self.nb_scenarios
+        if self.nb_reduced_scenarios is not None:
+            assert 0 < self.nb_reduced_scenarios <= self.nb_scenarios
 
 
         self.first_stage_nb_timestamp: int = max(self.second_stage_sim_horizon // self.first_stage_timestep, 1)
         self.second_stage_nb_timestamp: int = self.second_stage_sim_horizon // self.second_stage_timestep
+        # Number of following simulations optimized (but not committed) with each second stage simulation
+        self.nb_look_ahead_sims: int = self.second_stage_look_ahead // self.second_stage_sim_horizon
         self.nb_timestamp_per_ancillary: int = self.ancillary_market_timestep // self.second_stage_timestep
-        self.nb_quantiles: int = len(self.basin_volume_quantile)
-        self.second_stage_solver.options['TimeLimit'] = self.time_limit
         
         self.scenario_list = list(self.rng.choice(
             range(self.total_scenarios_synthesized), 
             size=self.nb_scenarios, replace=False
         ))
 
+    @property
+    def nb_quantiles(self) -> int:
+        # Derived on access: sensitivity variants set basin_volume_quantile after the initialization
+        return len(self.basin_volume_quantile)
+
+    def build_solvers(self):
+        # Explicit solver threads have priority over the thread budget of the worker
+        threads = self.solver_threads if self.solver_threads is not None else self.thread_budget
+        self.first_stage_solver= build_solver(
+            solver_name=self.solver_name, mip_gap=self.mip_gap, threads=threads
+        )
+        self.second_stage_solver= build_solver(
+            solver_name=self.solver_name, time_limit=self.time_limit, mip_gap=self.mip_gap, 
+            threads=threads
+        )
+
+    def worker_pool(self):
+        """Process pool of nb_workers workers limited to the thread budget of the config."""
+        return worker_pool(nb_workers=self.nb_workers, thread_budget=self.thread_budget)
+
+    def __getstate__(self) -> dict:
+        # Solver plugins can hold handles to the solver library and are rebuilt in the worker
+        state = self.__dict__.copy()
+        state.pop("first_stage_solver", None)
+        state.pop("second_stage_solver", None)
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.build_solvers()
@@ -16,6 +16,7 @@ from pipelines.data_manager import HydroDataManager
 from optimization_model.deterministic_first_stage.model import (
     deterministic_first_stage_model,
 )
+from utility.compact_schema import pl_to_dict_with_index
 
 
 log = generate_log(name=__name__)
@@ -123,8 +124,8 @@ class DeterministicFirstStage(HydroDataManager):
         data["T"] = {None: self.timeseries["T"].to_list()}
         data["nb_hours"] = pl_to_dict(self.timeseries[["T", "nb_hours"]])
 
-        data["discharge_volume"] = pl_to_dict_with_tuple(
-            self.discharge_volume[["TB", "discharge_volume"]]
+        data["discharge_volume"] = pl_to_dict_with_index(
+            self.discharge_volume, index=["T", "B"], value="discharge_volume"
         )
         data["market_price"] = pl_to_dict(self.timeseries[["T", "market_price"]])
 
@@ -152,8 +153,6 @@ class DeterministicFirstStage(HydroDataManager):
             .filter(~c("B").str.contains("forecast"))
             .with_columns(
                 c("B").str.replace("discharge_volume_", "").cast(pl.UInt32).alias("B")
-            ).with_columns(
-                pl.concat_list(["T","B"]).alias("TB")
             )
         )
 
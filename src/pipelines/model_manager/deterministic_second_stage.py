@@ -1,4 +1,6 @@
 from operator import le
+import copy
+from dataclasses import fields
 from typing import Optional
 from collections import Counter
 import logging
@@ -12,22 +14,31 @@ from smallflex_data_schema import SmallflexInputSchema
 from general_function import pl_to_dict, pl_to_dict_with_tuple, generate_log
 
 
-from pipelines.data_configs import DataConfig
+from pipelines.data_configs import DataConfig, SWEEP_FIELDS
 from pipelines.data_manager import HydroDataManager
 
 
 from optimization_model.deterministic_second_stage.model import deterministic_second_stage_model
 from utility.data_preprocessing import (
-    generate_hydro_power_state, generate_basin_state, split_timestamps_per_sim
+    generate_hydro_power_state, generate_basin_state, split_timestamps_per_sim, reduce_basin_state
 )
 from utility.data_preprocessing import (
     split_timestamps_per_sim,
     extract_result_table,
     pivot_result_table,
+    update_model_parameters,
+)
+from utility.solver_backend import is_solution_aborted, solve_instance
+from utility.compact_schema import pl_to_dict_with_index
+from pipelines.result_manager import (
+    extract_second_stage_sim_results, aggregate_second_stage_optimization_results
 )
 
 log = generate_log(name=__name__)
 
+# Sets of the second stage model, the persistent instance is rebuilt when one of them changes
+INSTANCE_SET_NAMES: list[str] = ["T", "F", "TF", "S_B", "S_H", "HBS", "Q"]
+
 class DeterministicSecondStage(HydroDataManager):
     def __init__(
         self,
@@ -46,10 +57,26 @@ class DeterministicSecondStage(HydroDataManager):
         
         self.model: pyo.AbstractModel = deterministic_second_stage_model(
             with_ancillary=data_config.with_ancillary,
-            with_battery=self.data_config.battery_capacity > 0
+            with_battery=self.data_config.battery_capacity > 0,
+            linear_formulation=self.data_config.linear_formulation,
+            mutable_parameters=True
         )
+        # Model without basin state binaries, used when every basin has a single state
+        self.reduced_model: Optional[pyo.AbstractModel] = None
+        if self.data_config.model_reduction:
+            self.reduced_model = deterministic_second_stage_model(
+                with_ancillary=data_config.with_ancillary,
+                with_battery=self.data_config.battery_capacity > 0,
+                with_basin_state=False,
+                linear_formulation=self.data_config.linear_formulation,
+                mutable_parameters=True
+            )
             
-        self.model_instances: dict[int, pyo.ConcreteModel] = {}
+        # A single instance is kept and its mutable parameters are updated for every simulation
+        self.model_instance: Optional[pyo.ConcreteModel] = None
+        self.instance_model: Optional[pyo.AbstractModel] = None
+        self.instance_sets: dict = {}
+        self.sim_results: list[pl.DataFrame] = []
         self.timeseries: pl.DataFrame
         self.discharge_volume: pl.DataFrame
         self.market_price_quantiles: pl.DataFrame
@@ -63,6 +90,7 @@ class DeterministicSecondStage(HydroDataManager):
         self.basin_volume_expectation: pl.DataFrame
         
         self.start_basin_volume: pl.DataFrame = self.water_basin["B", "start_volume"]
+        self.first_start_basin_volume: pl.DataFrame
         self.sim_start_battery_soc: float = self.data_config.start_battery_soc
         self.non_optimal_solution_idx: list[int] = []
         self.unfeasible_solution: list[int] = []
@@ -73,12 +101,12 @@ class DeterministicSecondStage(HydroDataManager):
     def set_timeseries(self, timeseries: pl.DataFrame, basin_volume_expectation: pl.DataFrame):
         self.timeseries = (
             split_timestamps_per_sim(
-                data=timeseries.sort("timestamp").with_row_index(name="T"),
+                data=timeseries.sort("timestamp").with_row_index(name="T").with_columns(
+                    c("T").alias("global_T")
+                ),
                 divisors=self.data_config.second_stage_nb_timestamp,
             ).with_columns(
                 (c("T")//self.data_config.nb_timestamp_per_ancillary).alias("F")
-            ).with_columns(
-                pl.concat_list("T","F").alias("TF")
             )
         )
         
@@ -86,25 +114,36 @@ class DeterministicSecondStage(HydroDataManager):
         
         self.discharge_volume = self.timeseries.unpivot(
                 on=cs.starts_with("discharge_volume"),
-                index=["T", "sim_idx"],
+                index=["T", "global_T", "sim_idx"],
                 variable_name="B",
                 value_name="discharge_volume",
             ).filter(~c("B").str.contains("forecast"))\
             .with_columns(
                 c("B").str.replace("discharge_volume_", "").cast(pl.UInt32)
-            ).with_columns(
-                pl.concat_list(["T", "B"]).alias("TB")
             )
         self.market_price_quantiles = self.timeseries.group_by("sim_idx").agg(
             c("timestamp").first(),
             c("market_price_lower_quantile").mean().alias("market_price_lower_quantile"),
             c("market_price_upper_quantile").mean().alias("market_price_upper_quantile"),
         ).sort("sim_idx")
+        self.set_basin_volume_expectation(basin_volume_expectation=basin_volume_expectation)
 
+    def set_basin_volume_expectation(self, basin_volume_expectation: pl.DataFrame):
         self.basin_volume_expectation: pl.DataFrame = basin_volume_expectation.with_columns(
             (c("T")//self.data_config.first_stage_nb_timestamp).alias("sim_idx")
         ).sort("sim_idx", "B").unique(subset=["sim_idx", "B"], keep="last")
 
+    def sim_window(self, data: pl.DataFrame) -> pl.DataFrame:
+        """
+        Rows of the current simulation followed by the rows of its look-ahead simulations. The index T is counted
+        from the start of the window, so the rows of the current simulation keep their local index.
+        """
+        return data.filter(
+            c("sim_idx").is_between(self.sim_idx, self.sim_idx + self.data_config.nb_look_ahead_sims)
+        ).with_columns(
+            (c("global_T") - c("global_T").min()).alias("T")
+        )
+
     def generate_constant_parameters(self):
         
         self.data["H"] = {None: self.hydro_power_plant["H"].to_list()}
@@ -165,28 +204,22 @@ class DeterministicSecondStage(HydroDataManager):
         self.data["max_basin_volume"] = pl_to_dict_with_tuple(
             self.sim_basin_state["BS", "volume_max"])
         
-        self.data["T"] = {
-            None: self.timeseries.filter(c("sim_idx") == self.sim_idx)["T"].to_list()}
-        self.data["F"] = {
-            None: self.timeseries.filter(c("sim_idx") == self.sim_idx)["F"].unique().sort().to_list()}
-        self.data["TF"] = {
-            None: list(map(tuple, self.timeseries.filter(c("sim_idx") == self.sim_idx)["TF"].to_list()))}
-
-        self.data["discharge_volume"] = pl_to_dict_with_tuple(
-            self.discharge_volume.filter(c("sim_idx") == self.sim_idx)[["TB", "discharge_volume"]]
-        ) 
-        self.data["market_price"] = pl_to_dict(
-            self.timeseries.filter(c("sim_idx") == self.sim_idx)[["T", "market_price"]]
-        )
-        self.data["pv_power"] = pl_to_dict(
-            self.timeseries.filter(c("sim_idx") == self.sim_idx)[["T", "pv_power"]]
-        )
-        self.data["wind_power"] = pl_to_dict(
-            self.timeseries.filter(c("sim_idx") == self.sim_idx)[["T", "wind_power"]]
+        timeseries = self.sim_window(self.timeseries).with_columns(
+                (c("T")//self.data_config.nb_timestamp_per_ancillary).alias("F")
+            )
+        discharge_volume = self.sim_window(self.discharge_volume)
+        self.data["T"] = {None: timeseries["T"].to_list()}
+        self.data["F"] = {None: timeseries["F"].unique().sort().to_list()}
+        self.data["TF"] = {None: list(timeseries.select("T", "F").iter_rows())}
+
+        self.data["discharge_volume"] = pl_to_dict_with_index(
+            discharge_volume, index=["T", "B"], value="discharge_volume"
         )
+        self.data["market_price"] = pl_to_dict(timeseries[["T", "market_price"]])
+        self.data["pv_power"] = pl_to_dict(timeseries[["T", "pv_power"]])
+        self.data["wind_power"] = pl_to_dict(timeseries[["T", "wind_power"]])
         self.data["ancillary_market_price"] = pl_to_dict(
-            self.timeseries.filter(c("sim_idx") == self.sim_idx).filter(c("F").is_first_distinct())
-            [["F", "ancillary_market_price"]]
+            timeseries.filter(c("F").is_first_distinct())[["F", "ancillary_market_price"]]
         )
         
         self.data["max_flow"] = pl_to_dict_with_tuple(self.sim_hydro_power_state["HS", "flow"])  
@@ -196,7 +229,9 @@ class DeterministicSecondStage(HydroDataManager):
         self.data["overage_market_price"] = {
             None: self.market_price_quantiles.filter(c("sim_idx") == self.sim_idx)["market_price_lower_quantile"][0]}
         
-        actual_volume = self.basin_volume_expectation.filter(c("sim_idx") == self.sim_idx + 1)
+        # The end volume target is taken at the end of the look-ahead window
+        end_sim_idx = min(self.sim_idx + self.data_config.nb_look_ahead_sims, self.nb_sims - 1)
+        actual_volume = self.basin_volume_expectation.filter(c("sim_idx") == end_sim_idx + 1)
         self.data["expected_end_basin_volume"] = pl_to_dict(actual_volume["B", "mean"])
         quantile_value = actual_volume.unpivot(
             on=cs.contains("quantile"),
@@ -218,12 +253,26 @@ class DeterministicSecondStage(HydroDataManager):
             )
 
 
-        self.model_instances[self.sim_idx] = self.model.create_instance({None: self.data}) # type: ignore
+        model = self.model
+        if self.reduced_model is not None and self.sim_basin_state["B"].is_unique().all():
+            model = self.reduced_model
+        instance_sets: dict = {name: self.data[name] for name in INSTANCE_SET_NAMES}
+        if (
+            self.model_instance is None or model is not self.instance_model or 
+            instance_sets != self.instance_sets
+        ):
+            self.model_instance = model.create_instance({None: self.data}) # type: ignore
+            self.instance_model = model
+            self.instance_sets = instance_sets
+        else:
+            update_model_parameters(model_instance=self.model_instance, data=self.data)
     
     def calculate_second_stage_states(self):
 
-        volume_bound = self.start_basin_volume.join(
-            self.basin_volume_expectation.filter(c("T") == self.sim_idx)["B", "diff_volume"], on="B").with_columns(
+        window_diff_volume = self.basin_volume_expectation.filter(
+                c("T").is_between(self.sim_idx, self.sim_idx + self.data_config.nb_look_ahead_sims)
+            ).group_by("B").agg(c("diff_volume").sum())
+        volume_bound = self.start_basin_volume.join(window_diff_volume, on="B").with_columns(
             pl.concat_list(c("start_volume"), c("start_volume") + c("diff_volume")).list.sort().alias("volume_bound")
             )
 
@@ -267,6 +316,9 @@ class DeterministicSecondStage(HydroDataManager):
                         ) 
         self.sim_hydro_power_state = generate_hydro_power_state(
                 power_performance_table=self.power_performance_table, basin_state=self.sim_basin_state)
+        if self.data_config.model_reduction:
+            self.sim_basin_state, self.sim_hydro_power_state = reduce_basin_state(
+                basin_state=self.sim_basin_state, hydro_power_state=self.sim_hydro_power_state)
 
         self.hydro_flex_power: dict[str, float] = self.sim_hydro_power_state\
             .filter(~c("H").is_in(self.data["DH"][None]))\
@@ -277,10 +329,58 @@ class DeterministicSecondStage(HydroDataManager):
             ).sum().to_dicts()[0]
 
 
+    def commit_sim_states(self):
+        """
+        Extract the results of the current simulation and set the starting state of the next one. With a
+        look-ahead window, the state is taken at the first timestamp of the next simulation instead of at the end
+        of the window.
+        """
+        model_instance: pyo.ConcreteModel = self.model_instance # type: ignore
+        self.sim_results.append(
+            extract_second_stage_sim_results(
+                model_instance=model_instance, timeseries=self.timeseries, sim_idx=self.sim_idx
+            )
+        )
+        commit_t: int = self.timeseries.filter(c("sim_idx") == self.sim_idx).height
+
+        if commit_t in model_instance.T:
+            self.start_basin_volume = extract_result_table(model_instance, "basin_volume")\
+                .filter(c("T") == commit_t).select("B", c("basin_volume").alias("start_volume"))
+        else:
+            self.start_basin_volume = extract_result_table(model_instance, "end_basin_volume")\
+                .rename({"end_basin_volume": "start_volume"})
+
+        if self.data_config.battery_capacity > 0:
+            if commit_t in model_instance.T:
+                self.sim_start_battery_soc = model_instance.battery_soc[commit_t].value # type: ignore
+            else:
+                self.sim_start_battery_soc += (
+                    model_instance.end_battery_soc_overage.extract_values()[None] - # type: ignore
+                    model_instance.end_battery_soc_shortage.extract_values()[None] # type: ignore
+                )
+
+    def start_sims(self):
+        self.generate_constant_parameters()
+        self.first_start_basin_volume = self.start_basin_volume.rename({"start_volume": "start_basin_volume"})
+        self.sim_results = []
+
+    def solve_sim(self, solver=None, warmstart: bool = False):
+        self.calculate_second_stage_states()
+        self.generate_model_instance()
+
+        solution = solve_instance(
+            solver if solver is not None else self.data_config.second_stage_solver, self.model_instance,
+            tee=self.data_config.verbose, warmstart=warmstart
+        )
+        if is_solution_aborted(solution):
+            self.non_optimal_solution_idx.append(self.sim_idx)
+
+        self.commit_sim_states()
+
     def solve_every_models(self, nb_sim_tot: Optional[int] = None):
         logging.getLogger('pyomo.core').setLevel(logging.ERROR)
         
-        self.generate_constant_parameters()
+        self.start_sims()
         
         if not nb_sim_tot:
             nb_sim_tot = self.nb_sims
@@ -291,21 +391,95 @@ class DeterministicSecondStage(HydroDataManager):
             position=1,
             leave=False
         ):
+            self.solve_sim()
 
-            self.calculate_second_stage_states()
-            self.generate_model_instance()
-        
-            solution = self.data_config.second_stage_solver.solve(self.model_instances[self.sim_idx], tee=self.data_config.verbose)
+    def sweep_variant(
+        self, data_config: DataConfig, basin_volume_expectation: pl.DataFrame
+    ) -> "DeterministicSecondStage":
+        """
+        Copy of the second stage for one configuration of a parametric sweep. The hydropower tables, timeseries and
+        abstract models are shared, the simulation state is reset.
+        """
+        differing_fields: list[str] = [
+            data_field.name for data_field in fields(DataConfig)
+            if data_field.name not in SWEEP_FIELDS
+            and getattr(data_config, data_field.name) != getattr(self.data_config, data_field.name)
+        ]
+        if differing_fields:
+            raise ValueError(
+                f"Parametric sweep configurations can only differ by {SWEEP_FIELDS}, not by {differing_fields}"
+            )
+        variant = copy.copy(self)
+        variant.data_config = data_config
+        variant.data = dict(self.data)
+        # The number of quantiles is a sweep field, the instance is rebuilt when it changes
+        variant.data["Q"] = {None: list(range(data_config.nb_quantiles))}
+        variant.set_basin_volume_expectation(basin_volume_expectation=basin_volume_expectation)
+        variant.start_basin_volume = self.water_basin["B", "start_volume"]
+        variant.sim_start_battery_soc = data_config.start_battery_soc
+        variant.non_optimal_solution_idx = []
+        variant.unfeasible_solution = []
+        variant.sim_results = []
+        return variant
 
-            if solution["Solver"][0]["Status"] == "aborted":
-                self.non_optimal_solution_idx.append(self.sim_idx)
+    def solve_parametric_sweep(
+        self,
+        data_configs: list[DataConfig],
+        basin_volume_expectations: list[pl.DataFrame],
+        nb_sim_tot: Optional[int] = None,
+    ) -> list["DeterministicSecondStage"]:
+        """
+        Solve the second stage of several configurations which only differ by the end basin volume bounds and
+        the penalty factors (``SWEEP_FIELDS``, and the basin volume expectation computed with them).
 
-            
-            self.start_basin_volume = extract_result_table(self.model_instances[self.sim_idx], "end_basin_volume").rename({"end_basin_volume": "start_volume"})
-            
-            if self.data_config.battery_capacity > 0:
-                self.sim_start_battery_soc += (
-                    self.model_instances[self.sim_idx].end_battery_soc_overage.extract_values()[None] - # type: ignore
-                    self.model_instances[self.sim_idx].end_battery_soc_shortage.extract_values()[None] # type: ignore
-                )
-            
\ No newline at end of file
+        The simulations of every configuration are solved one after the other on the same persistent model
+        instance and with the same solver (the solver of this second stage): only the mutable parameters are
+        updated between configurations (the instance is rebuilt when the basin states of a configuration change
+        its sets). The solution of the previous configuration of the same simulation is given to the solver as
+        warm start.
+
+        Returns:
+            list[DeterministicSecondStage]: Solved second stage of every configuration, whose results are given
+                by ``extract_optimization_results``.
+        """
+        logging.getLogger('pyomo.core').setLevel(logging.ERROR)
+        variants: list[DeterministicSecondStage] = [
+            self.sweep_variant(data_config=data_config, basin_volume_expectation=basin_volume_expectation)
+            for data_config, basin_volume_expectation in zip(data_configs, basin_volume_expectations)
+        ]
+        for variant in variants:
+            variant.start_sims()
+
+        if not nb_sim_tot:
+            nb_sim_tot = self.nb_sims
+
+        for sim_idx in tqdm(
+            range(nb_sim_tot),
+            desc="Solving second stage parametric sweep",
+            position=1,
+            leave=False
+        ):
+            for i, variant in enumerate(variants):
+                variant.sim_idx = sim_idx
+                variant.model_instance = self.model_instance
+                variant.instance_model = self.instance_model
+                variant.instance_sets = self.instance_sets
+                variant.solve_sim(solver=self.data_config.second_stage_solver, warmstart=i > 0)
+                self.model_instance = variant.model_instance
+                self.instance_model = variant.instance_model
+                self.instance_sets = variant.instance_sets
+        return variants
+
+    def extract_optimization_results(self) -> tuple[pl.DataFrame, float]:
+        return aggregate_second_stage_optimization_results(
+            optimization_results=pl.concat(self.sim_results, how="diagonal_relaxed"),
+            start_basin_volume=self.first_start_basin_volume,
+            end_basin_volume=self.start_basin_volume.rename({"start_volume": "end_basin_volume"}),
+            rated_alpha=pl.DataFrame(
+                list(self.data["rated_alpha"].items()), schema=["UP_B", "rated_alpha"], orient="row"
+            ).with_columns(c("UP_B").cast(pl.UInt32)),
+            basin_volume_range=pl.DataFrame(
+                list(self.data["basin_volume_range"].items()), schema=["B", "basin_volume_range"], orient="row"
+            ).with_columns(c("B").cast(pl.UInt32)),
+            data_config=self.data_config
+        )
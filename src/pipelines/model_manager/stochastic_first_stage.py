@@ -10,6 +10,7 @@ from general_function import pl_to_dict, pl_to_dict_with_tuple, generate_log
 from smallflex_data_schema import SmallflexInputSchema
 
 from pipelines.data_manager import HydroDataManager
+from utility.scenario_cube import ScenarioCube
 from pipelines.data_configs import DataConfig
 from optimization_model.stochastic_first_stage.model import stochastic_first_stage_model
 
@@ -35,7 +36,7 @@ class StochasticFirstStage(HydroDataManager):
         self.model: pyo.AbstractModel = stochastic_first_stage_model()
         self.model_instance: pyo.ConcreteModel
         
-        self.discharge_volume: pl.DataFrame
+        self.scenario_cube: ScenarioCube
         self.timeseries: pl.DataFrame
         self.price_quantile : pl.DataFrame        
 
@@ -49,27 +50,15 @@ class StochasticFirstStage(HydroDataManager):
             ).agg(
                 cs.starts_with("discharge_volume").sum(),
                 cs.contains("market_price").mean(),
+                cs.matches(r"^probability$").first(),
                 (24*c("timestamp").count()).alias("nb_hours"),
             ).sort("timestamp").with_columns(
-                ((c("timestamp") -  min_timestamp) / self.data_config.first_stage_timestep).cast(pl.Int64).alias("T")
-            ).with_columns(
-                pl.concat_list("T", "Ω").alias("TΩ")
+                ((c("timestamp") -  min_timestamp) / self.data_config.first_stage_timestep).cast(pl.UInt32).alias("T")
             )
         )
         
-        self.discharge_volume = (
-            self.timeseries.unpivot(
-                on=cs.starts_with("discharge_volume"),
-                index=["T", "Ω"],
-                variable_name="B",
-                value_name="discharge_volume",
-            )
-            .filter(~c("B").str.contains("forecast"))
-            .with_columns(
-                c("B").str.replace("discharge_volume_", "").cast(pl.UInt32).alias("B")
-            ).with_columns(
-                pl.concat_list(["T", "Ω", "B"]).alias("TΩB")
-            )
+        self.scenario_cube = ScenarioCube.from_frame(
+            self.timeseries, names={"market_price": None, "discharge_volume": "B", "nb_hours": None}
         )
         self.price_quantile = self.timeseries.group_by("Ω").agg(
             c("market_price").quantile(0.85).alias("upper_quantile"), 
@@ -86,7 +75,8 @@ class StochasticFirstStage(HydroDataManager):
         data["DH"] = {
             None: self.hydro_power_plant.filter(c("control") == "discrete")["H"].to_list()
         }
-        data["Ω"] = {None: self.data_config.scenario_list}
+        # The scenario set can be reduced (see timeseries_preparation.scenario_reduction)
+        data["Ω"] = {None: self.scenario_cube.Ω.to_list()}
         data["HB"] = {
             None: list(map(tuple, self.first_stage_hydro_power_state["HB"].to_list()))
         }
@@ -125,15 +115,13 @@ class StochasticFirstStage(HydroDataManager):
 
         # Timeseries
         
-        data["T"] = {None: self.timeseries["T"].to_list()}
-        data["nb_hours"] = pl_to_dict(self.timeseries.filter(c("T").is_first_distinct())[["T", "nb_hours"]])
+        data["T"] = {None: self.scenario_cube.T.to_list()}
+        data["nb_hours"] = dict(zip(data["T"][None], self.scenario_cube.values["nb_hours"][:, 0].tolist()))
 
-        data["discharge_volume"] = pl_to_dict_with_tuple(
-            self.discharge_volume[["TΩB", "discharge_volume"]]
-        )
-        data["market_price"] = pl_to_dict_with_tuple(
-            self.timeseries[["TΩ", "market_price"]]
-        )
+        data["discharge_volume"] = self.scenario_cube.param_data("discharge_volume")
+        data["market_price"] = self.scenario_cube.param_data("market_price")
+        if self.scenario_cube.probability is not None:
+            data["probability"] = dict(zip(data["Ω"][None], self.scenario_cube.probability.tolist()))
 
         # Configuration parameters
         data["max_powered_flow_ratio"] = {None: self.data_config.first_stage_max_powered_flow_ratio}
@@ -1,5 +1,8 @@
 from typing import Optional
+import os
+import pickle
 import logging
+import numpy as np
 import polars as pl
 from polars import col as c
 from polars import selectors as cs
@@ -12,6 +15,7 @@ from general_function import pl_to_dict, pl_to_dict_with_tuple, generate_log
 
 from pipelines.data_configs import DataConfig
 from pipelines.data_manager import HydroDataManager
+from pipelines.study_runner import config_hash
 
 
 from optimization_model.deterministic_second_stage.model import deterministic_second_stage_model
@@ -19,16 +23,27 @@ from optimization_model.third_stage.model import third_stage_model
 
 
 from utility.data_preprocessing import (
-    generate_hydro_power_state, generate_basin_state, split_timestamps_per_sim
+    generate_hydro_power_state, generate_basin_state, split_timestamps_per_sim, reduce_basin_state
 )
 from utility.data_preprocessing import (
     split_timestamps_per_sim,
     extract_result_table,
     pivot_result_table,
 )
+from utility.array_kernels import clipped_cumsum
+from utility.compact_schema import pl_to_dict_with_index
+from utility.solver_backend import is_solution_aborted
+from pipelines.result_manager import (
+    extract_third_stage_sim_results, aggregate_third_stage_optimization_results
+)
 
 log = generate_log(name=__name__)
 
+# Fields which do not change the results of a run, a checkpoint can be resumed with other values
+CHECKPOINT_IGNORED_FIELDS: tuple[str, ...] = (
+    "verbose", "nb_workers", "thread_budget", "solver_threads", "checkpoint_interval"
+)
+
 class StochasticSecondStage(HydroDataManager):
     def __init__(
         self,
@@ -47,14 +62,30 @@ class StochasticSecondStage(HydroDataManager):
 
         self.second_stage_model: pyo.AbstractModel = deterministic_second_stage_model(
             with_battery=data_config.battery_capacity > 0, 
-            with_ancillary=data_config.with_ancillary)
+            with_ancillary=data_config.with_ancillary,
+            linear_formulation=data_config.linear_formulation)
         
         self.third_stage_model: pyo.AbstractModel = third_stage_model(
             with_battery=data_config.imbalance_battery_capacity > 0)
+        # Models without basin state binaries, used when every basin has a single state
+        self.second_stage_reduced_model: Optional[pyo.AbstractModel] = None
+        self.third_stage_reduced_model: Optional[pyo.AbstractModel] = None
+        if data_config.model_reduction:
+            self.second_stage_reduced_model = deterministic_second_stage_model(
+                with_battery=data_config.battery_capacity > 0, 
+                with_ancillary=data_config.with_ancillary,
+                with_basin_state=False,
+                linear_formulation=data_config.linear_formulation)
+            self.third_stage_reduced_model = third_stage_model(
+                with_battery=data_config.imbalance_battery_capacity > 0,
+                with_basin_state=False)
 
 
         self.second_stage_model_instances: dict[int, pyo.ConcreteModel] = {}
         self.third_stage_model_instances: dict[int, pyo.ConcreteModel] = {}
+        self.sim_results: list[pl.DataFrame] = []
+        # End basin volume of each simulation solved in decoupled mode
+        self.decoupled_end_basin_volume: list[pl.DataFrame] = []
         self.timeseries_forecast: pl.DataFrame
         self.timeseries_measurement: pl.DataFrame
         self.vpp_long : pl.DataFrame
@@ -77,6 +108,9 @@ class StochasticSecondStage(HydroDataManager):
         self.start_basin_volume: pl.DataFrame = self.water_basin["B", "start_volume"]
         self.sim_start_battery_soc: float = self.data_config.start_battery_soc
         self.sim_start_imbalance_battery_soc: float = self.data_config.start_battery_soc
+        self.first_start_basin_volume: pl.DataFrame = self.start_basin_volume\
+            .rename({"start_volume": "start_basin_volume"})
+        self.second_stage_end_basin_volume: pl.DataFrame
         
         self.non_optimal_solution_idx: list[int] = []
         self.unfeasible_solution: list[int] = []
@@ -92,8 +126,6 @@ class StochasticSecondStage(HydroDataManager):
                 divisors=self.data_config.second_stage_nb_timestamp,
             ).with_columns(
                 (c("T")//self.data_config.nb_timestamp_per_ancillary).alias("F")
-            ).with_columns(
-                pl.concat_list("T","F").alias("TF")
             )
         )
         
@@ -104,8 +136,6 @@ class StochasticSecondStage(HydroDataManager):
                 divisors=self.data_config.second_stage_nb_timestamp,
             ).with_columns(
                 (c("T")//self.data_config.nb_timestamp_per_ancillary).alias("F")
-            ).with_columns(
-                pl.concat_list("T","F").alias("TF")
             )
         )
         
@@ -135,8 +165,6 @@ class StochasticSecondStage(HydroDataManager):
                 value_name="discharge_volume",
             ).with_columns(
                 c("B").str.replace("discharge_volume_", "").cast(pl.UInt32)
-            ).with_columns(
-                pl.concat_list(["T", "B"]).alias("TB")
             )
 
         discharge_volume_measured = self.timeseries_measurement.unpivot(
@@ -228,11 +256,11 @@ class StochasticSecondStage(HydroDataManager):
         self.data["F"] = {
             None: self.timeseries_forecast.filter(c("sim_idx") == self.sim_idx)["F"].unique().sort().to_list()}
         self.data["TF"] = {
-            None: list(map(tuple, self.timeseries_forecast.filter(c("sim_idx") == self.sim_idx)["TF"].to_list()))}
+            None: list(self.timeseries_forecast.filter(c("sim_idx") == self.sim_idx).select("T", "F").iter_rows())}
 
-        self.data["discharge_volume"] = pl_to_dict_with_tuple(
-            self.discharge_volume.filter(c("sim_idx") == self.sim_idx)[["TB", "discharge_volume"]]
-        ) 
+        self.data["discharge_volume"] = pl_to_dict_with_index(
+            self.discharge_volume.filter(c("sim_idx") == self.sim_idx), index=["T", "B"], value="discharge_volume"
+        )
         self.data["market_price"] = pl_to_dict(
             self.timeseries_forecast.filter(c("sim_idx") == self.sim_idx)[["T", "market_price"]]
         )
@@ -277,15 +305,21 @@ class StochasticSecondStage(HydroDataManager):
                 )
             )
 
-        self.second_stage_model_instances[self.sim_idx] = self.second_stage_model.create_instance({None: self.data}) # type: ignore
+        model = self.second_stage_model
+        if self.second_stage_reduced_model is not None and self.sim_basin_state["B"].is_unique().all():
+            model = self.second_stage_reduced_model
+        self.second_stage_model_instances[self.sim_idx] = model.create_instance({None: self.data}) # type: ignore
+        if self.data_config.relax_integer:
+            pyo.TransformationFactory("core.relax_integer_vars").apply_to(self.second_stage_model_instances[self.sim_idx])
 
     def generate_third_stage_model_instance(self):
         
         self.data["start_battery_soc"] = {None: self.sim_start_imbalance_battery_soc}
         
-        self.data["discharge_volume_measured"] = pl_to_dict_with_tuple(
-            self.discharge_volume.filter(c("sim_idx") == self.sim_idx)[["TB", "discharge_volume_measured"]]
-        ) 
+        self.data["discharge_volume_measured"] = pl_to_dict_with_index(
+            self.discharge_volume.filter(c("sim_idx") == self.sim_idx), index=["T", "B"],
+            value="discharge_volume_measured"
+        )
         self.data["hydro_power_forecast"]  = self.second_stage_model_instances[self.sim_idx].hydro_power.extract_values() # type: ignore
         self.data["total_power_forecast"]  = self.second_stage_model_instances[self.sim_idx].total_power.extract_values() # type: ignore
         
@@ -297,7 +331,12 @@ class StochasticSecondStage(HydroDataManager):
         )
 
 
-        self.third_stage_model_instances[self.sim_idx] = self.third_stage_model.create_instance({None: self.data}) # type: ignore
+        model = self.third_stage_model
+        if self.third_stage_reduced_model is not None and self.sim_basin_state["B"].is_unique().all():
+            model = self.third_stage_reduced_model
+        self.third_stage_model_instances[self.sim_idx] = model.create_instance({None: self.data}) # type: ignore
+        if self.data_config.relax_integer:
+            pyo.TransformationFactory("core.relax_integer_vars").apply_to(self.third_stage_model_instances[self.sim_idx])
 
     def calculate_second_stage_states(self):
         volume_bound = self.start_basin_volume.join(
@@ -339,6 +378,9 @@ class StochasticSecondStage(HydroDataManager):
 
         self.sim_hydro_power_state = generate_hydro_power_state(
                 power_performance_table=self.power_performance_table, basin_state=self.sim_basin_state)
+        if self.data_config.model_reduction:
+            self.sim_basin_state, self.sim_hydro_power_state = reduce_basin_state(
+                basin_state=self.sim_basin_state, hydro_power_state=self.sim_hydro_power_state)
 
         self.hydro_flex_power: dict[str, float] = self.sim_hydro_power_state\
             .filter(~c("H").is_in(self.data["DH"][None]))\
@@ -355,34 +397,130 @@ class StochasticSecondStage(HydroDataManager):
             self.timeseries_measurement.filter(c("sim_idx") == self.sim_idx)[["T", "wind_power"]]
         )
 
-    def solve_every_models(self, nb_sim_tot: Optional[int] = None):
+    def save_checkpoint(self, file_path: str):
+        """
+        Save the rolling state and the results collected so far. The file is written next to its final path and
+        then renamed, so an interruption while saving keeps the previous checkpoint.
+        """
+        checkpoint: dict = {
+            "run_key": self.checkpoint_run_key(),
+            "nb_sims": self.nb_sims,
+            "sim_idx": self.sim_idx + 1,
+            "start_basin_volume": self.start_basin_volume,
+            "sim_start_battery_soc": self.sim_start_battery_soc,
+            "sim_start_imbalance_battery_soc": self.sim_start_imbalance_battery_soc,
+            "non_optimal_solution_idx": self.non_optimal_solution_idx,
+            "second_stage_end_basin_volume": self.second_stage_end_basin_volume,
+            "sim_results": self.sim_results,
+        }
+        if os.path.dirname(file_path):
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path + ".tmp", "wb") as file:
+            pickle.dump(checkpoint, file)
+        os.replace(file_path + ".tmp", file_path)
+
+    def checkpoint_run_key(self) -> str:
+        """
+        Hash of the configuration (year and battery size included), hydropower plants and input timeseries of the
+        run. A checkpoint is only resumed by a run with the same key.
+        """
+        return config_hash(
+            [
+                self.data_config, self.hydro_power_plant, self.timeseries_forecast, self.timeseries_measurement,
+                self.basin_volume_expectation
+            ],
+            ignored_fields=CHECKPOINT_IGNORED_FIELDS
+        )
+
+    def load_checkpoint(self, file_path: str) -> int:
+        """
+        Restore the rolling state and the results saved by `save_checkpoint`. A checkpoint written by a run with
+        another configuration or other inputs is not resumed: the run restarts from the first simulation and the
+        checkpoint is overwritten by the next `save_checkpoint`.
+
+        Returns:
+            int: Index of the first simulation left to solve.
+        """
+        with open(file_path, "rb") as file:
+            checkpoint: dict = pickle.load(file)
+        if checkpoint.get("run_key") != self.checkpoint_run_key():
+            log.warning(
+                f"Checkpoint {file_path} was written with another configuration or other inputs, "
+                "the second stage restarts from the first simulation"
+            )
+            return 0
+        if checkpoint["nb_sims"] != self.nb_sims:
+            raise ValueError(
+                f"Checkpoint {file_path} has {checkpoint['nb_sims']} simulations instead of {self.nb_sims}")
+        self.start_basin_volume = checkpoint["start_basin_volume"]
+        self.sim_start_battery_soc = checkpoint["sim_start_battery_soc"]
+        self.sim_start_imbalance_battery_soc = checkpoint["sim_start_imbalance_battery_soc"]
+        self.non_optimal_solution_idx = checkpoint["non_optimal_solution_idx"]
+        self.second_stage_end_basin_volume = checkpoint["second_stage_end_basin_volume"]
+        self.sim_results = checkpoint["sim_results"]
+        log.info(f"Resuming second stage from simulation {checkpoint['sim_idx']} of {file_path}")
+        return checkpoint["sim_idx"]
+
+    def solve_sim_models(self):
+        """Solve the second and third stages of the current simulation from the current start state."""
+        self.calculate_second_stage_states()
+        self.generate_second_stage_model_instance()
+
+        solution = self.data_config.second_stage_solver.solve(self.second_stage_model_instances[self.sim_idx], tee=self.data_config.verbose)
+        if is_solution_aborted(solution):
+            self.non_optimal_solution_idx.append(self.sim_idx)
+
+        self.generate_third_stage_model_instance()
+
+        solution = self.data_config.second_stage_solver.solve(self.third_stage_model_instances[self.sim_idx], tee=self.data_config.verbose)
+
+        if is_solution_aborted(solution):
+            self.non_optimal_solution_idx.append(self.sim_idx)
+
+        self.sim_results.append(
+            extract_third_stage_sim_results(
+                second_stage_model_instance=self.second_stage_model_instances[self.sim_idx],
+                third_stage_model_instance=self.third_stage_model_instances[self.sim_idx],
+                timeseries=self.timeseries_measurement,
+                sim_idx=self.sim_idx
+            )
+        )
+
+    def solve_every_models(
+        self, nb_sim_tot: Optional[int] = None, checkpoint_file: Optional[str] = None,
+        resume_from: Optional[str] = None
+        ):
+        """
+        Solve the second and third stages of every simulation.
+
+        Args:
+            nb_sim_tot (Optional[int]): Number of simulations to solve. Defaults to every simulation.
+            checkpoint_file (Optional[str]): File where the rolling state and the results are saved every
+                `data_config.checkpoint_interval` simulations and at the end of the run.
+            resume_from (Optional[str]): Checkpoint file to resume from. Ignored if the file does not exist, so
+                the same path can be given to `checkpoint_file` and `resume_from` to restart interrupted runs.
+        """
         logging.getLogger('pyomo.core').setLevel(logging.ERROR)
         
         self.generate_constant_parameters()
         
         if not nb_sim_tot:
             nb_sim_tot = self.nb_sims
+
+        first_sim_idx: int = 0
+        if resume_from is not None and os.path.exists(resume_from):
+            first_sim_idx = self.load_checkpoint(file_path=resume_from)
             
         for self.sim_idx in tqdm(
-            range(nb_sim_tot),
+            range(first_sim_idx, nb_sim_tot),
             desc="Solving second and third stage optimization problem",
             position=1,
             leave=False
         ):
 
-            self.calculate_second_stage_states()
-            self.generate_second_stage_model_instance()
-        
-            solution = self.data_config.second_stage_solver.solve(self.second_stage_model_instances[self.sim_idx], tee=self.data_config.verbose)
-            if solution["Solver"][0]["Status"] == "aborted":
-                self.non_optimal_solution_idx.append(self.sim_idx)
-
-            self.generate_third_stage_model_instance()
-
-            solution = self.data_config.second_stage_solver.solve(self.third_stage_model_instances[self.sim_idx], tee=self.data_config.verbose)
-
-            if solution["Solver"][0]["Status"] == "aborted":
-                self.non_optimal_solution_idx.append(self.sim_idx)
+            self.solve_sim_models()
+            self.second_stage_end_basin_volume = extract_result_table(
+                self.second_stage_model_instances[self.sim_idx], "end_basin_volume")
             if self.data_config.battery_capacity > 0:
                 self.sim_start_battery_soc += (
                     self.second_stage_model_instances[self.sim_idx].end_battery_soc_overage.extract_values()[None] - # type: ignore
@@ -393,3 +531,167 @@ class StochasticSecondStage(HydroDataManager):
                 self.sim_start_imbalance_battery_soc = self.third_stage_model_instances[self.sim_idx].end_battery_soc.extract_values()[None] # type: ignore
             self.start_basin_volume = extract_result_table(self.third_stage_model_instances[self.sim_idx], "end_basin_volume").rename({"end_basin_volume": "start_volume"})
 
+            if checkpoint_file is not None and (
+                (self.sim_idx + 1) % self.data_config.checkpoint_interval == 0 or self.sim_idx + 1 == nb_sim_tot
+            ):
+                self.save_checkpoint(file_path=checkpoint_file)
+
+    def set_decoupled_start_state(self):
+        """
+        Start state of the current simulation taken from the first stage basin volume expectation instead of the
+        end of the previous simulation. Basins without expectation start from their initial volume and the
+        batteries from the start state of charge.
+        """
+        self.start_basin_volume = self.water_basin["B", "start_volume"].join(
+            self.basin_volume_expectation.filter(c("sim_idx") == self.sim_idx).select("B", "mean"),
+            on="B", how="left"
+        ).select("B", pl.coalesce("mean", "start_volume").alias("start_volume"))
+        self.sim_start_battery_soc = self.data_config.start_battery_soc
+        self.sim_start_imbalance_battery_soc = self.data_config.start_battery_soc
+
+    def solve_decoupled_models(self, sim_indices: Optional[list[int]] = None):
+        """
+        Solve the second and third stages of each simulation independently (approximate decoupled mode).
+
+        Each simulation starts from the first stage basin volume expectation (see `set_decoupled_start_state`), so
+        simulations do not depend on each other and can be split between processes (see `solve_decoupled_sims`).
+        `reconcile_decoupled_results` has to be called once every simulation is solved.
+
+        Args:
+            sim_indices (Optional[list[int]]): Simulations to solve. Defaults to every simulation.
+        """
+        logging.getLogger('pyomo.core').setLevel(logging.ERROR)
+
+        self.generate_constant_parameters()
+        if sim_indices is None:
+            sim_indices = list(range(self.nb_sims))
+
+        for self.sim_idx in tqdm(
+            sim_indices,
+            desc="Solving decoupled second and third stage optimization problem",
+            position=1,
+            leave=False
+        ):
+            self.set_decoupled_start_state()
+            self.solve_sim_models()
+            self.decoupled_end_basin_volume.append(
+                extract_result_table(self.third_stage_model_instances[self.sim_idx], "end_basin_volume")
+                .with_columns(pl.lit(self.sim_idx, dtype=pl.UInt32).alias("sim_idx"))
+            )
+            # Instances are not needed once the results are extracted
+            del self.second_stage_model_instances[self.sim_idx], self.third_stage_model_instances[self.sim_idx]
+
+    def reconcile_decoupled_results(self):
+        """
+        Repair the basin volume continuity of the decoupled simulations.
+
+        The volume variation of every timestamp of the decoupled simulations (inflow, turbined, pumped and spilled
+        water) is replayed sequentially from the initial basin volume and clipped between the empty and the full
+        basin. Water which overflows a full basin is added to the spilled volume. Water which is turbined from an
+        empty basin is missing: its value at the market price is removed from the income with a negative
+        `reconciliation_income` column. The battery state of charge is not reconciled since every simulation
+        ends close to its start state of charge.
+
+        The reconciled basin volumes replace the decoupled ones in the results and the difference is kept in the
+        `volume_deviation_{B}` columns.
+        """
+        self.generate_constant_parameters()
+        basin_idx: list[int] = self.water_basin["B"].to_list()
+
+        end_basin_volume = pl.concat(self.decoupled_end_basin_volume).select(
+            "sim_idx", ("end_basin_volume_" + c("B").cast(pl.Utf8)).alias("B"), "end_basin_volume"
+        ).pivot(on="B", index="sim_idx", values="end_basin_volume")
+        # T restarts at 0 in every simulation and the workers return their simulations in chunks
+        results = pl.concat(self.sim_results, how="diagonal_relaxed")\
+            .join(end_basin_volume, on="sim_idx", how="left").sort("sim_idx", "T")
+
+        volume_diff = results.select(
+            (
+                pl.coalesce(c(f"basin_volume_{b}").shift(-1).over("sim_idx"), c(f"end_basin_volume_{b}"))
+                - c(f"basin_volume_{b}")
+            ).alias(str(b))
+            for b in basin_idx
+        ).to_numpy()
+        start_volume = pl_to_dict(self.first_start_basin_volume)
+        volume = clipped_cumsum(
+            np.vstack([np.array([start_volume[b] for b in basin_idx]), volume_diff]), xmin=0, xmax=1
+        )
+        unclipped_volume = volume[:-1] + volume_diff
+        volume_range = np.array([self.data["basin_volume_range"][b] for b in basin_idx])
+        overflow = np.maximum(unclipped_volume - 1, 0) * volume_range # m^3
+        shortage = np.maximum(-unclipped_volume, 0) * volume_range # m^3
+        # MWh which cannot be produced from the missing water (only upstream basins hold turbined water)
+        missing_energy = shortage @ np.array([self.data["rated_alpha"].get(b, 0) for b in basin_idx]) / 3600
+
+        decoupled_volume = results.select(f"basin_volume_{b}" for b in basin_idx).to_numpy()
+        spilled_volume = results.select(f"spilled_volume_{b}" for b in basin_idx).to_numpy()
+        self.sim_results = [
+            results.drop(cs.starts_with("end_basin_volume_")).with_columns(
+                *[pl.Series(f"basin_volume_{b}", volume[:-1, i]) for i, b in enumerate(basin_idx)],
+                *[
+                    pl.Series(f"volume_deviation_{b}", volume[:-1, i] - decoupled_volume[:, i])
+                    for i, b in enumerate(basin_idx)
+                ],
+                *[
+                    pl.Series(f"spilled_volume_{b}", spilled_volume[:, i] + overflow[:, i])
+                    for i, b in enumerate(basin_idx)
+                ],
+                pl.Series("reconciliation_income", -missing_energy * results["market_price"].to_numpy()),
+            )
+        ]
+        self.second_stage_end_basin_volume = pl.DataFrame(
+            {"B": basin_idx, "end_basin_volume": volume[-1]}, schema_overrides={"B": pl.UInt32}
+        )
+        self.start_basin_volume = self.second_stage_end_basin_volume.rename({"end_basin_volume": "start_volume"})
+        log.info(
+            f"Decoupled simulations reconciled: {shortage.sum():.0f} m3 of missing water, "
+            f"{overflow.sum():.0f} m3 of additional spilled water"
+        )
+
+    def extract_optimization_results(self) -> tuple[pl.DataFrame, float, float]:
+        return aggregate_third_stage_optimization_results(
+            optimization_results=pl.concat(self.sim_results, how="diagonal_relaxed"),
+            start_basin_volume=self.first_start_basin_volume,
+            end_basin_volume=self.second_stage_end_basin_volume,
+            rated_alpha=pl.DataFrame(
+                list(self.data["rated_alpha"].items()), schema=["UP_B", "rated_alpha"], orient="row"
+            ).with_columns(c("UP_B").cast(pl.UInt32)),
+            basin_volume_range=pl.DataFrame(
+                list(self.data["basin_volume_range"].items()), schema=["B", "basin_volume_range"], orient="row"
+            ).with_columns(c("B").cast(pl.UInt32)),
+            data_config=self.data_config
+        )
+
+
+def solve_decoupled_sims(
+    data_config: DataConfig,
+    smallflex_input_schema: SmallflexInputSchema,
+    basin_volume_expectation: pl.DataFrame,
+    hydro_power_mask: pl.Expr,
+    timeseries_forecast: pl.DataFrame,
+    timeseries_measurement: pl.DataFrame,
+    sim_indices: list[int],
+) -> tuple[list[pl.DataFrame], list[pl.DataFrame], list[int]]:
+    """
+    Solve a subset of the simulations in decoupled mode, in a worker process. Pyomo abstract models cannot be
+    pickled, so the second stage is built again in the worker.
+
+    Returns:
+        tuple[list[pl.DataFrame], list[pl.DataFrame], list[int]]: Results and end basin volume of each simulation,
+            and simulations whose solution is not optimal.
+    """
+    stochastic_second_stage: StochasticSecondStage = StochasticSecondStage(
+        data_config=data_config,
+        smallflex_input_schema=smallflex_input_schema,
+        basin_volume_expectation=basin_volume_expectation,
+        hydro_power_mask=hydro_power_mask,
+    )
+    stochastic_second_stage.set_timeseries(
+        timeseries_forecast=timeseries_forecast, timeseries_measurement=timeseries_measurement
+    )
+    stochastic_second_stage.solve_decoupled_models(sim_indices=sim_indices)
+    return (
+        stochastic_second_stage.sim_results,
+        stochastic_second_stage.decoupled_end_basin_volume,
+        stochastic_second_stage.non_optimal_solution_idx,
+    )
@@ -0,0 +1,133 @@
+"""
+Screening of battery sizes with a rule based dispatch, before the exact second stage optimization.
+
+The rolling horizon second stage takes minutes per battery size. To explore hundreds of (rated power, capacity)
+pairs, the income of each battery is first estimated with a price threshold arbitrage policy: the battery charges
+when the buying price is below its rolling lower quantile and discharges when the selling price is above its
+rolling upper quantile (same quantiles and window as the second stage, see ``MarketConfig``). Every battery is
+dispatched at once with the vectorized greedy dispatch of ``utility.data_preprocessing.compute_battery_power``.
+
+The dispatch of a battery only depends on its duration (capacity over rated power): at a given duration, the
+income is proportional to the size. Candidates are therefore ranked by income per capacity, which selects the
+durations best suited to the market, and only the best candidates are then optimized with
+``StochasticSecondStage``. The screening income is an estimate used to rank the candidates, not a result: it
+pays the round trip losses of the battery (``battery_efficiency`` on charge and on discharge) but ignores the
+hydropower plants and the ancillary services.
+"""
+from itertools import product
+from typing import Literal
+
+import numpy as np
+import polars as pl
+from polars import col as c
+
+from general_function import generate_log
+
+from pipelines.data_configs import DataConfig
+from utility.data_preprocessing import compute_battery_power
+
+log = generate_log(name=__name__)
+
+# Selling and buying price columns of the market prices of each screened market
+SCREENING_PRICES: dict[str, tuple[str, str]] = {
+    "DA": ("market_price", "market_price"),
+    "Imbalance": ("long_imbalance", "short_imbalance"),
+}
+
+
+def battery_size_name(rated_power: float, capacity: float) -> str:
+    return f"{rated_power:g}MW_{capacity:g}MWh"
+
+
+def battery_candidates(rated_power_list: list[float], duration_list: list[float]) -> pl.DataFrame:
+    """
+    Battery sizes of every pair of rated power (MW) and duration (h).
+
+    Returns:
+        pl.DataFrame: ``battery_size``, ``rated_power``, ``capacity`` and ``duration`` of each candidate.
+    """
+    return pl.DataFrame(
+        [
+            (battery_size_name(rated_power, rated_power * duration), rated_power, rated_power * duration, duration)
+            for rated_power, duration in product(rated_power_list, duration_list)
+        ],
+        schema=["battery_size", "rated_power", "capacity", "duration"], orient="row"
+    ).unique("battery_size", maintain_order=True)
+
+
+def threshold_arbitrage_signal(
+    market_prices: pl.DataFrame, sell_price: str, buy_price: str, data_config: DataConfig
+) -> np.ndarray:
+    """
+    Price threshold arbitrage policy.
+
+    Returns:
+        np.ndarray: 1 when the battery discharges, -1 when it charges and 0 otherwise, for each timestamp.
+    """
+    window_size = data_config.market_price_window_size * 24
+    signal = market_prices.select(
+        pl.when(
+            c(buy_price) <= c(buy_price).rolling_quantile(
+                quantile=data_config.market_price_lower_quantile, window_size=window_size, min_samples=1
+            )
+        ).then(-1)
+        .when(
+            c(sell_price) >= c(sell_price).rolling_quantile(
+                quantile=data_config.market_price_upper_quantile, window_size=window_size, min_samples=1
+            )
+        ).then(1)
+        .otherwise(0)
+        .alias("signal")
+    )["signal"]
+    return signal.fill_null(0).to_numpy()
+
+
+def screen_battery_sizes(
+    market_prices: pl.DataFrame,
+    candidates: pl.DataFrame,
+    market: Literal["DA", "Imbalance"],
+    data_config: DataConfig,
+) -> pl.DataFrame:
+    """
+    Estimate the arbitrage income of every battery candidate on a market.
+
+    Args:
+        market_prices (pl.DataFrame): Hourly market prices (see ``process_market_prices_data``).
+        candidates (pl.DataFrame): Battery candidates (see ``battery_candidates``).
+        market (Literal["DA", "Imbalance"]): Screened market.
+        data_config (DataConfig): Configuration (price quantiles, battery efficiency and start state of charge).
+
+    Returns:
+        pl.DataFrame: Candidates with their estimated ``income`` (CHF), net of the round trip losses, and
+            ``income_per_capacity`` (CHF/MWh), sorted by decreasing income per capacity then decreasing income.
+    """
+    if market not in SCREENING_PRICES:
+        raise ValueError(f"Battery screening is not available for market {market}.")
+    sell_price, buy_price = SCREENING_PRICES[market]
+    market_prices = market_prices.sort("timestamp").with_columns(
+        c(sell_price, buy_price).fill_null(strategy="forward").fill_null(0)
+    )
+    signal = threshold_arbitrage_signal(
+        market_prices=market_prices, sell_price=sell_price, buy_price=buy_price, data_config=data_config
+    )
+    rated_power = candidates["rated_power"].to_numpy()
+    # compute_battery_power discharges the battery for a positive power difference
+    battery_power, _ = compute_battery_power(
+        power_difference=signal[:, None] * rated_power[None, :],
+        battery_rated_power=rated_power,
+        battery_rated_capacity=candidates["capacity"].to_numpy(),
+        battery_efficiency=data_config.battery_efficiency,
+        start_soc=data_config.start_battery_soc,
+    )
+    # Battery power is positive when charging. compute_battery_power gives the stored energy times the efficiency
+    # when charging and divided by the efficiency when discharging: the energy bought and sold on the market are
+    # respectively divided and multiplied by the efficiency squared, so that the round trip losses are paid.
+    efficiency_squared = data_config.battery_efficiency ** 2
+    income = (
+        market_prices[sell_price].to_numpy() @ (-battery_power.clip(max=0)) * efficiency_squared
+        - market_prices[buy_price].to_numpy() @ battery_power.clip(min=0) / efficiency_squared
+    )
+    log.info(f"{candidates.height} battery sizes screened on {market} market")
+    return candidates.with_columns(pl.Series("income", income))\
+        .with_columns((c("income") / c("capacity")).round(6).alias("income_per_capacity"))\
+        .sort("income_per_capacity", "income", descending=True)
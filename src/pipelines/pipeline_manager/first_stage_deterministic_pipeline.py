@@ -1,7 +1,7 @@
 
+from typing import TYPE_CHECKING
 import polars as pl
 from general_function import pl_to_dict
-import plotly.graph_objs as go
 from typing_extensions import Optional
 
 from smallflex_data_schema import SmallflexInputSchema
@@ -12,7 +12,8 @@ from pipelines.result_manager import extract_first_stage_optimization_results, e
 
 from timeseries_preparation.deterministic_data import process_timeseries_data
 
-from data_display.baseline_plots import plot_first_stage_result
+if TYPE_CHECKING:
+    import plotly.graph_objs as go
 
 
 def first_stage_deterministic_pipeline(
@@ -20,8 +21,8 @@ def first_stage_deterministic_pipeline(
     smallflex_input_schema: SmallflexInputSchema,
     hydro_power_mask: pl.Expr,
     plot_result: bool = False,
-    fig: Optional[go.Figure] = None
-) -> tuple[pl.DataFrame, pl.DataFrame, Optional[go.Figure]]:
+    fig: Optional["go.Figure"] = None
+) -> tuple[pl.DataFrame, pl.DataFrame, Optional["go.Figure"]]:
 
     deterministic_first_stage: DeterministicFirstStage = DeterministicFirstStage(
         data_config=data_config,
@@ -50,6 +51,7 @@ def first_stage_deterministic_pipeline(
             data_config=data_config
         )
     if plot_result:
+        from data_display.baseline_plots import plot_first_stage_result
         fig = plot_first_stage_result(
             fig=fig,
             results=optimization_results, 
@@ -1,8 +1,6 @@
-
-from matplotlib.figure import Figure
+from typing import TYPE_CHECKING
 import polars as pl
 from general_function import pl_to_dict
-import plotly.graph_objs as go
 from typing_extensions import Optional
 
 from smallflex_data_schema import SmallflexInputSchema
@@ -13,7 +11,8 @@ from pipelines.result_manager import extract_first_stage_optimization_results, e
 
 from timeseries_preparation.first_stage_stochastic_data import process_first_stage_timeseries_data
 
-from data_display.baseline_plots import plot_scenario_results, plot_second_stage_result
+if TYPE_CHECKING:
+    import plotly.graph_objs as go
 
 
 def first_stage_stochastic_pipeline(
@@ -22,7 +21,7 @@ def first_stage_stochastic_pipeline(
     hydro_power_mask: pl.Expr,
     plot_result: bool = False,
     custom_market_prices: Optional[pl.DataFrame] = None,
-) -> tuple[pl.DataFrame, pl.DataFrame, Optional[go.Figure]]:
+) -> tuple[pl.DataFrame, pl.DataFrame, Optional["go.Figure"]]:
 
     stochastic_first_stage: StochasticFirstStage = StochasticFirstStage(
         data_config=data_config,
@@ -42,7 +41,8 @@ def first_stage_stochastic_pipeline(
             
     optimization_results = extract_first_stage_optimization_results(
         model_instance=stochastic_first_stage.model_instance,
-        timeseries=stochastic_first_stage.timeseries
+        timeseries=stochastic_first_stage.timeseries,
+        scenario_cube=stochastic_first_stage.scenario_cube
     )
     
     basin_volume_expectation = extract_basin_volume_expectation(
@@ -52,6 +52,7 @@ def first_stage_stochastic_pipeline(
         data_config=data_config
     )
     if plot_result:
+        from data_display.baseline_plots import plot_scenario_results
         fig = plot_scenario_results(
             optimization_results=optimization_results, 
             water_basin=stochastic_first_stage.upstream_water_basin,
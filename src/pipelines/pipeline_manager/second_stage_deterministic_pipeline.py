@@ -1,19 +1,18 @@
 
+from typing import TYPE_CHECKING
 import polars as pl
 from typing_extensions import Optional
 from general_function import pl_to_dict
-import plotly.graph_objs as go
 
 from smallflex_data_schema import SmallflexInputSchema
 from pipelines.data_configs import DataConfig
 from pipelines.model_manager.deterministic_second_stage import DeterministicSecondStage
 
-from pipelines.result_manager import extract_second_stage_optimization_results
-
 
 from timeseries_preparation.deterministic_data import process_timeseries_data
 
-from data_display.baseline_plots import plot_second_stage_result
+if TYPE_CHECKING:
+    import plotly.graph_objs as go
 
 
 def second_stage_deterministic_pipeline(
@@ -25,7 +24,7 @@ def second_stage_deterministic_pipeline(
     wind_power_mask: Optional[pl.Expr] = None,
     display_battery: bool = False,
     plot_result: bool = False,
-) -> tuple[pl.DataFrame, float, Optional[go.Figure]]:
+) -> tuple[pl.DataFrame, float, Optional["go.Figure"]]:
 
     deterministic_second_stage: DeterministicSecondStage = DeterministicSecondStage(
         data_config=data_config,
@@ -45,14 +44,9 @@ def second_stage_deterministic_pipeline(
 
     deterministic_second_stage.solve_every_models()
 
-    optimization_results, adjusted_income = (
-            extract_second_stage_optimization_results(
-                model_instances=deterministic_second_stage.model_instances,
-                timeseries=deterministic_second_stage.timeseries,
-                data_config=data_config
-            )
-        )
+    optimization_results, adjusted_income = deterministic_second_stage.extract_optimization_results()
     if plot_result:
+        from data_display.baseline_plots import plot_second_stage_result
         fig = plot_second_stage_result(
             results=optimization_results,
             water_basin=deterministic_second_stage.water_basin,
@@ -64,4 +58,41 @@ def second_stage_deterministic_pipeline(
     else:
         fig = None
 
-    return optimization_results, adjusted_income, fig
\ No newline at end of file
+    return optimization_results, adjusted_income, fig
+
+def second_stage_deterministic_sweep(
+    data_configs: list[DataConfig],
+    smallflex_input_schema: SmallflexInputSchema,
+    basin_volume_expectations: list[pl.DataFrame],
+    hydro_power_mask: pl.Expr,
+    pv_power_mask: Optional[pl.Expr] = None,
+    wind_power_mask: Optional[pl.Expr] = None,
+) -> list[tuple[pl.DataFrame, float, None]]:
+    """
+    Deterministic second stage of several configurations which only differ by ``SWEEP_FIELDS``, solved as one
+    parametric sweep (see ``DeterministicSecondStage.solve_parametric_sweep``).
+
+    Returns:
+        list[tuple[pl.DataFrame, float, None]]: Optimization results and adjusted income of every configuration,
+            in the order of ``data_configs`` (same outputs as ``second_stage_deterministic_pipeline``, without plot).
+    """
+    deterministic_second_stage: DeterministicSecondStage = DeterministicSecondStage(
+        data_config=data_configs[0],
+        smallflex_input_schema=smallflex_input_schema,
+        hydro_power_mask=hydro_power_mask
+    )
+
+    timeseries = process_timeseries_data(
+        smallflex_input_schema=smallflex_input_schema,
+        data_config=data_configs[0],
+        basin_index_mapping=pl_to_dict(deterministic_second_stage.water_basin["uuid", "B"]),
+        pv_power_mask=pv_power_mask,
+        wind_power_mask=wind_power_mask,
+    )
+    deterministic_second_stage.set_timeseries(
+        timeseries=timeseries, basin_volume_expectation=basin_volume_expectations[0]
+    )
+    variants = deterministic_second_stage.solve_parametric_sweep(
+        data_configs=data_configs, basin_volume_expectations=basin_volume_expectations
+    )
+    return [(*variant.extract_optimization_results(), None) for variant in variants]
@@ -1,20 +1,21 @@
-
+import multiprocessing
+from functools import partial
 import polars as pl
+from typing import Any, TYPE_CHECKING
 from typing_extensions import Optional
 from general_function import pl_to_dict
-import plotly.graph_objs as go
 
 from smallflex_data_schema import SmallflexInputSchema
 from utility.data_preprocessing import (print_pl)   
+from utility.result_store import write_plot_inputs
 from pipelines.data_configs import DataConfig
-from pipelines.model_manager.stochastic_second_stage import StochasticSecondStage
-
-from pipelines.result_manager import extract_third_stage_optimization_results
+from pipelines.model_manager.stochastic_second_stage import StochasticSecondStage, solve_decoupled_sims
 
 
 from timeseries_preparation.second_stage_stochastic_data import process_second_stage_timeseries_stochastic_data
 
-from data_display.baseline_plots import plot_second_stage_result
+if TYPE_CHECKING:
+    import plotly.graph_objs as go
 
 
 def second_stage_stochastic_pipeline(
@@ -24,7 +25,16 @@ def second_stage_stochastic_pipeline(
     hydro_power_mask: pl.Expr,
     custom_market_prices: Optional[pl.DataFrame] = None,
     plot_result: bool = False,
-) -> tuple[pl.DataFrame, float, Optional[go.Figure]]:
+    checkpoint_file: Optional[str] = None,
+    resume_from: Optional[str] = None,
+    plot_inputs: Optional[dict[str, Any]] = None,
+) -> tuple[pl.DataFrame, float, Optional["go.Figure"]]:
+    """
+    Solve the stochastic second stage of one scenario.
+
+    ``plot_inputs`` gives the result store partition (``store_folder``, ``study``, ``scenario``, ``year``) where
+    the tables needed to plot the results later are written, when the figure is not generated inline.
+    """
 
 
     stochastic_second_stage : StochasticSecondStage = StochasticSecondStage(
@@ -44,15 +54,22 @@ def second_stage_stochastic_pipeline(
 
     stochastic_second_stage.set_timeseries(timeseries_forecast=timeseries_forecast, timeseries_measurement=timeseries_measurement)
 
-    stochastic_second_stage.solve_every_models()
+    if data_config.decoupled_days:
+        solve_decoupled_second_stage(
+            stochastic_second_stage=stochastic_second_stage,
+            data_config=data_config,
+            smallflex_input_schema=smallflex_input_schema,
+            basin_volume_expectation=basin_volume_expectation,
+            hydro_power_mask=hydro_power_mask,
+            timeseries_forecast=timeseries_forecast,
+            timeseries_measurement=timeseries_measurement,
+        )
+    else:
+        stochastic_second_stage.solve_every_models(checkpoint_file=checkpoint_file, resume_from=resume_from)
 
-    optimization_results, adjusted_income, imbalance_penalty = extract_third_stage_optimization_results(
-        second_stage_model_instances=stochastic_second_stage.second_stage_model_instances,
-        third_stage_model_instances=stochastic_second_stage.third_stage_model_instances,
-        timeseries=stochastic_second_stage.timeseries_measurement,
-        data_config=data_config
-    )
+    optimization_results, adjusted_income, imbalance_penalty = stochastic_second_stage.extract_optimization_results()
     if plot_result:
+        from data_display.baseline_plots import plot_second_stage_result
         fig = plot_second_stage_result(
             results=optimization_results,
             water_basin=stochastic_second_stage.water_basin,
@@ -62,4 +79,52 @@ def second_stage_stochastic_pipeline(
     else:
         fig = None
 
-    return optimization_results, adjusted_income, fig
\ No newline at end of file
+    if plot_inputs is not None:
+        write_plot_inputs(
+            **plot_inputs,
+            water_basin=stochastic_second_stage.water_basin,
+            basin_volume_expectation=stochastic_second_stage.basin_volume_expectation,
+        )
+
+    return optimization_results, adjusted_income, fig
+
+
+def solve_decoupled_second_stage(
+    stochastic_second_stage: StochasticSecondStage,
+    data_config: DataConfig,
+    smallflex_input_schema: SmallflexInputSchema,
+    basin_volume_expectation: pl.DataFrame,
+    hydro_power_mask: pl.Expr,
+    timeseries_forecast: pl.DataFrame,
+    timeseries_measurement: pl.DataFrame,
+) -> None:
+    """
+    Solve every simulation of the second stage in decoupled mode and reconcile the basin volumes.
+
+    With several workers, the simulations are split between the worker processes. Days of every season are given
+    to each worker so they take about the same time. In a worker process (i.e. a node of the study runner), the
+    simulations are solved in the current process since the other workers already use the thread budget.
+    """
+    nb_sims: int = stochastic_second_stage.nb_sims
+    if data_config.nb_workers > 1 and multiprocessing.parent_process() is None:
+        solve_sims = partial(
+            solve_decoupled_sims,
+            data_config,
+            smallflex_input_schema,
+            basin_volume_expectation,
+            hydro_power_mask,
+            timeseries_forecast,
+            timeseries_measurement,
+        )
+        sim_chunks: list[list[int]] = [
+            list(range(worker, nb_sims, data_config.nb_workers)) for worker in range(data_config.nb_workers)
+        ]
+        with data_config.worker_pool() as executor:
+            for sim_results, end_basin_volume, non_optimal_solution_idx in executor.map(solve_sims, sim_chunks):
+                stochastic_second_stage.sim_results.extend(sim_results)
+                stochastic_second_stage.decoupled_end_basin_volume.extend(end_basin_volume)
+                stochastic_second_stage.non_optimal_solution_idx.extend(non_optimal_solution_idx)
+    else:
+        stochastic_second_stage.solve_decoupled_models()
+
+    stochastic_second_stage.reconcile_decoupled_results()
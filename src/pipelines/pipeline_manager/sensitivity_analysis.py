@@ -0,0 +1,271 @@
+import copy
+from itertools import product
+from typing import Any, Optional
+import polars as pl
+from tqdm.auto import tqdm
+
+from general_function import build_non_existing_dirs
+
+from pipelines.data_configs import DataConfig, SECOND_STAGE_FIELDS, SWEEP_FIELDS
+from pipelines.study_runner import StudyRunner, StudyNode, config_hash
+from pipelines.pipeline_manager.vpp_design_scheme import HYDROPOWER_MASK
+from pipelines.pipeline_manager.second_stage_deterministic_pipeline import (
+    second_stage_deterministic_pipeline, second_stage_deterministic_sweep
+)
+from pipelines.pipeline_manager.study_tasks import (
+    load_input_schema,
+    first_stage_timeseries_task,
+    first_stage_task,
+    basin_volume_expectation_task,
+    summarize_sensitivity_task,
+)
+
+from utility.data_preprocessing import print_pl
+from utility.result_store import StudyResultWriter
+
+from config import settings
+
+
+def add_sensitivity_year(
+    runner: StudyRunner,
+    data_config: DataConfig,
+    analysis_name: str,
+    variants: dict[Any, dict[str, Any]],
+    col_name: str,
+    year: int,
+    hydro_list: list[str],
+    input_node: str,
+    parametric_sweep: bool = False,
+) -> str:
+    """
+    Add the nodes of one year of a sensitivity analysis to the study graph. Each hydro power mask gets one
+    first stage, shared by every variant of the configuration. With ``parametric_sweep``, the second stages of
+    every variant of a hydro power mask are solved by one ``second_stage_deterministic_sweep`` node.
+
+    Returns:
+        str: Name of the node summarizing the year results.
+    """
+    data_config = copy.deepcopy(data_config)
+    data_config.year = year
+
+    first_stage_nodes: list[str] = []
+    basin_volume_expectation_nodes: list[str] = []
+    second_stage_nodes: list[str] = []
+    for hydro_power_mask in hydro_list:
+        sweep_configs: list[DataConfig] = []
+        sweep_expectation_nodes: list[str] = []
+        sweep_metadata: list[dict[str, Any]] = []
+        timeseries_node = runner.add_node(
+            f"{year}_first_stage_timeseries_{hydro_power_mask}", first_stage_timeseries_task,
+            inputs={"smallflex_input_schema": input_node}, ignored_fields=SECOND_STAGE_FIELDS,
+            data_config=data_config, hydro_power_mask=HYDROPOWER_MASK[hydro_power_mask],
+        )
+        first_stage_node = runner.add_node(
+            f"{year}_first_stage_{hydro_power_mask}", first_stage_task,
+            inputs={"smallflex_input_schema": input_node, "timeseries": timeseries_node},
+            ignored_fields=SECOND_STAGE_FIELDS,
+            data_config=data_config, hydro_power_mask=HYDROPOWER_MASK[hydro_power_mask],
+        )
+        first_stage_nodes.append(first_stage_node)
+
+        for variant, config_values in variants.items():
+            scenario_name = "_".join([hydro_power_mask, str(variant)])
+            variant_config = copy.deepcopy(data_config)
+            for config_field, value in config_values.items():
+                setattr(variant_config, config_field, value)
+
+            basin_volume_expectation_node = runner.add_node(
+                f"{year}_basin_volume_expectation_{scenario_name}", basin_volume_expectation_task,
+                inputs={"first_stage_result": first_stage_node}, data_config=variant_config,
+            )
+            basin_volume_expectation_nodes.append(basin_volume_expectation_node)
+            metadata: dict[str, Any] = {
+                "hydro_power_mask": hydro_power_mask, col_name: variant, "year": year,
+                "config_hash": config_hash(variant_config),
+            }
+            if parametric_sweep:
+                sweep_configs.append(variant_config)
+                sweep_expectation_nodes.append(basin_volume_expectation_node)
+                sweep_metadata.append(metadata)
+                continue
+            second_stage_nodes.append(runner.add_node(
+                f"{year}_second_stage_{scenario_name}", second_stage_deterministic_pipeline,
+                inputs={
+                    "smallflex_input_schema": input_node,
+                    "basin_volume_expectation": basin_volume_expectation_node
+                },
+                data_config=variant_config, hydro_power_mask=HYDROPOWER_MASK[hydro_power_mask],
+                metadata=metadata,
+            ))
+
+        if parametric_sweep:
+            second_stage_nodes.append(runner.add_node(
+                f"{year}_second_stage_sweep_{hydro_power_mask}", second_stage_deterministic_sweep,
+                inputs={
+                    "smallflex_input_schema": input_node,
+                    "basin_volume_expectations": sweep_expectation_nodes
+                },
+                data_configs=sweep_configs, hydro_power_mask=HYDROPOWER_MASK[hydro_power_mask],
+                metadata={"variants": sweep_metadata},
+            ))
+
+    return runner.add_node(
+        f"{year}_export", summarize_sensitivity_task,
+        inputs={
+            "second_stage_results": second_stage_nodes,
+            "first_stage_results": first_stage_nodes,
+            "basin_volume_expectations": basin_volume_expectation_nodes,
+        },
+        hydro_list=hydro_list, variant_list=list(variants.keys()), col_name=col_name,
+    )
+
+
+def write_sensitivity_output(writer: StudyResultWriter, node: StudyNode, output: Any) -> Any:
+    """
+    ``on_output`` callback of the sensitivity studies. The second stage optimization results are appended to
+    the DuckDB file of the year as soon as they are computed and only their income is kept in memory.
+    """
+    if node.func is second_stage_deterministic_pipeline:
+        optimization_results, adjusted_income, fig = output
+        writer.append(table_name="second_stage_results", results=optimization_results, **node.metadata)
+        return None, adjusted_income, fig
+    if node.func is second_stage_deterministic_sweep:
+        sweep_output: list = []
+        for (optimization_results, adjusted_income, fig), metadata in zip(output, node.metadata["variants"]):
+            writer.append(table_name="second_stage_results", results=optimization_results, **metadata)
+            sweep_output.append((None, adjusted_income, fig))
+        return sweep_output
+    if node.func is summarize_sensitivity_task:
+        result_percent, results_data = output
+        for table_name, table in results_data.items():
+            writer.write_table(table_name=table_name, data=table)
+        return result_percent
+    return output
+
+
+def run_year(runner: StudyRunner, export_node: str, file_path: str) -> pl.DataFrame:
+    with StudyResultWriter(file_path) as writer:
+        return runner.run(
+            targets=[export_node], on_output=lambda node, output: write_sensitivity_output(writer, node, output)
+        )[export_node]
+
+
+def run_sensitivity_year(
+    data_config: DataConfig,
+    analysis_name: str,
+    variants: dict[Any, dict[str, Any]],
+    col_name: str,
+    year: int,
+    hydro_list: list[str],
+    parametric_sweep: bool = False,
+) -> pl.DataFrame:
+    """
+    Run one year of a sensitivity analysis in the current process. Used as task of the year-parallel mode, the
+    input schema is memory-mapped from the Arrow IPC files exported before starting the workers.
+
+    Returns:
+        pl.DataFrame: Relative adjusted income of every variant for the year.
+    """
+    runner = StudyRunner(nb_workers=1)
+    input_node = runner.add_node(
+        "smallflex_input_schema", load_input_schema, file_path=settings.input_files.duckdb_input,
+        shared=True,
+    )
+    export_node = add_sensitivity_year(
+        runner=runner, data_config=data_config, analysis_name=analysis_name, variants=variants,
+        col_name=col_name, year=year, hydro_list=hydro_list, input_node=input_node,
+        parametric_sweep=parametric_sweep
+    )
+    return run_year(
+        runner=runner, export_node=export_node,
+        file_path=f"{settings.output_files.output}/{analysis_name}/{year}_results.duckdb"
+    )
+
+
+def sensitivity_analysis(
+    data_config: DataConfig,
+    analysis_name: str,
+    variants: dict[Any, dict[str, Any]],
+    col_name: str,
+    year_list: list[int],
+    hydro_list: Optional[list[str]] = None,
+    parallel_years: bool = False,
+    parametric_sweep: bool = False,
+) -> pl.DataFrame:
+    """
+    Run a sensitivity analysis of the second stage over several years.
+
+    For every year and hydro power mask, the first stage is solved once and its basin volume expectation is
+    used by the second stage of every variant. Independent branches run in parallel when
+    ``data_config.nb_workers`` is greater than one.
+
+    With ``parallel_years``, each year is run as a whole in one of the ``data_config.nb_workers`` worker
+    processes (years are independent, so the sweep takes about the time of the slowest year). Each worker
+    writes its own ``{year}_results.duckdb`` file and the mean result is computed once every year is done.
+
+    With ``parametric_sweep``, the variants (which then can only set ``SWEEP_FIELDS``) of a year and hydro power
+    mask are solved on one persistent second stage instance, whose bound and objective parameters are updated
+    between variants (see ``DeterministicSecondStage.solve_parametric_sweep``).
+
+    The second stage results of every variant are appended to the ``second_stage_results`` table of the year
+    file as soon as they are computed, with the hydro power mask, variant, year and configuration hash columns.
+
+    Args:
+        data_config (DataConfig): Base configuration of the analysis.
+        analysis_name (str): Name of the output folder.
+        variants (dict[Any, dict[str, Any]]): DataConfig fields set for each variant, by variant name.
+        col_name (str): Name of the variant column in the income tables.
+        year_list (list[int]): Years of the analysis.
+        hydro_list (Optional[list[str]]): Keys of HYDROPOWER_MASK. Defaults to the first two masks.
+        parallel_years (bool): Run the years in parallel worker processes. Defaults to False.
+        parametric_sweep (bool): Solve the variants of each year and hydro power mask as one parametric sweep.
+            Defaults to False.
+
+    Returns:
+        pl.DataFrame: Mean over the years of the relative adjusted income of every variant.
+    """
+    if hydro_list is None:
+        hydro_list = list(HYDROPOWER_MASK.keys())[:2]
+    if parametric_sweep:
+        sweep_fields = {config_field for config_values in variants.values() for config_field in config_values}
+        if not sweep_fields.issubset(SWEEP_FIELDS):
+            raise ValueError(
+                f"Parametric sweep variants can only set {SWEEP_FIELDS}, not {sorted(sweep_fields - set(SWEEP_FIELDS))}"
+            )
+    output_folder = f"{settings.output_files.output}/{analysis_name}"
+    build_non_existing_dirs(output_folder)
+
+    mean_result = pl.DataFrame()
+    if parallel_years:
+        # Export the input schema once, the workers then memory-map it instead of reading the DuckDB file
+        load_input_schema(file_path=settings.input_files.duckdb_input, shared=True)
+        with data_config.worker_pool() as executor:
+            futures = [
+                executor.submit(
+                    run_sensitivity_year, data_config=data_config, analysis_name=analysis_name,
+                    variants=variants, col_name=col_name, year=year, hydro_list=hydro_list,
+                    parametric_sweep=parametric_sweep
+                ) for year in year_list
+            ]
+            for future in tqdm(futures, desc="Sensitivity analysis years", position=0):
+                mean_result = mean_result.vstack(future.result())
+    else:
+        runner = StudyRunner(nb_workers=data_config.nb_workers, thread_budget=data_config.thread_budget)
+        input_node = runner.add_node(
+            "smallflex_input_schema", load_input_schema, file_path=settings.input_files.duckdb_input,
+            shared=data_config.nb_workers > 1,
+        )
+        for year in year_list:
+            export_node = add_sensitivity_year(
+                runner=runner, data_config=data_config, analysis_name=analysis_name, variants=variants,
+                col_name=col_name, year=year, hydro_list=hydro_list, input_node=input_node,
+                parametric_sweep=parametric_sweep
+            )
+            mean_result = mean_result.vstack(run_year(
+                runner=runner, export_node=export_node, file_path=f"{output_folder}/{year}_results.duckdb"
+            ))
+
+    mean_result = mean_result.group_by(col_name).agg(pl.all().mean()).sort(col_name)
+    print_pl(mean_result, float_precision=1)
+    mean_result.write_csv(f"{output_folder}/mean_result.csv")
+    return mean_result
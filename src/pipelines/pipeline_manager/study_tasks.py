@@ -0,0 +1,240 @@
+"""
+Nodes of the design and sensitivity study graphs run by ``pipelines.study_runner.StudyRunner``.
+
+The first stage is split in timeseries preparation, optimization and basin volume expectation,
+so that studies which only change the basin volume quantiles reuse the first stage solution.
+Node outputs are sent between processes and therefore only contain polars tables.
+"""
+import os
+import copy
+from typing import Optional
+import polars as pl
+from polars import col as c
+
+from general_function import pl_to_dict
+from smallflex_data_schema import SmallflexInputSchema
+
+from pipelines.data_configs import DataConfig
+from pipelines.pipeline_manager.second_stage_stochastic_pipeline import second_stage_stochastic_pipeline
+from pipelines.model_manager.stochastic_first_stage import StochasticFirstStage
+from pipelines.result_manager import (
+    extract_first_stage_optimization_results, compute_basin_volume_expectation
+)
+from timeseries_preparation.first_stage_stochastic_data import process_first_stage_timeseries_data
+from utility.data_preprocessing import extract_result_table, print_pl
+from utility.resource_manager import compute_thread_budget
+from utility.result_store import write_result_partition
+from utility.shared_schema import ipc_up_to_date, load_shared_input_schema, share_input_schema
+
+
+def load_input_schema(file_path: str, shared: bool = False) -> SmallflexInputSchema:
+    """
+    Load the input schema from the DuckDB file.
+
+    With ``shared``, the tables are exported to memory-mapped Arrow IPC files next to the DuckDB file (again only
+    when the DuckDB file changed), so that the schema is sent to the worker processes without copy.
+    """
+    if not shared:
+        return SmallflexInputSchema().duckdb_to_schema(file_path=file_path)
+    ipc_folder = f"{os.path.splitext(file_path)[0]}_ipc"
+    if ipc_up_to_date(ipc_folder=ipc_folder, source_file=file_path):
+        return load_shared_input_schema(ipc_folder=ipc_folder)
+    return share_input_schema(
+        smallflex_input_schema=SmallflexInputSchema().duckdb_to_schema(file_path=file_path), ipc_folder=ipc_folder
+    )
+
+
+def replace_basin_max_volume(
+    smallflex_input_schema: SmallflexInputSchema, basin_name: str, volume_max: float
+) -> SmallflexInputSchema:
+    water_basin = smallflex_input_schema.water_basin.with_columns(
+        pl.when(c("name") == basin_name)
+        .then(pl.lit(volume_max))
+        .otherwise(c("volume_max"))
+        .alias("volume_max")
+    )
+    return smallflex_input_schema.replace_table(**{"water_basin": water_basin})
+
+
+def first_stage_slots(data_config: DataConfig, nb_first_stages: int) -> int:
+    """
+    Number of worker thread budgets given to each first stage node (``nb_slots`` of ``StudyRunner.add_node``):
+    the workers are shared between the ``nb_first_stages`` first stages, which are solved first.
+    """
+    if data_config.nb_workers <= 1 or data_config.solver_threads is not None:
+        return 1
+    return max(data_config.nb_workers // nb_first_stages, 1)
+
+
+def first_stage_data_config(data_config: DataConfig, nb_first_stages: int) -> DataConfig:
+    """
+    Configuration of the first stage nodes of a study. Their solver uses the threads of ``first_stage_slots``
+    workers. The study runner reserves these slots while a first stage runs, so the second stages which start as
+    soon as their own first stage is solved only use the remaining workers. Explicit solver threads are kept.
+    """
+    data_config = copy.deepcopy(data_config)
+    nb_slots = first_stage_slots(data_config=data_config, nb_first_stages=nb_first_stages)
+    if nb_slots > 1:
+        thread_budget = data_config.thread_budget or compute_thread_budget(nb_workers=data_config.nb_workers)
+        data_config.solver_threads = thread_budget * nb_slots
+        data_config.build_solvers()
+    return data_config
+
+
+def first_stage_timeseries_task(
+    smallflex_input_schema: SmallflexInputSchema,
+    data_config: DataConfig,
+    hydro_power_mask: pl.Expr,
+    custom_market_prices: Optional[pl.DataFrame] = None,
+) -> pl.DataFrame:
+    stochastic_first_stage: StochasticFirstStage = StochasticFirstStage(
+        data_config=data_config,
+        smallflex_input_schema=smallflex_input_schema,
+        hydro_power_mask=hydro_power_mask,
+    )
+    return process_first_stage_timeseries_data(
+        smallflex_input_schema=smallflex_input_schema,
+        data_config=data_config,
+        water_basin_mapping=pl_to_dict(stochastic_first_stage.water_basin["uuid", "B"]),
+        custom_market_prices=custom_market_prices
+    )
+
+
+def first_stage_task(
+    smallflex_input_schema: SmallflexInputSchema,
+    timeseries: pl.DataFrame,
+    data_config: DataConfig,
+    hydro_power_mask: pl.Expr,
+) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame]:
+    """
+    Solve the stochastic first stage.
+
+    Returns:
+        tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame]: First stage optimization results, end basin volume
+            table and upstream water basin table.
+    """
+    stochastic_first_stage: StochasticFirstStage = StochasticFirstStage(
+        data_config=data_config,
+        smallflex_input_schema=smallflex_input_schema,
+        hydro_power_mask=hydro_power_mask,
+    )
+    stochastic_first_stage.set_timeseries(timeseries=timeseries)
+    stochastic_first_stage.solve_model()
+
+    optimization_results = extract_first_stage_optimization_results(
+        model_instance=stochastic_first_stage.model_instance,
+        timeseries=stochastic_first_stage.timeseries,
+        scenario_cube=stochastic_first_stage.scenario_cube
+    )
+    end_basin_volume = extract_result_table(
+        model_instance=stochastic_first_stage.model_instance, var_name="end_basin_volume"
+    )
+    return optimization_results, end_basin_volume, stochastic_first_stage.upstream_water_basin
+
+
+def basin_volume_expectation_task(
+    first_stage_result: tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame], data_config: DataConfig
+) -> pl.DataFrame:
+    optimization_results, end_basin_volume, water_basin = first_stage_result
+    return compute_basin_volume_expectation(
+        end_basin_volume=end_basin_volume,
+        optimization_results=optimization_results,
+        water_basin=water_basin,
+        data_config=data_config
+    )
+
+
+def second_stage_stochastic_task(
+    smallflex_input_schema: SmallflexInputSchema,
+    basin_volume_expectation: pl.DataFrame,
+    data_config: DataConfig,
+    hydro_power_mask: pl.Expr,
+    store_folder: str,
+    study: str,
+    scenario: str,
+    plot_file: Optional[str] = None,
+    deferred_plot: bool = False,
+    custom_market_prices: Optional[pl.DataFrame] = None,
+    checkpoint_file: Optional[str] = None,
+    resume_from: Optional[str] = None,
+) -> float:
+    """
+    Solve the stochastic second stage of one scenario and write its results in the result store (and its plot
+    if ``plot_file`` is given) as soon as it is solved. Only the adjusted income is returned, so the full
+    resolution results are never kept by the study runner.
+
+    With ``deferred_plot``, no figure is generated during the optimization. The tables needed to plot the
+    results are written in the result store instead, to be plotted later by ``plot_study_results``.
+
+    Returns:
+        float: Adjusted income of the scenario.
+    """
+    optimization_results, adjusted_income, fig = second_stage_stochastic_pipeline(
+        data_config=data_config,
+        smallflex_input_schema=smallflex_input_schema,
+        basin_volume_expectation=basin_volume_expectation,
+        hydro_power_mask=hydro_power_mask,
+        custom_market_prices=custom_market_prices,
+        plot_result=plot_file is not None and not deferred_plot,
+        checkpoint_file=checkpoint_file,
+        resume_from=resume_from,
+        plot_inputs=dict(
+            store_folder=store_folder, study=study, scenario=scenario, year=data_config.year
+        ) if deferred_plot else None,
+    )
+    write_result_partition(
+        results=optimization_results, store_folder=store_folder, study=study, scenario=scenario,
+        year=data_config.year
+    )
+    if fig is not None:
+        fig.write_html(plot_file)
+    return adjusted_income
+
+
+def summarize_sensitivity_task(
+    second_stage_results: list[tuple],
+    first_stage_results: list[tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame]],
+    basin_volume_expectations: list[pl.DataFrame],
+    hydro_list: list[str],
+    variant_list: list,
+    col_name: str,
+) -> tuple[pl.DataFrame, dict[str, pl.DataFrame]]:
+    """
+    Summarize the results of one year of a sensitivity analysis.
+
+    The second stage results and basin volume expectations are ordered as ``product(hydro_list, variant_list)``
+    and the first stage results as ``hydro_list``. The second stage results of a parametric sweep are given as
+    one list of variant results per hydro power mask. Only the adjusted income of the second stage results is
+    used, their optimization results are written to the DuckDB file of the year as soon as they are computed.
+
+    Returns:
+        tuple[pl.DataFrame, dict[str, pl.DataFrame]]: Adjusted income of every variant in percent of the best
+            variant of the year, and summary tables of the year by table name.
+    """
+    if second_stage_results and isinstance(second_stage_results[0], list):
+        second_stage_results = [result for sweep_results in second_stage_results for result in sweep_results]
+    results_data: dict[str, pl.DataFrame] = {}
+    income_list: list = []
+    for i, hydro_power_mask in enumerate(hydro_list):
+        first_scenario_name = "_".join([hydro_power_mask, str(variant_list[0])])
+        results_data[f"first_stage_{first_scenario_name}"] = first_stage_results[i][0]
+        for j, variant in enumerate(variant_list):
+            scenario_name = "_".join([hydro_power_mask, str(variant)])
+            _, adjusted_income, _ = second_stage_results[i*len(variant_list) + j]
+            results_data[f"basin_volume_expectation_{scenario_name}"] = \
+                basin_volume_expectations[i*len(variant_list) + j]
+            income_list.append((hydro_power_mask, variant, adjusted_income / 1e3))
+
+    results_data["adjusted_income"] = pl.DataFrame(
+        income_list,
+        schema=["hydro_power_mask", col_name, "adjusted_income"],
+        orient="row",
+    ).pivot(on="hydro_power_mask", index=col_name, values="adjusted_income")
+
+    print_pl(results_data["adjusted_income"], float_precision=0)
+
+    max_val = results_data["adjusted_income"].drop(col_name).to_numpy().max()
+    result_percent = results_data["adjusted_income"].with_columns(
+        pl.all().exclude(col_name)/max_val*100
+    )
+    return result_percent, results_data
@@ -1,5 +1,5 @@
 import os
-
+import copy
 import json
 import numpy as np
 import polars as pl
@@ -11,35 +11,53 @@ from itertools import product
 from tqdm.auto import tqdm
 from typing import Optional, Literal
 
-from general_function import pl_to_dict, build_non_existing_dirs, dict_to_duckdb
+from general_function import pl_to_dict, build_non_existing_dirs, generate_log
+
 
 from smallflex_data_schema import SmallflexInputSchema
-from pipelines.data_configs import DataConfig
+from pipelines.data_configs import DataConfig, SECOND_STAGE_FIELDS
+from pipelines.study_runner import StudyRunner
 from pipelines.model_manager.stochastic_first_stage import StochasticFirstStage
 from pipelines.model_manager.stochastic_second_stage import StochasticSecondStage
 
 from timeseries_preparation.read_custom_file_timeseries import (
     read_and_validate_custom_file,
 )
-
-from data_display.baseline_plots import (
-    plot_scenario_results,
-    plot_second_stage_result,
-    plot_first_stage_result,
+from timeseries_preparation.second_stage_stochastic_data import (
+    process_market_prices_data,
+    process_custom_market_prices_data,
 )
 
+
 from pipelines.pipeline_manager.first_stage_stochastic_pipeline import (
     first_stage_stochastic_pipeline,
 )
 from pipelines.pipeline_manager.second_stage_stochastic_pipeline import (
     second_stage_stochastic_pipeline,
 )
+from pipelines.pipeline_manager.battery_screening import (
+    SCREENING_PRICES,
+    battery_candidates,
+    screen_battery_sizes,
+)
+from pipelines.pipeline_manager.study_tasks import (
+    load_input_schema,
+    first_stage_data_config,
+    first_stage_slots,
+    first_stage_timeseries_task,
+    first_stage_task,
+    basin_volume_expectation_task,
+    second_stage_stochastic_task,
+)
 
 
 from utility.data_preprocessing import print_pl
+from utility.result_store import build_result_views
 
 from config import settings
 
+log = generate_log(name=__name__)
+
 HYDROPOWER_MASK = {
     "DT": c("name").is_in(["Aegina discrete turbine"]),
     "DTP": c("name").is_in(["Aegina discrete turbine", "Aegina pump"]),
@@ -54,6 +72,13 @@ BATTERY_SIZE = {
     "2MW_8MWh": {"rated_power": 2, "capacity": 8},
     "5MW_20MWh": {"rated_power": 5, "capacity": 20},
 }
+# Battery sizes screened on the DA and imbalance markets (see pipelines.pipeline_manager.battery_screening)
+SCREENED_BATTERY_POWER: list[float] = [0.5 * i for i in range(1, 11)] # MW
+SCREENED_BATTERY_DURATION: list[float] = [0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4, 5, 6, 7, 8, 10, 12] # h
+# LP screening: number of best relaxed scenarios of each hydropower and market always solved exactly, and relative
+# margin below the best exact income of the group within which a relaxed income estimate is still solved exactly
+NB_EXACT_RELAXED_SCENARIOS: int = 2
+RELAXED_INCOME_MARGIN: float = 0.05
 
 HYDRO_MARKET_LIST: list = [
     ("DT", "DA"),
@@ -72,24 +97,28 @@ def set_config(
     data_config: DataConfig,
     market: Literal["DA", "FCR", "Imbalance"],
     battery_size,
+    battery_sizes: Optional[dict] = None,
 ) -> DataConfig:
     """
     Sets the configuration for the given market type.
     Parameters:
         data_config (DataConfig): The configuration object to be modified.
         market Literal["DA", "FCR", "Imbalance"]: A list containing the market type, which can be "DA", "FCR", or "Imbalance".
-        battery_size: The key to access battery size information from the BATTERY_SIZE dictionary.
+        battery_size: The key to access battery size information from the battery sizes dictionary.
+        battery_sizes (Optional[dict]): Rated power and capacity of each battery size. Defaults to BATTERY_SIZE.
     Returns:
         DataConfig: The modified configuration object with updated parameters based on the specified market.
     Raises:
         ValueError: If the provided market type is not recognized.
     """
-    
+    if battery_sizes is None:
+        battery_sizes = BATTERY_SIZE
+
     if market == "FCR":
         data_config.with_ancillary = True
         data_config.hydro_participation_to_imbalance = False
-        data_config.battery_rated_power = BATTERY_SIZE[battery_size]["rated_power"]
-        data_config.battery_capacity = BATTERY_SIZE[battery_size]["capacity"]
+        data_config.battery_rated_power = battery_sizes[battery_size]["rated_power"]
+        data_config.battery_capacity = battery_sizes[battery_size]["capacity"]
         data_config.imbalance_battery_rated_power = 0
         data_config.imbalance_battery_capacity = 0
     elif market == "Imbalance":
@@ -97,15 +126,15 @@ def set_config(
         data_config.hydro_participation_to_imbalance = True
         data_config.battery_rated_power = 0
         data_config.battery_capacity = 0
-        data_config.imbalance_battery_rated_power = BATTERY_SIZE[battery_size][
+        data_config.imbalance_battery_rated_power = battery_sizes[battery_size][
             "rated_power"
         ]
-        data_config.imbalance_battery_capacity = BATTERY_SIZE[battery_size]["capacity"]
+        data_config.imbalance_battery_capacity = battery_sizes[battery_size]["capacity"]
     elif market == "DA":
         data_config.with_ancillary = False
         data_config.hydro_participation_to_imbalance = False
-        data_config.battery_rated_power = BATTERY_SIZE[battery_size]["rated_power"]
-        data_config.battery_capacity = BATTERY_SIZE[battery_size]["capacity"]
+        data_config.battery_rated_power = battery_sizes[battery_size]["rated_power"]
+        data_config.battery_capacity = battery_sizes[battery_size]["capacity"]
         data_config.imbalance_battery_rated_power = 0
         data_config.imbalance_battery_capacity = 0
     else:
@@ -115,7 +144,9 @@ def set_config(
 
 def vpp_design_scheme(
     
-    market_price_file_name: str | None = None, design_name: str = "vpp_design_scheme"
+    market_price_file_name: str | None = None, design_name: str = "vpp_design_scheme", nb_workers: int = 1,
+    resume: bool = False, deferred_plot: bool = False, nb_screened_batteries: Optional[int] = None,
+    lp_screening: bool = False
 ) -> None:
     """
     Execute a two-stage stochastic optimization pipeline for Virtual Power Plant (VPP) design.
@@ -123,7 +154,8 @@ def vpp_design_scheme(
     1. Loads input data from DuckDB and optionally custom market prices
     2. Runs first-stage optimization to compute basin volume expectations for different hydropower configurations
     3. Executes second-stage optimization across multiple scenarios with varying hydropower types, markets, and battery sizes
-    4. Aggregates and exports results to CSV and DuckDB formats
+    4. Writes the results of each scenario in the Parquet result store as soon as it is solved, and exports the
+       summarized income to CSV and DuckDB formats
     Parameters
     ----------
     market_price_file_name : str | None, optional
@@ -132,13 +164,34 @@ def vpp_design_scheme(
     design_name : str, optional
         Name identifier for the design scheme. Used to create output and plot folder structures.
         Defaults to "vpp_design_scheme".
+    nb_workers : int, optional
+        Number of worker processes. The first stage of each hydropower configuration is solved once and the
+        second stage scenarios run in parallel. Defaults to 1.
+    resume : bool, optional
+        If True, the second stage of each scenario restarts from its last checkpoint (saved in the
+        checkpoints folder of the output folder) instead of from the first day. Defaults to False.
+    deferred_plot : bool, optional
+        If True, no figure is generated during the optimization. The figures are generated from the result
+        store once every scenario is solved, in parallel, and share one plotly.js file. Defaults to False.
+    nb_screened_batteries : int | None, optional
+        If given, the battery sizes of the DA and imbalance markets are not the BATTERY_SIZE ones but the
+        nb_screened_batteries best sizes of a rule based screening of the SCREENED_BATTERY_POWER and
+        SCREENED_BATTERY_DURATION grid (see ``battery_screening_scenarios``). Defaults to None.
+    lp_screening : bool, optional
+        If True, every scenario is first solved with the binary variables of the second and third stages
+        relaxed (linear programs). The relaxed income estimates the income of each scenario and the exact
+        (mixed integer) second stage is only solved for the scenarios whose estimate can change the best battery
+        size of their hydropower and market (see ``scenarios_to_solve``). The estimates are exported next to the
+        exact incomes. Defaults to False.
     Returns
     -------
     None
         Results are written to disk in the following formats:
         - HTML files: Optimization result plots for each scenario
-        - CSV files: Detailed results and summarized income for each scenario
-        - DuckDB database: Comprehensive results dataset
+        - Parquet files: Detailed results of each scenario, partitioned by study, scenario and year in the
+          result store folder (see ``utility.result_store``)
+        - CSV file: Summarized income
+        - DuckDB database: Summarized income and views over the Parquet files of the study
     Notes
     -----
     - Creates output directories automatically if they don't exist
@@ -161,78 +214,277 @@ def vpp_design_scheme(
     data_config: DataConfig = DataConfig(
         nb_scenarios=200,
         total_scenarios_synthesized=smallflex_input_schema.discharge_volume_synthesized["scenario"].max(),  # type: ignore
+        nb_workers=nb_workers,
     )
     # Create output directories
     output_folder = f"{settings.output_files.output}/{design_name}"
     plot_folder = f"{settings.output_files.results_plot}/{design_name}"
     build_non_existing_dirs(output_folder)
     build_non_existing_dirs(plot_folder)
+
+    battery_sizes: dict[str, dict] = BATTERY_SIZE
+    scenario_list: list[tuple] = SCENARIO_LIST
+    if nb_screened_batteries is not None:
+        battery_sizes, scenario_list = battery_screening_scenarios(
+            smallflex_input_schema=smallflex_input_schema, data_config=data_config,
+            nb_screened_batteries=nb_screened_batteries, output_folder=output_folder,
+            custom_market_prices=custom_market_prices,
+        )
+
+    runner = StudyRunner(nb_workers=data_config.nb_workers, thread_budget=data_config.thread_budget)
+    input_node = runner.add_node(
+        "smallflex_input_schema", load_input_schema, file_path=settings.input_files.duckdb_input,
+        shared=data_config.nb_workers > 1,
+    )
     ####################################################################################################################
     # First stage: compute basin volume expectation for different hydropower masks######################################
     ####################################################################################################################
-    basin_volume_expectation_dict: dict[Literal["DT", "DTP", "CTP"], pl.DataFrame] = {}
+    # The first stages are solved in parallel, each with the threads of first_stage_nb_slots workers, and the second
+    # stages of a hydropower configuration start as soon as its first stage is solved, on the free workers
+    basin_volume_expectation_nodes: dict[str, str] = {}
+    first_stage_config = first_stage_data_config(data_config=data_config, nb_first_stages=len(HYDRO_LIST))
+    first_stage_nb_slots = first_stage_slots(data_config=data_config, nb_first_stages=len(HYDRO_LIST))
 
-    pbar = tqdm(HYDRO_LIST, position=0)
-    for hydro in pbar:
-        pbar.set_description(
-            f"First stage optimization problem with {hydro} hydropower plant"
-        )
-        _, basin_volume_expectation, _ = first_stage_stochastic_pipeline(
-            data_config=data_config,
-            smallflex_input_schema=smallflex_input_schema,
-            hydro_power_mask=HYDROPOWER_MASK[hydro],
-            plot_result=False,
+    for hydro in HYDRO_LIST:
+        timeseries_node = runner.add_node(
+            f"first_stage_timeseries_{hydro}", first_stage_timeseries_task,
+            inputs={"smallflex_input_schema": input_node}, ignored_fields=SECOND_STAGE_FIELDS,
+            data_config=data_config, hydro_power_mask=HYDROPOWER_MASK[hydro],
             custom_market_prices=custom_market_prices,
         )
-        basin_volume_expectation_dict[hydro] = basin_volume_expectation
+        first_stage_node = runner.add_node(
+            f"first_stage_{hydro}", first_stage_task,
+            inputs={"smallflex_input_schema": input_node, "timeseries": timeseries_node},
+            ignored_fields=SECOND_STAGE_FIELDS,
+            data_config=first_stage_config, nb_slots=first_stage_nb_slots, hydro_power_mask=HYDROPOWER_MASK[hydro],
+        )
+        basin_volume_expectation_nodes[hydro] = runner.add_node(
+            f"basin_volume_expectation_{hydro}", basin_volume_expectation_task,
+            inputs={"first_stage_result": first_stage_node}, data_config=data_config,
+        )
 
     ####################################################################################################################
     # Second stage: run optimization for different scenarios############################################################
     ####################################################################################################################
-    results_data: dict[str, pl.DataFrame] = {}
-    income_list: list = []
+    def add_second_stage_node(hydro: str, market: str, battery_size: str, relax_integer: bool = False) -> str:
+        scenario_name = "_".join([hydro, market, battery_size]) + ("_relaxed" if relax_integer else "")
+        scenario_config = set_config(
+            data_config=copy.deepcopy(data_config), market=market, battery_size=battery_size, # type: ignore
+            battery_sizes=battery_sizes,
+        )
+        scenario_config.relax_integer = relax_integer
+        return runner.add_node(
+            f"second_stage_{scenario_name}", second_stage_stochastic_task,
+            inputs={
+                "smallflex_input_schema": input_node,
+                "basin_volume_expectation": basin_volume_expectation_nodes[hydro],
+            },
+            data_config=scenario_config,
+            hydro_power_mask=HYDROPOWER_MASK[hydro],
+            store_folder=settings.output_files.result_store,
+            study=design_name,
+            scenario=scenario_name,
+            plot_file=None if relax_integer else f"{plot_folder}/{scenario_name}_results.html",
+            deferred_plot=deferred_plot and not relax_integer,
+            custom_market_prices=custom_market_prices,
+            checkpoint_file=f"{output_folder}/checkpoints/{scenario_name}.pkl",
+            resume_from=f"{output_folder}/checkpoints/{scenario_name}.pkl" if resume else None,
+        )
+
+    relaxed_nodes: list[str] = []
+    exact_nodes: dict[tuple, str] = {}
+    if lp_screening:
+        relaxed_nodes = [
+            add_second_stage_node(hydro, market, battery_size, relax_integer=True)
+            for hydro, market, battery_size in scenario_list
+        ]
+        relaxed_outputs = runner.run(targets=relaxed_nodes)
+        relaxed_income: dict[tuple, float] = {
+            scenario: relaxed_outputs[node] for scenario, node in zip(scenario_list, relaxed_nodes)
+        }
+        exact_income: dict[tuple, float] = {}
+        # Each round solves the scenarios which can still be the best of their group, until none is left
+        while to_solve := scenarios_to_solve(relaxed_income=relaxed_income, exact_income=exact_income):
+            exact_nodes.update({scenario: add_second_stage_node(*scenario) for scenario in to_solve})
+            exact_outputs = runner.run(targets=[exact_nodes[scenario] for scenario in to_solve])
+            exact_income.update({scenario: exact_outputs[exact_nodes[scenario]] for scenario in to_solve})
+        log.info(f"Exact second stage solved for {len(exact_nodes)} of {len(scenario_list)} scenarios")
+        for scenario in scenario_list:
+            if scenario not in exact_nodes:
+                log.info(
+                    f"Scenario {'_'.join(scenario)} pruned: relaxed income estimate "
+                    f"{relaxed_income[scenario] / 1e3:.0f} kCHF"
+                )
+    else:
+        exact_nodes = {scenario: add_second_stage_node(*scenario) for scenario in scenario_list}
+
+    exact_scenario_list: list[tuple] = [scenario for scenario in scenario_list if scenario in exact_nodes]
+
+    export_node = runner.add_node(
+        "export", export_vpp_design_results,
+        inputs={
+            "adjusted_incomes": [exact_nodes[scenario] for scenario in exact_scenario_list],
+            "relaxed_incomes": relaxed_nodes,
+        },
+        scenario_list=exact_scenario_list, output_folder=output_folder,
+        store_folder=settings.output_files.result_store, study=design_name,
+        relaxed_scenario_list=scenario_list if lp_screening else None,
+    )
+    runner.run(targets=[export_node])
 
-    pbar = tqdm(SCENARIO_LIST, position=0)
-    for hydro, market, battery_size in pbar:
-        pbar.set_description(
-            f"second stage optimization with {hydro} hydro and {market} market {battery_size} battery"
+    if deferred_plot:
+        from data_display.deferred_plots import plot_study_results
+        plot_study_results(
+            store_folder=settings.output_files.result_store, study=design_name, year=data_config.year,
+            plot_folder=plot_folder, nb_workers=data_config.nb_workers,
+            scenario_list=["_".join(scenario) for scenario in exact_scenario_list],
         )
-        scenario_name = "_".join([hydro, market, battery_size])
 
-        data_config: DataConfig = set_config(
-            data_config=data_config, market=market, battery_size=battery_size
+
+def battery_screening_scenarios(
+    smallflex_input_schema: SmallflexInputSchema,
+    data_config: DataConfig,
+    nb_screened_batteries: int,
+    output_folder: str,
+    custom_market_prices: Optional[pl.DataFrame] = None,
+) -> tuple[dict[str, dict], list[tuple]]:
+    """
+    Select the battery sizes of the second stage scenarios with the battery screening. The DA and imbalance
+    markets keep the best size of each of the nb_screened_batteries best durations of the screening (and the
+    scenario without battery), the other markets keep the BATTERY_SIZE sizes. The screening income of every
+    candidate, net of the round trip losses, is written in ``battery_screening_{market}.csv``.
+
+    Returns:
+        tuple[dict[str, dict], list[tuple]]: Rated power and capacity of each battery size and scenario list.
+    """
+    if custom_market_prices is None:
+        market_prices = process_market_prices_data(
+            smallflex_input_schema=smallflex_input_schema, data_config=data_config
+        )
+    else:
+        market_prices = process_custom_market_prices_data(
+            custom_market_prices=custom_market_prices, data_config=data_config
         )
+    candidates = battery_candidates(
+        rated_power_list=SCREENED_BATTERY_POWER, duration_list=SCREENED_BATTERY_DURATION
+    )
 
-        second_stage_optimization_results, adjusted_income, fig = (
-            second_stage_stochastic_pipeline(
-                data_config=data_config,
-                smallflex_input_schema=smallflex_input_schema,
-                basin_volume_expectation=basin_volume_expectation,
-                hydro_power_mask=HYDROPOWER_MASK[hydro],
-                plot_result=True,
-                custom_market_prices=custom_market_prices,
-            )
+    battery_sizes: dict[str, dict] = dict(BATTERY_SIZE)
+    screened_sizes: dict[str, list[str]] = {}
+    for market in SCREENING_PRICES:
+        screening = screen_battery_sizes(
+            market_prices=market_prices, candidates=candidates, market=market, data_config=data_config # type: ignore
         )
+        screening.write_csv(f"{output_folder}/battery_screening_{market}.csv")
+        # Sizes of a same duration have the same income per capacity, only the largest one is kept
+        best_candidates = screening.unique("duration", keep="first", maintain_order=True).head(nb_screened_batteries)
+        battery_sizes.update({
+            battery_size: {"rated_power": rated_power, "capacity": capacity}
+            for battery_size, rated_power, capacity in best_candidates.select(
+                "battery_size", "rated_power", "capacity"
+            ).iter_rows()
+        })
+        screened_sizes[market] = ["0MW"] + best_candidates["battery_size"].to_list()
+
+    scenario_list: list[tuple] = [
+        (hydro, market, battery_size)
+        for hydro, market in HYDRO_MARKET_LIST
+        for battery_size in screened_sizes.get(market, list(BATTERY_SIZE.keys()))
+    ]
+    return battery_sizes, scenario_list
+
+
+def scenarios_to_solve(
+    relaxed_income: dict[tuple, float], exact_income: dict[tuple, float],
+    nb_exact_scenarios: int = NB_EXACT_RELAXED_SCENARIOS, margin: float = RELAXED_INCOME_MARGIN
+) -> list[tuple]:
+    """
+    Scenarios of the LP screening whose exact second stage is still needed to find the best battery size of each
+    hydropower and market.
 
-        income_list.append((hydro + " " + market, battery_size, adjusted_income / 1e3))
+    The relaxed income bounds the exact income of a single simulation, but over the rolling horizon the relaxed and
+    exact simulations start from different basin volumes and battery states of charge: the yearly relaxed income
+    is only an estimate of the exact income, which can be lower. The pruning is therefore conservative. While a
+    (hydro, market) group has no exact income, its ``nb_exact_scenarios`` scenarios with the highest estimates are
+    returned. Then, the other scenarios are returned if their estimate is above the best exact income of the group
+    minus ``margin`` times its absolute value. Calling the function again with the new exact incomes returns the
+    remaining candidates, and an empty list once no estimate can change the best scenario of a group.
 
-        if fig is not None:
-            fig.write_html(f"{plot_folder}/{scenario_name}_results.html")
+    Args:
+        relaxed_income (dict[tuple, float]): Relaxed income of every (hydro, market, battery_size) scenario.
+        exact_income (dict[tuple, float]): Exact income of the scenarios already solved.
+        nb_exact_scenarios (int): Scenarios with the highest estimates solved exactly in each group.
+        margin (float): Relative margin below the best exact income of the group.
+
+    Returns:
+        list[tuple]: Scenarios to solve exactly, in the order of ``relaxed_income``.
+    """
+    groups: dict[tuple, list[tuple]] = {}
+    for scenario in relaxed_income:
+        groups.setdefault(scenario[:2], []).append(scenario)
+
+    to_solve: list[tuple] = []
+    for group in groups.values():
+        best_exact_income = max(
+            (exact_income[scenario] for scenario in group if scenario in exact_income), default=None
+        )
+        if best_exact_income is None:
+            to_solve.extend(
+                sorted(group, key=lambda scenario: relaxed_income[scenario], reverse=True)[:nb_exact_scenarios]
+            )
+        else:
+            threshold = best_exact_income - margin * abs(best_exact_income)
+            to_solve.extend(
+                scenario for scenario in group
+                if scenario not in exact_income and relaxed_income[scenario] > threshold
+            )
+    return [scenario for scenario in relaxed_income if scenario in to_solve]
 
-        results_data[scenario_name] = second_stage_optimization_results
 
-        second_stage_optimization_results.with_columns(
-            c("timestamp").dt.to_string(format="%Y-%m-%d %H:%M:%S").alias("timestamp")
-        ).write_csv(f"{output_folder}/{scenario_name}_results.csv")
+def export_vpp_design_results(
+    adjusted_incomes: list[float], scenario_list: list[tuple], output_folder: str, store_folder: str, study: str,
+    relaxed_incomes: Optional[list[float]] = None, relaxed_scenario_list: Optional[list[tuple]] = None,
+) -> pl.DataFrame:
+    """
+    Write the summarized income of the VPP design scheme and the DuckDB database of the study. The detailed
+    results of each scenario are already in the result store, the database only holds views over them.
+
+    With the LP screening, the relaxed income estimate of every scenario of ``relaxed_scenario_list`` is written
+    next to the adjusted income of the scenarios solved exactly in ``income_estimates_results.csv``.
 
-    results_data["adjusted_income"] = pl.DataFrame(
+    Returns:
+        pl.DataFrame: Adjusted income in kCHF by battery size and market.
+    """
+    income_list: list = [
+        (hydro + " " + market, battery_size, adjusted_income / 1e3)
+        for (hydro, market, battery_size), adjusted_income in zip(scenario_list, adjusted_incomes)
+    ]
+    summarized_income = pl.DataFrame(
         income_list, schema=["market", "battery_size", "adjusted_income"], orient="row"
     ).pivot(on="market", index="battery_size", values="adjusted_income")
 
-    results_data["adjusted_income"].write_csv(
-        f"{output_folder}/summarized_income_results.csv"
-    )
+    summarized_income.write_csv(f"{output_folder}/summarized_income_results.csv")
+
+    print_pl(summarized_income, float_precision=0)
+    summary_tables: dict[str, pl.DataFrame] = {"adjusted_income": summarized_income}
 
-    print_pl(results_data["adjusted_income"], float_precision=0)
+    if relaxed_scenario_list is not None and relaxed_incomes is not None:
+        income_estimates = pl.DataFrame(
+            [
+                (hydro + " " + market, battery_size, relaxed_income / 1e3)
+                for (hydro, market, battery_size), relaxed_income in zip(relaxed_scenario_list, relaxed_incomes)
+            ],
+            schema=["market", "battery_size", "relaxed_income_estimate"], orient="row"
+        ).join(
+            pl.DataFrame(income_list, schema=["market", "battery_size", "adjusted_income"], orient="row"),
+            on=["market", "battery_size"], how="left"
+        ).sort(["market", "relaxed_income_estimate"], descending=[False, True], maintain_order=True)
+        income_estimates.write_csv(f"{output_folder}/income_estimates_results.csv")
+        print_pl(income_estimates, float_precision=0)
+        summary_tables["income_estimates"] = income_estimates
 
-    dict_to_duckdb(results_data, f"{output_folder}/results.duckdb")
+    build_result_views(
+        store_folder=store_folder, study=study, file_path=f"{output_folder}/results.duckdb",
+        summary_tables=summary_tables
+    )
+    return summarized_income
@@ -1,10 +1,13 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import polars as pl
 from polars import col as c
 from polars import selectors as cs
 from datetime import timedelta
 import pyomo.environ as pyo
 from typing import Optional, Literal
-from numpy_function import clipped_cumsum
+from utility.array_kernels import clipped_cumsum
+from utility.scenario_cube import ScenarioCube
 from general_function import pl_to_dict
 from pipelines.data_configs import DataConfig
 from tqdm.auto import tqdm
@@ -15,6 +18,8 @@ from utility.data_preprocessing import (
     pivot_result_table,
 )
 
+# Variables of the stochastic first stage read into the scenario cube
+FIRST_STAGE_CUBE_VARIABLES: list[str] = ["basin_volume", "spilled_volume", "flow", "hydro_power"]
 
 
 def extract_optimization_results(
@@ -66,32 +71,45 @@ def extract_optimization_results(
     return optimization_results
 
 def extract_first_stage_optimization_results(
-    model_instance: pyo.ConcreteModel, timeseries: pl.DataFrame,
+    model_instance: pyo.ConcreteModel, timeseries: pl.DataFrame, scenario_cube: Optional[ScenarioCube] = None
 ) -> pl.DataFrame:
-    optimization_results = timeseries.select(
-        "timestamp", "T", 
-        cs.matches(r"^Ω$"), 
-        cs.contains("market_price")
-    )
-    optimization_results = extract_optimization_results(
-        model_instance=model_instance,
-        optimization_results=optimization_results
-    )
+    """
+    Extract the first stage results. With the scenario cube of a stochastic first stage, the variables are read
+    into the cube arrays (the cube is updated in place) and the result frame is built from the cube, without pivoting the result tables.
+    """
+    if scenario_cube is not None:
+        for var_name in FIRST_STAGE_CUBE_VARIABLES:
+            scenario_cube.add_variable(model_instance=model_instance, var_name=var_name)
+        optimization_results = scenario_cube.to_frame(
+            names=["market_price", "basin_volume", "discharge_volume", "spilled_volume", "flow", "hydro_power"]
+        )
+    else:
+        optimization_results = timeseries.select(
+            "timestamp", "T", 
+            cs.matches(r"^Ω$"), 
+            cs.matches(r"^probability$"),
+            cs.contains("market_price")
+        )
+        optimization_results = extract_optimization_results(
+            model_instance=model_instance,
+            optimization_results=optimization_results
+        )
     optimization_results = optimization_results.with_columns(
         (pl.sum_horizontal(cs.starts_with("hydro_power")) * c("market_price") * 24).alias("da_income"),
     )
     
     return optimization_results
 
-def extract_second_stage_optimization_results(
-    
-    model_instances: dict[int, pyo.ConcreteModel],
+def extract_second_stage_sim_results(
+    model_instance: pyo.ConcreteModel,
     timeseries: pl.DataFrame,
-    data_config: DataConfig
-
-) ->  tuple[pl.DataFrame, float]:
-
-    timeseries = timeseries.select(
+    sim_idx: int
+) -> pl.DataFrame:
+    """
+    Extract the results of one second stage simulation. The instance can cover a longer window than the simulation
+    (rolling horizon look-ahead), only the timestamps of the simulation are kept.
+    """
+    timeseries = timeseries.filter(c("sim_idx") == sim_idx).select(
         "timestamp",
         cs.matches(r"^sim_idx$"),
         cs.matches(r"^T$"),
@@ -100,18 +118,19 @@ def extract_second_stage_optimization_results(
         cs.contains("market_price"),
         cs.contains("imbalance")
     )
-    optimization_results: pl.DataFrame = pl.DataFrame()
+    return extract_optimization_results(
+        model_instance=model_instance,
+        optimization_results=timeseries,
+    )
 
-    for key, model_instance in tqdm(model_instances.items(), desc="Extracting second stage results", leave=False):
-        optimization_results = pl.concat(
-            [
-                optimization_results,
-                extract_optimization_results(
-                    model_instance=model_instance,
-                    optimization_results=timeseries.filter(c("sim_idx") == key),
-                )
-            ], how="diagonal_relaxed",
-        )
+def aggregate_second_stage_optimization_results(
+    optimization_results: pl.DataFrame,
+    start_basin_volume: pl.DataFrame,
+    end_basin_volume: pl.DataFrame,
+    rated_alpha: pl.DataFrame,
+    basin_volume_range: pl.DataFrame,
+    data_config: DataConfig
+) -> tuple[pl.DataFrame, float]:
 
     optimization_results = optimization_results.with_columns(
         (pl.sum_horizontal([
@@ -130,14 +149,6 @@ def extract_second_stage_optimization_results(
     market_price_upper_quantile = optimization_results["market_price"].quantile(0.75)
     market_price_lower_quantile = optimization_results["market_price"].quantile(0.25) # type: ignore
 
-
-    rated_alpha = extract_result_table(list(model_instances.values())[-1], "rated_alpha")
-    end_basin_volume = extract_result_table(list(model_instances.values())[-1], "end_basin_volume")
-    start_basin_volume = extract_result_table(list(model_instances.values())[0], "start_basin_volume")
-    basin_volume_range = extract_result_table(list(model_instances.values())[0], "basin_volume_range")
-    
-
-    
     end_volume_penalty_df = start_basin_volume\
         .join(end_basin_volume, on="B", how="inner")\
         .join(rated_alpha, left_on="B", right_on="UP_B", how="inner")\
@@ -159,15 +170,45 @@ def extract_second_stage_optimization_results(
 
     return optimization_results, adjusted_income
 
-def extract_third_stage_optimization_results(
-    second_stage_model_instances: dict[int, pyo.ConcreteModel],
-    third_stage_model_instances: dict[int, pyo.ConcreteModel],
+def extract_second_stage_optimization_results(
+    
+    model_instances: dict[int, pyo.ConcreteModel],
     timeseries: pl.DataFrame,
     data_config: DataConfig
 
-) ->  tuple[pl.DataFrame, float, float]:
+) ->  tuple[pl.DataFrame, float]:
+
+    optimization_results: pl.DataFrame = pl.DataFrame()
+
+    for key, model_instance in tqdm(model_instances.items(), desc="Extracting second stage results", leave=False):
+        optimization_results = pl.concat(
+            [
+                optimization_results,
+                extract_second_stage_sim_results(
+                    model_instance=model_instance, timeseries=timeseries, sim_idx=key
+                )
+            ], how="diagonal_relaxed",
+        )
+
+    return aggregate_second_stage_optimization_results(
+        optimization_results=optimization_results,
+        start_basin_volume=extract_result_table(list(model_instances.values())[0], "start_basin_volume"),
+        end_basin_volume=extract_result_table(list(model_instances.values())[-1], "end_basin_volume"),
+        rated_alpha=extract_result_table(list(model_instances.values())[-1], "rated_alpha"),
+        basin_volume_range=extract_result_table(list(model_instances.values())[0], "basin_volume_range"),
+        data_config=data_config
+    )
 
-    timeseries = timeseries.select(
+def extract_third_stage_sim_results(
+    second_stage_model_instance: pyo.ConcreteModel,
+    third_stage_model_instance: pyo.ConcreteModel,
+    timeseries: pl.DataFrame,
+    sim_idx: int
+) -> pl.DataFrame:
+    """
+    Extract the results of one simulation of the second and third stages.
+    """
+    timeseries = timeseries.filter(c("sim_idx") == sim_idx).select(
         "timestamp",
         cs.matches(r"^sim_idx$"),
         cs.matches(r"^T$"),
@@ -176,36 +217,35 @@ def extract_third_stage_optimization_results(
         cs.contains("market_price"),
         cs.contains("imbalance")
     )
-    optimization_results: pl.DataFrame = pl.DataFrame()
+    attribute_list= [ 
+        "wind_power", "pv_power", "battery_charging_power", 
+        "battery_discharging_power", "battery_soc", 
+        "hydro_ancillary_reserve", "battery_ancillary_reserve"
+    ]
     
-    for key in tqdm(third_stage_model_instances.keys(), desc="Extracting third stage results", leave=False):
-        
-        attribute_list= [ 
-            "wind_power", "pv_power", "battery_charging_power", 
-            "battery_discharging_power", "battery_soc", 
-            "hydro_ancillary_reserve", "battery_ancillary_reserve"
-        ]
-        
-        second_stage_optimization_result = extract_optimization_results(
-            model_instance=second_stage_model_instances[key],
-            optimization_results=timeseries.filter(c("sim_idx") == key),
-            attribute_list = attribute_list
-        ).rename({
-            "wind_power": "wind_power_forecast",
-            "pv_power": "pv_power_forecast",
-        })
-        third_stage_optimization_result = extract_optimization_results(
-            model_instance=third_stage_model_instances[key],
-            optimization_results=timeseries.filter(c("sim_idx") == key)[["T"]],
-        )
-        
-        new_optimization_results = (
-            second_stage_optimization_result
-            ).join(third_stage_optimization_result, on="T", how="left")
+    second_stage_optimization_result = extract_optimization_results(
+        model_instance=second_stage_model_instance,
+        optimization_results=timeseries,
+        attribute_list = attribute_list
+    ).rename({
+        "wind_power": "wind_power_forecast",
+        "pv_power": "pv_power_forecast",
+    })
+    third_stage_optimization_result = extract_optimization_results(
+        model_instance=third_stage_model_instance,
+        optimization_results=timeseries[["T"]],
+    )
     
-        optimization_results = pl.concat(
-            [optimization_results, new_optimization_results], how="diagonal_relaxed",
-        )
+    return second_stage_optimization_result.join(third_stage_optimization_result, on="T", how="left")
+
+def aggregate_third_stage_optimization_results(
+    optimization_results: pl.DataFrame,
+    start_basin_volume: pl.DataFrame,
+    end_basin_volume: pl.DataFrame,
+    rated_alpha: pl.DataFrame,
+    basin_volume_range: pl.DataFrame,
+    data_config: DataConfig
+) -> tuple[pl.DataFrame, float, float]:
 
     optimization_results = (
         optimization_results
@@ -231,10 +271,6 @@ def extract_third_stage_optimization_results(
     market_price_upper_quantile = optimization_results["market_price"].quantile(0.75)
     market_price_lower_quantile = optimization_results["market_price"].quantile(0.25)
 
-    rated_alpha = extract_result_table(list(second_stage_model_instances.values())[-1], "rated_alpha")
-    end_basin_volume = extract_result_table(list(second_stage_model_instances.values())[-1], "end_basin_volume")
-    start_basin_volume = extract_result_table(list(second_stage_model_instances.values())[0], "start_basin_volume")
-    basin_volume_range = extract_result_table(list(second_stage_model_instances.values())[0], "basin_volume_range")
     end_volume_penalty = start_basin_volume\
         .join(end_basin_volume, on="B", how="inner")\
         .join(rated_alpha, left_on="B", right_on="UP_B", how="inner")\
@@ -254,6 +290,60 @@ def extract_third_stage_optimization_results(
     
     return optimization_results, adjusted_income, imbalance_penalty
 
+def extract_third_stage_optimization_results(
+    second_stage_model_instances: dict[int, pyo.ConcreteModel],
+    third_stage_model_instances: dict[int, pyo.ConcreteModel],
+    timeseries: pl.DataFrame,
+    data_config: DataConfig
+
+) ->  tuple[pl.DataFrame, float, float]:
+
+    optimization_results: pl.DataFrame = pl.DataFrame()
+    
+    for key in tqdm(third_stage_model_instances.keys(), desc="Extracting third stage results", leave=False):
+        optimization_results = pl.concat(
+            [
+                optimization_results,
+                extract_third_stage_sim_results(
+                    second_stage_model_instance=second_stage_model_instances[key],
+                    third_stage_model_instance=third_stage_model_instances[key],
+                    timeseries=timeseries,
+                    sim_idx=key
+                )
+            ], how="diagonal_relaxed",
+        )
+
+    return aggregate_third_stage_optimization_results(
+        optimization_results=optimization_results,
+        start_basin_volume=extract_result_table(list(second_stage_model_instances.values())[0], "start_basin_volume"),
+        end_basin_volume=extract_result_table(list(second_stage_model_instances.values())[-1], "end_basin_volume"),
+        rated_alpha=extract_result_table(list(second_stage_model_instances.values())[-1], "rated_alpha"),
+        basin_volume_range=extract_result_table(list(second_stage_model_instances.values())[0], "basin_volume_range"),
+        data_config=data_config
+    )
+
+def second_stage_volume_deviation(
+    optimization_results: pl.DataFrame, reference_results: pl.DataFrame, basin_idx: list[int]
+) -> pl.DataFrame:
+    """
+    Deviation of the basin volumes of a second stage run from a reference run (i.e. the decoupled mode against the
+    exact sequential run), in ratio of the basin volume range.
+
+    Returns:
+        pl.DataFrame: Mean and maximum absolute deviation and end deviation of the basin volume of each basin.
+    """
+    deviation = optimization_results.select("timestamp", *[f"basin_volume_{b}" for b in basin_idx]).join(
+        reference_results.select("timestamp", *[f"basin_volume_{b}" for b in basin_idx]),
+        on="timestamp", how="inner", suffix="_reference"
+    ).sort("timestamp").select(
+        (c(f"basin_volume_{b}") - c(f"basin_volume_{b}_reference")).alias(str(b)) for b in basin_idx
+    )
+    return deviation.unpivot(variable_name="B", value_name="deviation").group_by("B", maintain_order=True).agg(
+        c("deviation").abs().mean().alias("mean_abs_deviation"),
+        c("deviation").abs().max().alias("max_abs_deviation"),
+        c("deviation").last().alias("end_deviation"),
+    ).with_columns(c("B").cast(pl.UInt32))
+
 def extract_basin_volume(
     optimization_results: pl.DataFrame, 
     water_basin: pl.DataFrame,
@@ -338,107 +428,162 @@ def extract_basin_volume_expectation(
     data_config: DataConfig
 ) -> pl.DataFrame:
 
+    return compute_basin_volume_expectation(
+        end_basin_volume=extract_result_table(model_instance=model_instance, var_name="end_basin_volume"),
+        optimization_results=optimization_results,
+        water_basin=water_basin,
+        data_config=data_config
+    )
 
-    volume_range = pl_to_dict(water_basin["B", "volume_range"])
-    start_volume_mapping = pl_to_dict(water_basin["B", "start_volume"])
-    basin_idx = water_basin["B"].to_list()
-    
-    basin_volume_raw = optimization_results.select(
-        "T", "Ω", cs.contains("basin_volume_"), cs.contains("spilled_volume_")
-        )
 
-    end_basin_volume = extract_result_table(
-            model_instance=model_instance, var_name="end_basin_volume"
-        ).with_columns(
-            pl.lit(optimization_results["T"].max() + 1).alias("T"), # type: ignore
-            ("basin_volume_" + c("B").cast(pl.Utf8)).alias("B")
-        ).pivot(
-            index=["T", "Ω"],
-            on="B",
-            values="end_basin_volume"
-        )
-    basin_volume_raw = pl.concat([basin_volume_raw, end_basin_volume], how="diagonal_relaxed")
-
-    basin_volume_raw = basin_volume_raw.sort(["Ω", "T"]).select(
-            "Ω", "T",
-            *[(
-                (
-                    (c(f"spilled_volume_{col}")/volume_range[col]).shift(1) + 
-                    c(f"basin_volume_{col}").diff().over("Ω")
-                ).fill_null(start_volume_mapping[col])
-                ).alias(f"basin_volume_{col}")
-                for col in basin_idx
-            ]
+def scenario_basin_volume(
+    end_basin_volume: pl.DataFrame,
+    optimization_results: pl.DataFrame,
+    basin_idx: list[int],
+    volume_range: np.ndarray,
+    start_volume: np.ndarray,
+) -> np.ndarray:
+    """
+    Basin volume of every first stage scenario as a (T, Ω, B) array, with the end basin volume as last timestamp.
+    The spilled volume is added back to the volume variations and the cumulated volume is clipped between the
+    empty and the full basin.
+
+    Args:
+        end_basin_volume (pl.DataFrame): ``end_basin_volume`` variable of the first stage (``B``, ``Ω``).
+        optimization_results (pl.DataFrame): First stage results, with every ``T`` of every scenario.
+        basin_idx (list[int]): Basins of the last axis.
+        volume_range (np.ndarray): Volume range of each basin.
+        start_volume (np.ndarray): Start volume of each basin.
+    """
+    cube = ScenarioCube.from_frame(optimization_results, names={"basin_volume": "B", "spilled_volume": "B"})
+    basin_position = np.searchsorted(cube.axes["basin_volume"].to_numpy(), basin_idx)
+
+    spilled_volume = cube.values["spilled_volume"][:, :, basin_position] / volume_range
+    end_volume = end_basin_volume.pivot(on="B", index="Ω", values="end_basin_volume")\
+        .sort("Ω").select([str(b) for b in basin_idx]).to_numpy()
+    basin_volume = np.concatenate([cube.values["basin_volume"][:, :, basin_position], end_volume[None]], axis=0)
+
+    volume_variation = np.empty_like(basin_volume)
+    volume_variation[0] = start_volume
+    volume_variation[1:] = spilled_volume + np.diff(basin_volume, axis=0)
+    return clipped_cumsum(volume_variation, xmin=0, xmax=1)
+
+
+def scenario_statistics(
+    basin_volume: np.ndarray, quantiles: list[float], probability: Optional[np.ndarray] = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Mean and quantiles of a (T, Ω, B) array over the scenarios, computed from one sort of the scenarios.
+
+    The quantiles are nearest rank quantiles (as ``pl.Expr.quantile``). With probability, each sorted scenario is
+    placed at the middle of its cumulated probability interval, and the positions are scaled so that the first and
+    last scenarios are at 0 and 1: uniform probabilities give the positions ``i / (Ω - 1)`` of the unweighted
+    nearest rank, hence the same quantiles.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Mean (T, B) and quantiles (Q, T, B).
+    """
+    order = np.argsort(basin_volume, axis=1)
+    sorted_volume = np.take_along_axis(basin_volume, order, axis=1)
+    quantiles_array = np.array(quantiles)
+    if probability is None:
+        rank = np.floor(quantiles_array * (basin_volume.shape[1] - 1) + 0.5).astype(np.int64)
+        return basin_volume.mean(axis=1), sorted_volume[:, rank, :].transpose(1, 0, 2)
+
+    probability = probability / probability.sum()
+    sorted_probability = probability[order]
+    position = np.cumsum(sorted_probability, axis=1) - sorted_probability / 2
+    # The nearest rank is the number of midpoints between consecutive positions below the quantile position
+    midpoint = (position[:, 1:] + position[:, :-1]) / 2
+    quantile_position = position[None, :, :1] + quantiles_array[:, None, None, None] * (
+        position[None, :, -1:] - position[None, :, :1]
+    )
+    rank = np.sum(midpoint[None] <= quantile_position + 1e-9, axis=2)
+    quantile_volume = np.take_along_axis(sorted_volume[None], rank[:, :, None, :], axis=2)[:, :, 0, :]
+    return np.einsum("tob,o->tb", basin_volume, probability), quantile_volume
+
+
+def centered_rolling_mean(data: np.ndarray, window_size: int = 7) -> np.ndarray:
+    """
+    Centered rolling mean along the first axis. The first and last values are kept and the values without a
+    complete window in between are linearly interpolated.
+    """
+    nb_timestamps = data.shape[0]
+    half_window = window_size // 2
+    known = np.zeros(nb_timestamps, dtype=bool)
+    known[[0, -1]] = True
+    smoothed = data.copy()
+    if nb_timestamps >= window_size:
+        smoothed[half_window: nb_timestamps - half_window] = sliding_window_view(
+            data, window_size, axis=0
+        ).mean(axis=-1)
+        known[half_window: nb_timestamps - half_window] = True
+
+    missing = np.flatnonzero(~known)
+    known_idx = np.flatnonzero(known)
+    right = np.searchsorted(known_idx, missing)
+    left_idx, right_idx = known_idx[right - 1], known_idx[right]
+    weight = ((missing - left_idx) / (right_idx - left_idx)).reshape(-1, *([1] * (data.ndim - 1)))
+    smoothed[missing] = (1 - weight) * smoothed[left_idx] + weight * smoothed[right_idx]
+    return smoothed
+
+
+def compute_basin_volume_expectation(
+    end_basin_volume: pl.DataFrame,
+    optimization_results: pl.DataFrame,
+    water_basin: pl.DataFrame,
+    data_config: DataConfig
+) -> pl.DataFrame:
+    """
+    Expected basin volume (mean and quantiles over the first stage scenarios) smoothed with a 7 days centered
+    rolling mean. Scenarios of a reduced scenario set are weighted by their probability.
+    """
+    water_basin = water_basin.sort("B")
+    basin_idx: list[int] = water_basin["B"].to_list()
+
+    basin_volume = scenario_basin_volume(
+        end_basin_volume=end_basin_volume,
+        optimization_results=optimization_results,
+        basin_idx=basin_idx,
+        volume_range=water_basin["volume_range"].to_numpy(),
+        start_volume=water_basin["start_volume"].to_numpy(),
     )
 
-    if basin_volume_raw.shape[1] == 3:
-        basin_name = basin_volume_raw.drop(["Ω", "T"]).columns[0]
-        basin_volume_raw = basin_volume_raw.pivot(
-            on="Ω", values=cs.starts_with("basin_volume"), index="T",
-        ).select(
-            "T",
-            pl.all().exclude("T").name.prefix(basin_name + "_")
-        )
-    else:
-        basin_volume_raw = basin_volume_raw.pivot(
-            on="Ω", values=cs.starts_with("basin_volume"), index="T",
-        )
+    probability: Optional[np.ndarray] = None
+    if "probability" in optimization_results.columns:
+        probability = optimization_results.filter(c("Ω").is_first_distinct()).sort("Ω")["probability"].to_numpy()
 
-    cleaned_basin_volume = (
-            pl.DataFrame(
-                clipped_cumsum(basin_volume_raw.drop("T").to_numpy(), xmin=0, xmax=1),
-                schema=basin_volume_raw.drop("T").columns,
-            ).with_columns(basin_volume_raw["T"])
-            .unpivot(variable_name="BΩ", value_name=f"basin_volume", index="T")
-            .with_columns(
-                c("BΩ").str.split("_")
-                .list.slice(2).cast(pl.List(pl.UInt32))
-                .list.to_struct(fields=["B", "Ω"])
-            ).unnest("BΩ")
+    quantiles: list[float] = [
+        quantile for basin_volume_quantile in data_config.basin_volume_quantile
+        for quantile in (0.5 - basin_volume_quantile, 0.5 + basin_volume_quantile)
+    ]
+    mean, quantile_volume = scenario_statistics(
+        basin_volume=basin_volume, quantiles=quantiles, probability=probability
     )
-    
-    quantile_columns = [
-        expr
-        for i, (quantile, quantile_min) in 
-        enumerate(zip(data_config.basin_volume_quantile, data_config.basin_volume_quantile_min))
-        for expr in (
-            c("basin_volume").quantile(0.5 - quantile)
-                .clip(upper_bound=c("basin_volume").mean() - quantile_min)
-                .clip(lower_bound=0)
-                .alias(f"lower_quantile_{i}"),
-            c("basin_volume").quantile(0.5 + quantile)
-                .clip(lower_bound=c("basin_volume").mean() + quantile_min)
-                .clip(upper_bound=100)
-                .alias(f"upper_quantile_{i}")
+
+    stat_dict: dict[str, np.ndarray] = {"mean": mean}
+    for i, quantile_min in enumerate(data_config.basin_volume_quantile_min):
+        stat_dict[f"lower_quantile_{i}"] = np.clip(
+            np.minimum(quantile_volume[2 * i], mean - quantile_min), a_min=0, a_max=None
+        )
+        stat_dict[f"upper_quantile_{i}"] = np.clip(
+            np.maximum(quantile_volume[2 * i + 1], mean + quantile_min), a_min=None, a_max=100
         )
-    ]
 
-    stat_volume: pl.DataFrame = cleaned_basin_volume.group_by("T", "B").agg(
-            c("basin_volume").mean().alias("mean"), *quantile_columns
-        ).sort(["B", "T"])
+    # (T, B, statistic) array, reordered by basin then timestamp
+    stat_volume = centered_rolling_mean(np.stack(list(stat_dict.values()), axis=-1))
+    stat_volume = stat_volume.transpose(1, 0, 2).reshape(-1, len(stat_dict))
 
-    col_list = stat_volume.drop(["T", "B"]).columns
-        
-    mean_stat_volume = stat_volume.with_columns(
-            c(col_list).rolling_mean(window_size=7).shift(-3).over("B")
-        )
-    # build missing values at beginning and end
-    mean_stat_volume = mean_stat_volume.join(
-        stat_volume.filter(c("T").is_in([stat_volume["T"].max(), stat_volume["T"].min()])),
-        on=["T", "B"],
-        how="left",
-        suffix="_raw"
-    ).select(
-        "T", "B", 
-        *[
-            pl.coalesce(cs.starts_with(col)).interpolate().alias(col) 
-            for col in col_list
-        ]
-    )
+    t_idx = optimization_results["T"].unique().sort().to_numpy()
+    t_idx = np.append(t_idx, t_idx[-1] + 1)
+    mean_stat_volume = pl.DataFrame({
+        "T": pl.Series(np.tile(t_idx, len(basin_idx))).cast(optimization_results["T"].dtype),
+        "B": pl.Series(np.repeat(basin_idx, len(t_idx))).cast(pl.UInt32),
+        **{name: stat_volume[:, i] for i, name in enumerate(stat_dict)}
+    })
 
     mean_stat_volume = mean_stat_volume.\
         with_columns(
             c("mean").diff().shift(-1).alias("diff_volume")
         )
     return mean_stat_volume
-
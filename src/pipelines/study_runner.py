@@ -0,0 +1,244 @@
+"""
+Dependency-aware runner for design and sensitivity studies.
+
+A study is described as a directed acyclic graph of nodes (input loading, timeseries
+preparation, first stage, basin volume expectation, second/third stage, result export).
+Each node is a function called with configuration keyword arguments and with the outputs
+of its parent nodes.
+
+Every node gets a key computed from the function, its configuration inputs and the keys of
+its parents. Nodes with the same key are computed once and share their output, so a first
+stage shared by many second stage variants is solved only once. Independent branches are
+run in parallel in the worker pool of ``utility.resource_manager``.
+"""
+import copy
+import hashlib
+from dataclasses import dataclass, field, fields, is_dataclass
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from typing import Any, Callable, Optional, Union
+
+import polars as pl
+from tqdm.auto import tqdm
+
+from utility.resource_manager import worker_pool
+
+
+
+@dataclass
+class StudyNode:
+    name: str
+    func: Callable[..., Any]
+    kwargs: dict[str, Any]
+    inputs: dict[str, Union[str, list[str]]] = field(default_factory=dict)
+    metadata: dict[str, Any] = field(default_factory=dict)
+    nb_slots: int = 1
+    key: str = ""
+
+    @property
+    def parents(self) -> list[str]:
+        return [
+            parent for value in self.inputs.values()
+            for parent in (value if isinstance(value, list) else [value])
+        ]
+
+
+def stable_repr(value: Any, ignored_fields: tuple[str, ...] = ()) -> str:
+    """
+    Representation of a configuration input which does not depend on object identity.
+    Dataclass fields listed in ``ignored_fields`` are left out of the representation.
+    """
+    if is_dataclass(value) and not isinstance(value, type):
+        return type(value).__name__ + stable_repr({
+            data_field.name: getattr(value, data_field.name) for data_field in fields(value)
+            if data_field.name not in ignored_fields
+        })
+    if isinstance(value, dict):
+        return "{" + ",".join(
+            f"{stable_repr(key)}:{stable_repr(item, ignored_fields)}"
+            for key, item in sorted(value.items(), key=lambda item: repr(item[0]))
+        ) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(stable_repr(item, ignored_fields) for item in value) + "]"
+    if isinstance(value, pl.DataFrame):
+        return f"DataFrame({value.schema},{value.hash_rows().sum()})"
+    if isinstance(value, pl.Expr):
+        return str(value)
+    return repr(value)
+
+
+def config_hash(value: Any, ignored_fields: tuple[str, ...] = ()) -> str:
+    """Short hash of a configuration input, used to tag the results computed with this configuration."""
+    return hashlib.sha1(stable_repr(value, ignored_fields=ignored_fields).encode()).hexdigest()[:16]
+
+
+def node_key(
+    func: Callable[..., Any], kwargs: dict[str, Any], parent_keys: dict[str, Union[str, list[str]]],
+    ignored_fields: tuple[str, ...] = ()
+    ) -> str:
+    key_repr: str = "|".join([
+        f"{func.__module__}.{func.__qualname__}",
+        stable_repr(kwargs, ignored_fields=ignored_fields),
+        stable_repr(parent_keys),
+    ])
+    return hashlib.sha1(key_repr.encode()).hexdigest()
+
+
+def run_node(func: Callable[..., Any], kwargs: dict[str, Any]) -> Any:
+    return func(**kwargs)
+
+
+class StudyRunner:
+    """
+    Build and run a study graph.
+
+    Args:
+        nb_workers (int): Number of worker processes. With one worker, nodes are run in the current process.
+        thread_budget (Optional[int]): Threads per worker. Defaults to cpu count split between workers.
+
+    Example:
+        >>> runner = StudyRunner(nb_workers=4)
+        >>> inputs = runner.add_node("inputs", load_input_schema, file_path=file_path)
+        >>> first_stage = runner.add_node(
+        ...     "first_stage", first_stage_task, inputs={"smallflex_input_schema": inputs}, data_config=data_config
+        ... )
+        >>> outputs = runner.run()
+    """
+    def __init__(self, nb_workers: int = 1, thread_budget: Optional[int] = None):
+        self.nb_workers: int = nb_workers
+        self.thread_budget: Optional[int] = thread_budget
+        self.nodes: dict[str, StudyNode] = {}
+        # Memoized outputs by node key
+        self.outputs: dict[str, Any] = {}
+
+    def add_node(
+        self, name: str, func: Callable[..., Any], inputs: Optional[dict[str, Union[str, list[str]]]] = None,
+        ignored_fields: tuple[str, ...] = (), metadata: Optional[dict[str, Any]] = None, nb_slots: int = 1,
+        **kwargs
+        ) -> str:
+        """
+        Add a node to the study graph.
+
+        Args:
+            name (str): Unique name of the node.
+            func (Callable): Function run by the node. It must be importable from a module so it can be
+                sent to the worker processes.
+            inputs (Optional[dict]): Mapping from ``func`` argument names to the name (or list of names)
+                of the parent nodes whose outputs are given to this argument.
+            ignored_fields (tuple[str, ...]): Dataclass fields of the configuration inputs which do not
+                change the node output. They are left out of the node key, so that variants which only
+                differ by these fields share the node output.
+            metadata (Optional[dict]): Description of the node given to the ``on_output`` callback of ``run``.
+                It is not part of the node key.
+            nb_slots (int): Number of worker thread budgets used by the node, for a solver given the threads of
+                several workers. In parallel runs, a node is only started when the slots of the running nodes
+                leave room for it, so the machine is not oversubscribed. It is not part of the node key.
+            **kwargs: Configuration inputs given to ``func``. They are copied when the node is added, so the
+                caller can keep modifying its configuration objects.
+
+        Returns:
+            str: The name of the node, used as input of the child nodes.
+        """
+        if name in self.nodes:
+            raise ValueError(f"Node {name} already exists in the study")
+        inputs = inputs if inputs is not None else {}
+        node = StudyNode(
+            name=name, func=func, kwargs=copy.deepcopy(kwargs), inputs=inputs,
+            metadata=metadata if metadata is not None else {}, nb_slots=nb_slots
+        )
+        missing_parents: list[str] = [parent for parent in node.parents if parent not in self.nodes]
+        if missing_parents:
+            raise ValueError(f"Node {name} depends on unknown nodes {missing_parents}")
+
+        parent_keys: dict[str, Union[str, list[str]]] = {
+            arg: [self.nodes[parent].key for parent in value] if isinstance(value, list) else self.nodes[value].key
+            for arg, value in inputs.items()
+        }
+        node.key = node_key(func=func, kwargs=node.kwargs, parent_keys=parent_keys, ignored_fields=ignored_fields)
+        self.nodes[name] = node
+        return name
+
+    def node_kwargs(self, node: StudyNode) -> dict[str, Any]:
+        kwargs: dict[str, Any] = dict(node.kwargs)
+        for arg, value in node.inputs.items():
+            if isinstance(value, list):
+                kwargs[arg] = [self.outputs[self.nodes[parent].key] for parent in value]
+            else:
+                kwargs[arg] = self.outputs[self.nodes[value].key]
+        return kwargs
+
+    def required_nodes(self, targets: list[str]) -> dict[str, StudyNode]:
+        """Nodes needed to compute the targets, one node per key, in insertion (topological) order."""
+        required: set[str] = set()
+        to_visit: list[str] = list(targets)
+        while to_visit:
+            name = to_visit.pop()
+            if name in required:
+                continue
+            required.add(name)
+            to_visit.extend(self.nodes[name].parents)
+
+        nodes_by_key: dict[str, StudyNode] = {}
+        for name, node in self.nodes.items():
+            if name in required and node.key not in self.outputs:
+                nodes_by_key.setdefault(node.key, node)
+        return nodes_by_key
+
+    def run(
+        self, targets: Optional[list[str]] = None, on_output: Optional[Callable[[StudyNode, Any], Any]] = None
+        ) -> dict[str, Any]:
+        """
+        Run the nodes needed to compute the targets. Outputs already computed by a previous run are reused.
+
+        Args:
+            targets (Optional[list[str]]): Names of the nodes to compute. Defaults to every node.
+            on_output (Optional[Callable]): Called in the current process with the node and its output as soon
+                as a node is computed. The returned value is kept as node output, so large results can be
+                written to disk and dropped from memory as the study goes.
+
+        Returns:
+            dict[str, Any]: Output of each target node.
+        """
+        if targets is None:
+            targets = list(self.nodes.keys())
+        nodes_by_key = self.required_nodes(targets=targets)
+
+        with tqdm(total=len(nodes_by_key), desc="Running study", position=0) as pbar:
+            if self.nb_workers <= 1:
+                for key, node in nodes_by_key.items():
+                    pbar.set_description(f"Running {node.name}")
+                    output = run_node(func=node.func, kwargs=self.node_kwargs(node))
+                    self.outputs[key] = output if on_output is None else on_output(node, output)
+                    pbar.update()
+            else:
+                self._run_parallel(nodes_by_key=nodes_by_key, pbar=pbar, on_output=on_output)
+
+        return {name: self.outputs[self.nodes[name].key] for name in targets}
+
+    def _run_parallel(
+        self, nodes_by_key: dict[str, StudyNode], pbar: tqdm,
+        on_output: Optional[Callable[[StudyNode, Any], Any]] = None
+        ) -> None:
+        pending: dict[str, StudyNode] = dict(nodes_by_key)
+        running: dict[Future, str] = {}
+        with worker_pool(nb_workers=self.nb_workers, thread_budget=self.thread_budget) as executor:
+            while pending or running:
+                # Submit every node whose parents are computed, while the running nodes leave free slots
+                for key, node in list(pending.items()):
+                    used_slots = sum(nodes_by_key[running_key].nb_slots for running_key in running.values())
+                    if running and used_slots + node.nb_slots > self.nb_workers:
+                        continue
+                    if all(self.nodes[parent].key in self.outputs for parent in node.parents):
+                        running[executor.submit(run_node, node.func, self.node_kwargs(node))] = key
+                        del pending[key]
+                if not running:
+                    raise RuntimeError(f"Study nodes {[node.name for node in pending.values()]} cannot be run")
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    output = future.result()
+                    self.outputs[key] = output if on_output is None else on_output(nodes_by_key[key], output)
+                    pbar.set_description(f"Finished {nodes_by_key[key].name}")
+                    pbar.update()
+
+    def __getitem__(self, name: str) -> Any:
+        return self.outputs[self.nodes[name].key]
@@ -4,6 +4,7 @@ from polars import col as c
 
 from smallflex_data_schema import SmallflexInputSchema
 from pipelines.data_configs import DataConfig
+from utility.compact_schema import compact_timeseries
 
 def process_timeseries_data(
     smallflex_input_schema: SmallflexInputSchema,
@@ -120,4 +121,4 @@ def process_timeseries_data(
         .filter(c("timestamp").dt.year() == data_config.year)
         .filter(c("timestamp").dt.ordinal_day() < 366)
     )
-    return input_timeseries
+    return compact_timeseries(input_timeseries)
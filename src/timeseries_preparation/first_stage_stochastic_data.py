@@ -6,6 +6,8 @@ from polars import col as c
 
 from smallflex_data_schema import SmallflexInputSchema
 from pipelines.data_configs import DataConfig
+from timeseries_preparation.scenario_reduction import reduce_scenarios
+from utility.compact_schema import compact_timeseries
 
 
 def process_first_stage_timeseries_data(
@@ -65,4 +67,12 @@ def process_first_stage_timeseries_data(
             discharge_volume_synthesized.drop("timestamp"), on="day_of_year", how="right"
         ).drop("day_of_year")
 
-    return timeseries_synthesized
+    if data_config.nb_reduced_scenarios is not None:
+        scenario_probability = reduce_scenarios(
+            timeseries=timeseries_synthesized,
+            nb_scenarios=data_config.nb_reduced_scenarios,
+            method=data_config.scenario_reduction_method
+        )
+        timeseries_synthesized = timeseries_synthesized.join(scenario_probability, on="Ω", how="inner")
+
+    return compact_timeseries(timeseries_synthesized)
@@ -0,0 +1,154 @@
+"""
+Reduction of the scenario set Ω of the stochastic first stage.
+
+The size of the first stage problem grows linearly with the number of scenarios. A large set of synthesized
+scenarios is therefore replaced by a smaller subset of its scenarios, each weighted by the probability of the
+scenarios it represents, so that the weighted subset approximates the expectation of the whole set.
+
+The scenarios are compared on their discharge volume and market price timeseries. Every feature is scaled by its
+standard deviation over all scenarios and timestamps, so that the market prices and the discharge volumes of every
+basin have the same weight in the distance between two scenarios.
+
+Two methods are available:
+
+- ``fast_forward``: fast forward selection (Heitsch & Römisch, 2003). Scenarios are selected one by one, each
+  time the one minimizing the Kantorovich distance between the selected subset and the whole set.
+- ``k_medoids``: the scenarios selected by the fast forward selection are refined by k-medoids iterations
+  (alternating assignment and medoid update).
+
+In both cases, the probability of each removed scenario is added to the probability of its closest selected
+scenario.
+"""
+from typing import Literal
+
+import numpy as np
+import polars as pl
+import polars.selectors as cs
+from polars import col as c
+
+from general_function import generate_log
+
+log = generate_log(name=__name__)
+
+ScenarioReductionMethod = Literal["fast_forward", "k_medoids"]
+
+
+def scenario_matrix(timeseries: pl.DataFrame) -> tuple[np.ndarray, list[int]]:
+    """
+    Build the scenario matrix of the first stage timeseries.
+
+    Args:
+        timeseries (pl.DataFrame): First stage timeseries with ``timestamp``, ``Ω``, ``market_price`` and
+            ``discharge_volume_{B}`` columns.
+
+    Returns:
+        tuple[np.ndarray, list[int]]: Scaled matrix with one row per scenario (the timeseries of every feature
+            placed one after the other) and the scenario of each row.
+    """
+    feature_list = timeseries.select(c("market_price"), cs.starts_with("discharge_volume")).columns
+    timeseries = timeseries.sort("Ω", "timestamp")
+    scenario_list: list[int] = timeseries["Ω"].unique(maintain_order=True).to_list()
+
+    feature_matrix: list[np.ndarray] = []
+    for feature in feature_list:
+        values = timeseries.pivot(on="timestamp", index="Ω", values=feature).drop("Ω").to_numpy()
+        values = np.nan_to_num(values.astype(np.float64))
+        std = values.std()
+        # A feature shared by every scenario (i.e. custom market prices) does not change the distances
+        feature_matrix.append((values - values.mean()) / std if std > 0 else np.zeros_like(values))
+    return np.hstack(feature_matrix), scenario_list
+
+
+def scenario_distance(matrix: np.ndarray) -> np.ndarray:
+    """Euclidean distance between every pair of scenarios (rows) of the matrix."""
+    squared_norm = np.einsum("ij,ij->i", matrix, matrix)
+    squared_distance = squared_norm[:, None] + squared_norm[None, :] - 2 * matrix @ matrix.T
+    return np.sqrt(np.clip(squared_distance, a_min=0, a_max=None))
+
+
+def fast_forward_selection(distance: np.ndarray, probability: np.ndarray, nb_selected: int) -> list[int]:
+    """
+    Select scenarios one by one, each time the one which minimizes the probability weighted distance between the
+    removed scenarios and their closest selected scenario.
+
+    Args:
+        distance (np.ndarray): Distance between every pair of scenarios.
+        probability (np.ndarray): Probability of each scenario.
+        nb_selected (int): Number of scenarios to select.
+
+    Returns:
+        list[int]: Indices of the selected scenarios, in selection order.
+    """
+    # Distance between each scenario and its closest selected scenario (or the candidate itself)
+    closest_distance = distance.copy()
+    remaining = np.ones(distance.shape[0], dtype=bool)
+    selected: list[int] = []
+    for _ in range(nb_selected):
+        weighted_distance = (probability[:, None] * closest_distance)[remaining].sum(axis=0)
+        weighted_distance[~remaining] = np.inf
+        scenario = int(np.argmin(weighted_distance))
+        selected.append(scenario)
+        remaining[scenario] = False
+        closest_distance = np.minimum(closest_distance, closest_distance[:, [scenario]])
+    return selected
+
+
+def k_medoids_selection(
+    distance: np.ndarray, probability: np.ndarray, nb_selected: int, max_iter: int = 100
+) -> list[int]:
+    """
+    Select scenarios with k-medoids iterations, starting from the fast forward selection. The medoid of each
+    cluster is the scenario minimizing the probability weighted distance to the other scenarios of the cluster.
+    """
+    selected = np.array(fast_forward_selection(distance=distance, probability=probability, nb_selected=nb_selected))
+    for _ in range(max_iter):
+        cluster = np.argmin(distance[:, selected], axis=1)
+        new_selected = selected.copy()
+        for i in range(nb_selected):
+            members = np.flatnonzero(cluster == i)
+            if members.size == 0:
+                # Duplicated scenarios: the cluster was assigned to an identical medoid
+                continue
+            cost = (probability[members, None] * distance[np.ix_(members, members)]).sum(axis=0)
+            new_selected[i] = members[np.argmin(cost)]
+        if np.array_equal(np.sort(new_selected), np.sort(selected)):
+            break
+        selected = new_selected
+    return selected.tolist()
+
+
+def reduce_scenarios(
+    timeseries: pl.DataFrame, nb_scenarios: int, method: ScenarioReductionMethod = "fast_forward"
+) -> pl.DataFrame:
+    """
+    Reduce the scenarios of the first stage timeseries to a weighted subset.
+
+    Args:
+        timeseries (pl.DataFrame): First stage timeseries (see ``scenario_matrix``).
+        nb_scenarios (int): Number of scenarios kept.
+        method (ScenarioReductionMethod): ``fast_forward`` or ``k_medoids``. Defaults to ``fast_forward``.
+
+    Returns:
+        pl.DataFrame: Kept scenarios ``Ω`` and their ``probability``, which sum to 1.
+    """
+    matrix, scenario_list = scenario_matrix(timeseries=timeseries)
+    if nb_scenarios >= len(scenario_list):
+        return pl.DataFrame({"Ω": scenario_list, "probability": np.full(len(scenario_list), 1 / len(scenario_list))})
+
+    distance = scenario_distance(matrix)
+    probability = np.full(len(scenario_list), 1 / len(scenario_list))
+    if method == "fast_forward":
+        selected = fast_forward_selection(distance=distance, probability=probability, nb_selected=nb_scenarios)
+    elif method == "k_medoids":
+        selected = k_medoids_selection(distance=distance, probability=probability, nb_selected=nb_scenarios)
+    else:
+        raise ValueError(f"Unknown scenario reduction method {method}")
+
+    # Probability of the removed scenarios is redistributed to their closest selected scenario
+    closest = np.argmin(distance[:, selected], axis=1)
+    reduced_probability = np.bincount(closest, weights=probability, minlength=nb_scenarios)
+    log.info(f"{len(scenario_list)} scenarios reduced to {nb_scenarios} with {method} selection")
+    return pl.DataFrame({
+        "Ω": [scenario_list[i] for i in selected],
+        "probability": reduced_probability,
+    }).with_columns(c("Ω").cast(timeseries["Ω"].dtype)).sort("Ω")
@@ -6,6 +6,7 @@ from polars import col as c
 
 from smallflex_data_schema import SmallflexInputSchema
 from pipelines.data_configs import DataConfig
+from utility.compact_schema import compact_timeseries
 
 
 def process_second_stage_timeseries_stochastic_data(
@@ -38,33 +39,11 @@ def process_second_stage_timeseries_stochastic_data(
         )
         
     else:
-        diff_short = 1.23
-        diff_long = 1.37
-
-        lower_quantile = custom_market_prices["da"].quantile(quantile=data_config.market_price_lower_quantile)
-        upper_quantile = custom_market_prices["da"].quantile(quantile=data_config.market_price_upper_quantile)
+        market_prices: pl.DataFrame = process_custom_market_prices_data(
+            custom_market_prices=custom_market_prices,
+            data_config=data_config
+        )
 
-        if "short_imbalance" not in custom_market_prices.columns:
-            custom_market_prices = custom_market_prices.with_columns(   
-                (c("da") + c("da").abs()*diff_short).alias("short_imbalance"),
-            )
-        if "long_imbalance" not in custom_market_prices.columns:
-            custom_market_prices = custom_market_prices.with_columns( 
-                (c("da") - c("da").abs()*diff_long).alias("long_imbalance")
-            )
-    
-        market_prices: pl.DataFrame = custom_market_prices.select(
-            "timestamp",
-            (c("timestamp") - c("timestamp").dt.truncate("1y")).dt.total_hours().alias("hour_of_year"),
-            c("da").alias("market_price"),
-            pl.lit(lower_quantile).alias("market_price_lower_quantile"),
-            pl.lit(upper_quantile).alias("market_price_upper_quantile"),
-            c("fcr").forward_fill().alias("ancillary_market_price"),
-            "short_imbalance",
-            "long_imbalance"
-        ).slice(0, 365*24)
-        
-        
     input_timeseries = market_prices.join(weather_forecast.drop("timestamp"), on="hour_of_year", how="left")
 
     
@@ -77,7 +56,7 @@ def process_second_stage_timeseries_stochastic_data(
     timeseries_measurement = input_timeseries.select(
         ~cs.ends_with("_mean_forecast")
     )
-    return timeseries_forecast, timeseries_measurement
+    return compact_timeseries(timeseries_forecast), compact_timeseries(timeseries_measurement)
 
 
 def process_weather_forecast_data(
@@ -198,6 +177,37 @@ def process_weather_forecast_data(
     return weather_forecast
 
 
+def process_custom_market_prices_data(
+    custom_market_prices: pl.DataFrame,
+    data_config: DataConfig,
+) -> pl.DataFrame:
+    diff_short = 1.23
+    diff_long = 1.37
+
+    lower_quantile = custom_market_prices["da"].quantile(quantile=data_config.market_price_lower_quantile)
+    upper_quantile = custom_market_prices["da"].quantile(quantile=data_config.market_price_upper_quantile)
+
+    if "short_imbalance" not in custom_market_prices.columns:
+        custom_market_prices = custom_market_prices.with_columns(   
+            (c("da") + c("da").abs()*diff_short).alias("short_imbalance"),
+        )
+    if "long_imbalance" not in custom_market_prices.columns:
+        custom_market_prices = custom_market_prices.with_columns( 
+            (c("da") - c("da").abs()*diff_long).alias("long_imbalance")
+        )
+
+    return custom_market_prices.select(
+        "timestamp",
+        (c("timestamp") - c("timestamp").dt.truncate("1y")).dt.total_hours().alias("hour_of_year"),
+        c("da").alias("market_price"),
+        pl.lit(lower_quantile).alias("market_price_lower_quantile"),
+        pl.lit(upper_quantile).alias("market_price_upper_quantile"),
+        c("fcr").forward_fill().alias("ancillary_market_price"),
+        "short_imbalance",
+        "long_imbalance"
+    ).slice(0, 365*24)
+
+
 def process_market_prices_data(
     smallflex_input_schema: SmallflexInputSchema,
     data_config: DataConfig,
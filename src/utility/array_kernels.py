@@ -0,0 +1,125 @@
+"""
+NumPy kernels used on the path of the first stage post-processing.
+
+``clipped_cumsum`` replaces ``numpy_function.clipped_cumsum``. The original steps row by row, which is slow for
+long horizons (i.e. the 35040 quarter hours of a battery state of charge) and narrow arrays. The kernel uses, in
+order of preference:
+
+- a compiled loop when ``numba`` is installed (optional dependency);
+- otherwise, a chunked NumPy evaluation. A clipped sum step ``x -> clip(x + a, xmin, xmax)`` composed with other
+  steps stays a function ``x -> clip(x + s, l, h)``. The composed function of every chunk of timestamps is computed
+  for all chunks at once, then the chunk start values are propagated from chunk to chunk and each chunk is finally
+  evaluated from its start value. For ``T`` timestamps, this needs about ``3 * sqrt(T)`` NumPy operations on
+  ``sqrt(T)`` chunks instead of ``T`` operations on single rows.
+"""
+import math
+from typing import Optional
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Largest number of series for which the chunked evaluation is faster than the row loop. The chunked evaluation
+# does about three times more arithmetic, which is not compensated by fewer NumPy calls for wide arrays.
+MAX_CHUNKED_SERIES: int = 256
+
+
+def _clipped_cumsum_loop(a: np.ndarray, start: np.ndarray, xmin: float, xmax: float, out: np.ndarray) -> None:
+    """Row by row clipped cumulative sum of a 2-D array, compiled with numba when it is installed."""
+    for j in range(a.shape[1]):
+        value = start[j]
+        for i in range(a.shape[0]):
+            value = min(max(value + a[i, j], xmin), xmax)
+            out[i, j] = value
+
+
+if njit is not None:
+    _clipped_cumsum_loop = njit(cache=True)(_clipped_cumsum_loop)
+
+
+def _clipped_cumsum_rows(a: np.ndarray, start: np.ndarray, xmin: float, xmax: float, out: np.ndarray) -> None:
+    """Clipped cumulative sum along the first axis, one vectorized step per row."""
+    value = start.copy()
+    for i in range(a.shape[0]):
+        np.add(value, a[i], out=value)
+        np.maximum(value, xmin, out=value)
+        np.minimum(value, xmax, out=value)
+        out[i] = value
+
+
+def _clipped_cumsum_chunked(a: np.ndarray, xmin: float, xmax: float, chunk_size: int) -> np.ndarray:
+    nb_timestamps, nb_series = a.shape
+    nb_chunks = -(-nb_timestamps // chunk_size)
+    chunks = np.zeros((nb_chunks * chunk_size, nb_series))
+    chunks[:nb_timestamps] = a
+    chunks = chunks.reshape(nb_chunks, chunk_size, nb_series)
+
+    # Composed function x -> clip(x + shift, lower, upper) of each chunk
+    shift = np.zeros((nb_chunks, nb_series))
+    lower = np.full((nb_chunks, nb_series), -np.inf)
+    upper = np.full((nb_chunks, nb_series), np.inf)
+    for i in range(chunk_size):
+        shift += chunks[:, i]
+        lower += chunks[:, i]
+        upper += chunks[:, i]
+        np.maximum(lower, xmin, out=lower)
+        np.minimum(lower, xmax, out=lower)
+        np.maximum(upper, xmin, out=upper)
+        np.minimum(upper, xmax, out=upper)
+
+    # Start value of each chunk
+    start = np.empty((nb_chunks, nb_series))
+    value = np.zeros(nb_series)
+    for chunk in range(nb_chunks):
+        start[chunk] = value
+        value = np.clip(value + shift[chunk], lower[chunk], upper[chunk])
+
+    res = np.empty_like(chunks)
+    _clipped_cumsum_rows(
+        a=chunks.transpose(1, 0, 2), start=start, xmin=xmin, xmax=xmax, out=res.transpose(1, 0, 2)
+    )
+    return res.reshape(-1, nb_series)[:nb_timestamps]
+
+
+def clipped_cumsum(
+    a: np.ndarray, xmin: float = -np.inf, xmax: float = np.inf, chunk_size: Optional[int] = None
+) -> np.ndarray:
+    """
+    Cumulative sum along the first axis, clipped between ``xmin`` and ``xmax`` after each step.
+
+    Args:
+        a (np.ndarray): Array of shape (T,), (T, N) or (T, Ω, B). Every series along the first axis is summed
+            independently.
+        xmin (float): Minimum cumulated value. Defaults to -inf.
+        xmax (float): Maximum cumulated value. Defaults to +inf.
+        chunk_size (Optional[int]): Number of timestamps per chunk of the NumPy evaluation. Defaults to
+            ``sqrt(T)``, or one chunk (row by row evaluation) for arrays with more than ``MAX_CHUNKED_SERIES``
+            series. Not used when numba is installed.
+
+    Returns:
+        np.ndarray: Clipped cumulated sum (float), with the shape of ``a``.
+
+    Example:
+        >>> clipped_cumsum(np.array([1., 2., -1., 5.]), xmin=0, xmax=5)
+        array([1., 3., 2., 5.])
+    """
+    values = np.asarray(a, dtype=np.float64)
+    shape = values.shape
+    values = values.reshape(shape[0], math.prod(shape[1:]))
+    nb_timestamps, nb_series = values.shape
+
+    if njit is not None:
+        res = np.empty_like(values)
+        _clipped_cumsum_loop(np.ascontiguousarray(values), np.zeros(nb_series), float(xmin), float(xmax), res)
+        return res.reshape(shape)
+
+    if chunk_size is None:
+        chunk_size = math.isqrt(max(nb_timestamps - 1, 0)) + 1 if nb_series <= MAX_CHUNKED_SERIES else nb_timestamps
+    if chunk_size >= nb_timestamps:
+        res = np.empty_like(values)
+        _clipped_cumsum_rows(a=values, start=np.zeros(nb_series), xmin=xmin, xmax=xmax, out=res)
+        return res.reshape(shape)
+    return _clipped_cumsum_chunked(values, xmin=xmin, xmax=xmax, chunk_size=chunk_size).reshape(shape)
@@ -0,0 +1,48 @@
+"""
+Compact schema of the timeseries frames.
+
+The prepared timeseries are the largest frames of the pipelines (T x Ω x B rows in the first stage). They are
+stored with:
+
+- Float32 values: prices, powers and discharge volumes are measured or synthesized with far less than the 7
+  significant digits of a Float32. ``probability`` is kept in Float64 so the scenario probabilities still sum to 1;
+- UInt16 indices for the scenario, ancillary period and simulation indices. ``T`` and ``B`` stay UInt32, like the
+  result tables (see ``extract_result_table``), since a year of quarter hours exceeds the UInt16 range.
+
+Composite keys of the Pyomo parameters (``TΩB``, ``TΩ``, ``TB``, ``TF``) are not stored as list columns. The tuple
+keys are built from the index columns when the instance data is generated (see ``pl_to_dict_with_index``).
+"""
+from typing import Any
+
+import polars as pl
+from polars import selectors as cs
+
+VALUE_DTYPE: pl.DataType = pl.Float32()
+INDEX_DTYPE: pl.DataType = pl.UInt16()
+# Columns kept in Float64
+FLOAT64_COLUMNS: list[str] = ["probability"]
+INDEX_COLUMNS: list[str] = ["Ω", "F", "sim_idx"]
+
+
+def compact_timeseries(timeseries: pl.DataFrame) -> pl.DataFrame:
+    """
+    Cast a timeseries frame to the compact schema. Columns which are neither floats nor indices are kept.
+
+    Raises:
+        polars.exceptions.InvalidOperationError: If an index does not fit in ``INDEX_DTYPE``.
+    """
+    return timeseries.with_columns(
+        (cs.float() - cs.by_name(FLOAT64_COLUMNS, require_all=False)).cast(VALUE_DTYPE),
+        cs.by_name(INDEX_COLUMNS, require_all=False).cast(INDEX_DTYPE),
+    )
+
+
+def pl_to_dict_with_index(df: pl.DataFrame, index: list[str], value: str) -> dict[tuple, Any]:
+    """
+    Pyomo parameter data with tuple keys built from several index columns.
+
+    Example:
+        >>> pl_to_dict_with_index(pl.DataFrame({"T": [0, 1], "B": [2, 2], "v": [1.0, 3.0]}), ["T", "B"], "v")
+        {(0, 2): 1.0, (1, 2): 3.0}
+    """
+    return dict(zip(zip(*(df[col].to_list() for col in index)), df[value].to_list()))
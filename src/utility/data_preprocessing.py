@@ -1,13 +1,14 @@
 from typing import Optional, Union, Literal
 import polars as pl
 from polars import col as c
+from polars import selectors as cs
 import numpy as np
 import math
 from datetime import datetime, date, timedelta
 import pyomo.environ as pyo
 
 from general_function import pl_to_dict, generate_log
-from numpy_function import clipped_cumsum
+from utility.array_kernels import clipped_cumsum
 
 
 log = generate_log(name=__name__)
@@ -46,9 +47,28 @@ def pivot_result_table(
     
     if reindex:
         df = df.drop(index).with_row_index(name="real_index")
-    
+
     return df
 
+def update_model_parameters(model_instance: pyo.ConcreteModel, data: dict) -> None:
+    """
+    Updates in place the mutable parameters of a model instance with the values of a data dictionary (same format as
+    the one given to `create_instance`). Indices missing from the data dictionary are set back to the parameter
+    default value. The sets of the instance are not modified, so the data must be defined on the same indices.
+    Args:
+        model_instance (pyo.ConcreteModel): Model instance created with mutable parameters.
+        data (dict): Data dictionary with parameter names as keys.
+    """
+    for param in model_instance.component_objects(pyo.Param, descend_into=True):
+        if not param.mutable or param.local_name not in data:
+            continue
+        values: dict = data[param.local_name]
+        if param.is_indexed():
+            for index in param:
+                param[index] = values.get(index, param.default())
+        else:
+            param.set_value(values[None])
+
 def arange_float(high, low, step):
     return pl.arange(
         start=0,
@@ -430,22 +450,75 @@ def generate_basin_state(basin_volume_table: pl.DataFrame, nb_state: int, bounda
     return basin_state
 
 
+def reduce_basin_state(
+    basin_state: pl.DataFrame, hydro_power_state: pl.DataFrame, rel_tol: float = 1e-6
+    ) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Collapses the states of every basin for which the state has no effect on the model, i.e. every hydro power
+    plant fed by the basin has the same flow and alpha in all its states (or no hydro power plant is fed by the
+    basin). The volume bounds of the merged state are the union of the bounds of the collapsed states, so the
+    reduced problem is equivalent to the original one.
+    Args:
+        basin_state (pl.DataFrame): Basin state table with "B", "S" and volume bound columns.
+        hydro_power_state (pl.DataFrame): Hydro power state table generated by `generate_hydro_power_state`.
+        rel_tol (float, optional): Relative tolerance used to consider the performance as flat. Defaults to 1e-6.
+    Returns:
+        tuple[pl.DataFrame, pl.DataFrame]: The reduced basin state and hydro power state tables, with state
+            index "S" renumbered.
+    """
+    non_flat_basin = hydro_power_state.group_by("B").agg(
+        ((c("flow").max() - c("flow").min()).abs() > rel_tol * c("flow").abs().max()).alias("flow_diff"),
+        ((c("alpha").max() - c("alpha").min()).abs() > rel_tol * c("alpha").abs().max()).alias("alpha_diff"),
+    ).filter(c("flow_diff") | c("alpha_diff"))["B"]
+
+    state_mapping = basin_state.sort("S").with_columns(
+        (c("S").count().over("B") > 1).and_(~c("B").is_in(non_flat_basin.implode())).alias("collapsed")
+    )
+    if not state_mapping["collapsed"].any():
+        return basin_state, hydro_power_state
+
+    state_mapping = state_mapping.with_columns(
+        (~c("collapsed") | c("B").is_first_distinct()).cum_sum().sub(1).cast(pl.UInt32).alias("new_S")
+    ).with_columns(
+        pl.when(c("collapsed")).then(c("new_S").min().over("B")).otherwise(c("new_S")).alias("new_S")
+    )
+
+    basin_state = state_mapping.group_by("B", "new_S", maintain_order=True).agg(
+        cs.contains("volume_min").min(), cs.contains("volume_max").max()
+    ).rename({"new_S": "S"}).with_columns(
+        pl.concat_list("B", "S").alias("BS")
+    )
+
+    hydro_power_state = hydro_power_state.join(state_mapping["S", "new_S"], on="S", how="left")\
+        .unique(subset=["H", "new_S"], keep="first", maintain_order=True)\
+        .drop("S").rename({"new_S": "S"})\
+        .with_columns(
+            pl.concat_list("H", "B", "S").alias("HBS"),
+            pl.concat_list("H", "S").alias("HS"),
+            pl.concat_list("H", "B").alias("HB")
+        )
+    return basin_state, hydro_power_state
+
+
 def compute_battery_power(
     power_difference: np.ndarray, 
-    battery_rated_power: float, 
-    battery_rated_capacity: float, 
+    battery_rated_power: Union[float, np.ndarray], 
+    battery_rated_capacity: Union[float, np.ndarray], 
     battery_efficiency: float, 
     start_soc: float) -> tuple[np.ndarray, np.ndarray]:
-
+    """
+    Greedy battery dispatch following a power difference timeseries. A (T, N) power difference with rated power
+    and capacity arrays of length N simulates N batteries at once.
+    """
     potential_discharging_power = power_difference.clip(min=-battery_rated_power, max=0) / battery_efficiency
     potential_charging_power = power_difference.clip(max=battery_rated_power, min=0) * battery_efficiency
     battery_soc_potential_diff = - (potential_charging_power + potential_discharging_power) / battery_rated_capacity
 
-    battery_soc_potential_diff = np.insert(battery_soc_potential_diff, 0, start_soc)
+    battery_soc_potential_diff = np.insert(battery_soc_potential_diff, 0, start_soc, axis=0)
     battery_soc = clipped_cumsum(battery_soc_potential_diff, 0, 1)
 
-    battery_charging_power = np.diff(battery_soc).clip(min=0) * battery_efficiency * battery_rated_capacity
-    battery_discharging_power = np.diff(battery_soc).clip(max=0) / battery_efficiency * battery_rated_capacity
+    battery_charging_power = np.diff(battery_soc, axis=0).clip(min=0) * battery_efficiency * battery_rated_capacity
+    battery_discharging_power = np.diff(battery_soc, axis=0).clip(max=0) / battery_efficiency * battery_rated_capacity
 
     battery_power = battery_charging_power + battery_discharging_power
     
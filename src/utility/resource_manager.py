@@ -0,0 +1,109 @@
+"""
+Thread budget coordination between parallel workers.
+
+Gurobi, HiGHS, Polars and the BLAS libraries used by NumPy all start as many threads as
+there are cores in every process. When several pipelines run in parallel, each worker
+receives a thread budget which is propagated to these libraries so the machine is not
+oversubscribed.
+
+Polars and BLAS read their thread count from environment variables when they are
+imported, so the variables have to be set before the worker processes are spawned.
+"""
+import os
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+
+from general_function import generate_log
+
+log = generate_log(name=__name__)
+
+THREAD_ENV_VARIABLES: list[str] = [
+    "POLARS_MAX_THREADS",
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+]
+
+
+def compute_thread_budget(nb_workers: int, total_threads: Optional[int] = None) -> int:
+    """
+    Split the available threads between workers.
+
+    Args:
+        nb_workers (int): Number of workers running in parallel.
+        total_threads (Optional[int]): Number of threads available. Defaults to the cpu count.
+
+    Returns:
+        int: Number of threads given to each worker (at least 1).
+    """
+    if total_threads is None:
+        total_threads = os.cpu_count() or 1
+    return max(total_threads // max(nb_workers, 1), 1)
+
+
+def limit_thread_budget(thread_budget: int) -> None:
+    """
+    Limit the number of threads used in the current process. Used as initializer of
+    worker processes. The threads of already loaded BLAS libraries are limited with
+    ``threadpoolctl`` when it is installed.
+    """
+    for env_variable in THREAD_ENV_VARIABLES:
+        os.environ[env_variable] = str(thread_budget)
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(limits=thread_budget)
+
+
+@contextmanager
+def thread_budget_env(thread_budget: int) -> Iterator[None]:
+    """
+    Temporarily set the thread environment variables inherited by spawned processes.
+    """
+    previous_env: dict[str, Optional[str]] = {
+        env_variable: os.environ.get(env_variable) for env_variable in THREAD_ENV_VARIABLES
+    }
+    for env_variable in THREAD_ENV_VARIABLES:
+        os.environ[env_variable] = str(thread_budget)
+    try:
+        yield
+    finally:
+        for env_variable, value in previous_env.items():
+            if value is None:
+                os.environ.pop(env_variable, None)
+            else:
+                os.environ[env_variable] = value
+
+
+@contextmanager
+def worker_pool(nb_workers: int, thread_budget: Optional[int] = None) -> Iterator[ProcessPoolExecutor]:
+    """
+    Create a process pool where each worker is limited to its thread budget.
+
+    Workers are started with the ``spawn`` method so that Polars and BLAS thread pools
+    are created after the environment variables are set (a forked process inherits the
+    thread pool of its parent).
+
+    Args:
+        nb_workers (int): Number of worker processes.
+        thread_budget (Optional[int]): Threads per worker. Defaults to cpu count split between workers.
+
+    Yields:
+        ProcessPoolExecutor: The process pool.
+    """
+    if thread_budget is None:
+        thread_budget = compute_thread_budget(nb_workers=nb_workers)
+    log.info(f"Starting {nb_workers} workers with {thread_budget} threads each")
+    with thread_budget_env(thread_budget=thread_budget):
+        with ProcessPoolExecutor(
+            max_workers=nb_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=limit_thread_budget,
+            initargs=(thread_budget,),
+        ) as executor:
+            yield executor
@@ -0,0 +1,203 @@
+"""
+Columnar result store of the design and sensitivity studies.
+
+The optimization results of every scenario are written as soon as the scenario is solved in a Parquet
+file partitioned by study, scenario and year::
+
+    {store_folder}/study={study}/scenario={scenario}/year={year}/results.parquet
+
+Timestamps keep their datetime type and the files are compressed with zstd. The DuckDB file of a study
+only contains small summary tables and views over the Parquet files, so the results are not copied twice.
+
+Studies which keep their results in a DuckDB file use ``StudyResultWriter``, which appends the results of
+each scenario to one table as soon as the scenario is solved.
+"""
+import glob
+import os
+from typing import Any, Optional
+
+import duckdb
+import polars as pl
+from polars import col as c
+
+from general_function import build_non_existing_dirs, generate_log
+
+log = generate_log(name=__name__)
+
+RESULT_FILE_NAME: str = "results.parquet"
+COMPRESSION: str = "zstd"
+COMPRESSION_LEVEL: int = 3
+# Partition values are read as strings, otherwise scenarios named after a number would be read as floats
+PARTITION_SCHEMA: dict[str, pl.DataType] = {"study": pl.String(), "scenario": pl.String(), "year": pl.Int64()}
+
+
+def partition_folder(store_folder: str, study: str, scenario: str, year: int) -> str:
+    return f"{store_folder}/study={study}/scenario={scenario}/year={year}"
+
+
+def write_result_partition(
+    results: pl.DataFrame, store_folder: str, study: str, scenario: str, year: int
+) -> str:
+    """
+    Write the optimization results of one scenario in the result store. An existing partition is replaced,
+    so a scenario run again does not add duplicated rows.
+
+    Args:
+        results (pl.DataFrame): Optimization results of the scenario.
+        store_folder (str): Root folder of the result store.
+        study (str): Name of the study.
+        scenario (str): Name of the scenario.
+        year (int): Simulated year.
+
+    Returns:
+        str: Path of the written Parquet file.
+    """
+    folder = partition_folder(store_folder=store_folder, study=study, scenario=scenario, year=year)
+    build_non_existing_dirs(folder)
+    file_path = f"{folder}/{RESULT_FILE_NAME}"
+    # Write next to the partition and rename, so that readers never see a half written file
+    results.write_parquet(
+        f"{file_path}.tmp", compression=COMPRESSION, compression_level=COMPRESSION_LEVEL, statistics=True
+    )
+    os.replace(f"{file_path}.tmp", file_path)
+    return file_path
+
+
+def write_plot_inputs(
+    store_folder: str, study: str, scenario: str, year: int, **tables: pl.DataFrame
+) -> None:
+    """
+    Write next to the results of a scenario the other tables needed to plot them, so the figures can be
+    generated later from the result store (see ``data_display.deferred_plots``).
+    """
+    folder = partition_folder(store_folder=store_folder, study=study, scenario=scenario, year=year)
+    build_non_existing_dirs(folder)
+    for table_name, table in tables.items():
+        table.write_parquet(f"{folder}/{table_name}.parquet", compression=COMPRESSION)
+
+
+def scan_result_store(
+    store_folder: str, study: Optional[str] = None, scenario: Optional[str] = None, year: Optional[int] = None
+) -> pl.LazyFrame:
+    """
+    Lazily read the result store. The partition columns ``study``, ``scenario`` and ``year`` are added to the
+    results and the filters are pushed down to the partitions.
+
+    The scenarios do not have the same columns (hydropower plants, battery and ancillary market columns): the
+    results have the columns of every partition, null where a partition does not have them.
+    """
+    file_glob = f"{store_folder}/**/{RESULT_FILE_NAME}"
+    # Only the Parquet footers are read to build the schema
+    schema: dict[str, pl.DataType] = {}
+    for file_path in sorted(glob.glob(file_glob, recursive=True)):
+        schema.update(pl.read_parquet_schema(file_path))
+    results = pl.scan_parquet(
+        file_glob, hive_partitioning=True, hive_schema=PARTITION_SCHEMA, schema=schema or None,
+        missing_columns="insert"
+    )
+    for name, value in [("study", study), ("scenario", scenario), ("year", year)]:
+        if value is not None:
+            results = results.filter(c(name) == value)
+    return results
+
+
+def build_result_views(
+    store_folder: str, study: str, file_path: str, summary_tables: Optional[dict[str, pl.DataFrame]] = None
+) -> None:
+    """
+    Create the DuckDB file of a study. The ``results`` view covers every partition of the study and each
+    scenario gets a view with its own results, named after the scenario. Summary tables are stored as tables.
+    The partitions are read by column name, so the ``results`` view has the columns of every scenario.
+
+    Args:
+        store_folder (str): Root folder of the result store.
+        study (str): Name of the study.
+        file_path (str): DuckDB file path.
+        summary_tables (Optional[dict[str, pl.DataFrame]]): Small tables stored in the DuckDB file.
+    """
+    if summary_tables is None:
+        summary_tables = {}
+    build_non_existing_dirs(os.path.dirname(file_path))
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    # Views are resolved when queried, so the path must not depend on the working directory
+    study_glob = f"{os.path.abspath(store_folder)}/study={study}/**/{RESULT_FILE_NAME}"
+    hive_types = "{'study': VARCHAR, 'scenario': VARCHAR, 'year': BIGINT}"
+    with duckdb.connect(file_path) as con:
+        con.execute("SET TimeZone='UTC'")
+        con.execute(
+            f"CREATE VIEW results AS SELECT * FROM read_parquet('{study_glob}', hive_partitioning = true, "
+            f"hive_types = {hive_types}, union_by_name = true)"
+        )
+        scenario_list = con.execute("SELECT DISTINCT scenario FROM results ORDER BY scenario").fetchall()
+        for (scenario,) in scenario_list:
+            con.execute(
+                f"CREATE VIEW \"{scenario}\" AS SELECT * EXCLUDE (study, scenario) FROM results "
+                f"WHERE scenario = '{scenario}'"
+            )
+        for table_name, table_pl in summary_tables.items():
+            con.execute(f"CREATE TABLE \"{table_name}\" AS SELECT * FROM table_pl")
+    log.info(f"{len(scenario_list)} scenario views of study {study} written in {file_path}")
+
+
+class StudyResultWriter:
+    """
+    Append-only DuckDB writer of the results of a study.
+
+    One connection is kept open for the whole study. The results of each scenario are appended to a shared
+    table together with metadata columns (hydropower mask, market, battery size, year, configuration hash...),
+    so that scenarios can be queried together without loading every result. DuckDB allows only one writing
+    process per file, so the writer must be used in the process running the study (see the ``on_output``
+    callback of ``StudyRunner.run``).
+
+    Args:
+        file_path (str): DuckDB file path. An existing file is replaced.
+
+    Example:
+        >>> with StudyResultWriter(f"{output_folder}/results.duckdb") as writer:
+        ...     writer.append("second_stage_results", optimization_results, hydro="DT", year=2024)
+    """
+    def __init__(self, file_path: str):
+        build_non_existing_dirs(os.path.dirname(file_path))
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        self.file_path: str = file_path
+        self.con: duckdb.DuckDBPyConnection = duckdb.connect(file_path)
+        self.con.execute("SET TimeZone='UTC'")
+
+    def append(self, table_name: str, results: pl.DataFrame, **metadata: Any) -> None:
+        """
+        Append results to a table, created with the columns of the first results appended. Columns missing from
+        the table (e.g. the per plant columns of the DTP results appended after DT results) are added to it, and
+        are NULL for the rows appended before. The metadata are added as constant columns in front of the results.
+        """
+        results = results.select(
+            *[pl.lit(value).alias(name) for name, value in metadata.items()], pl.all()
+        )
+        # Registered Arrow tables are scanned by DuckDB without copy
+        self.con.register("appended_results", results.to_arrow())
+        self.con.execute(
+            f"CREATE TABLE IF NOT EXISTS \"{table_name}\" AS SELECT * FROM appended_results WITH NO DATA"
+        )
+        table_columns: set[str] = {
+            row[0] for row in self.con.execute(f"DESCRIBE \"{table_name}\"").fetchall()
+        }
+        for name, dtype, *_ in self.con.execute("DESCRIBE appended_results").fetchall():
+            if name not in table_columns:
+                self.con.execute(f"ALTER TABLE \"{table_name}\" ADD COLUMN \"{name}\" {dtype}")
+        self.con.execute(f"INSERT INTO \"{table_name}\" BY NAME SELECT * FROM appended_results")
+        self.con.unregister("appended_results")
+
+    def write_table(self, table_name: str, data: pl.DataFrame) -> None:
+        self.con.register("written_table", data.to_arrow())
+        self.con.execute(f"CREATE OR REPLACE TABLE \"{table_name}\" AS SELECT * FROM written_table")
+        self.con.unregister("written_table")
+
+    def close(self) -> None:
+        self.con.close()
+
+    def __enter__(self) -> "StudyResultWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
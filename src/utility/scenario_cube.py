@@ -0,0 +1,173 @@
+"""
+Scenario cube of the first stage: dense arrays of the stochastic timeseries and results.
+
+The first stage data is indexed by timestamp ``T`` and scenario ``Ω``, and by basin ``B`` or hydropower plant ``H``
+for the per basin or per plant values. In long format, every step (parameter data, result extraction, basin volume
+post-processing, plots) unpivots and pivots the frames again. ``ScenarioCube`` stores each value once as a C
+contiguous ``(T, Ω)`` or ``(T, Ω, K)`` NumPy array:
+
+- ``param_data`` gives the Pyomo parameter data, with keys in the order of the array;
+- ``add_variable`` reads a Pyomo variable into an array, from the positions of its indices;
+- ``to_frame`` gives the wide result frame (one ``{name}_{k}`` column per basin or plant) and ``view`` a long
+  frame whose value column shares the memory of the array (zero-copy Arrow buffer).
+"""
+from dataclasses import dataclass, field
+from itertools import product
+from typing import Optional
+
+import numpy as np
+import polars as pl
+from polars import col as c
+import pyomo.environ as pyo
+
+
+@dataclass
+class ScenarioCube:
+    """
+    Args:
+        T (pl.Series): Sorted timestamp indices (first axis).
+        Ω (pl.Series): Sorted scenario indices (second axis).
+        timestamp (pl.Series): Timestamp of each ``T``.
+        probability (Optional[np.ndarray]): Probability of each scenario, for a reduced scenario set.
+        values (dict[str, np.ndarray]): ``(T, Ω)`` or ``(T, Ω, K)`` arrays.
+        axes (dict[str, pl.Series]): Indices of the last axis of the ``(T, Ω, K)`` arrays, named after the index
+            set (``B`` or ``H``).
+    """
+    T: pl.Series
+    Ω: pl.Series
+    timestamp: pl.Series
+    probability: Optional[np.ndarray] = None
+    values: dict[str, np.ndarray] = field(default_factory=dict)
+    axes: dict[str, pl.Series] = field(default_factory=dict)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.T.len(), self.Ω.len()
+
+    @classmethod
+    def from_frame(cls, df: pl.DataFrame, names: dict[str, Optional[str]]) -> "ScenarioCube":
+        """
+        Build a cube from a long frame with one row per (``T``, ``Ω``).
+
+        Args:
+            df (pl.DataFrame): Frame with ``T``, ``Ω`` and ``timestamp`` columns and optionally ``probability``.
+            names (dict[str, Optional[str]]): Values of the cube. ``None`` for a ``(T, Ω)`` value stored in the
+                column of the same name, or the index set name for a ``(T, Ω, K)`` value stored in the
+                ``{name}_{k}`` columns.
+
+        Raises:
+            ValueError: If some (``T``, ``Ω``) pairs are missing or duplicated.
+        """
+        df = df.sort("T", "Ω")
+        T, Ω = df["T"].unique(maintain_order=True), df["Ω"].unique().sort()
+        shape = (T.len(), Ω.len())
+        if df.height != shape[0] * shape[1]:
+            raise ValueError(
+                f"{df.height} rows given for {shape[0]} timestamps and {shape[1]} scenarios, "
+                "the scenario cube needs exactly one row per timestamp and scenario"
+            )
+        probability: Optional[np.ndarray] = None
+        if "probability" in df.columns:
+            probability = df["probability"].head(shape[1]).to_numpy()
+
+        cube = cls(T=T, Ω=Ω, timestamp=df["timestamp"].gather_every(shape[1]), probability=probability)
+        for name, axis in names.items():
+            if axis is None:
+                cube.values[name] = df[name].to_numpy().reshape(shape)
+                continue
+            columns = df.select(c(rf"^{name}_\d+$")).columns
+            cube.axes[name] = pl.Series(
+                axis, [int(col.removeprefix(f"{name}_")) for col in columns], dtype=pl.UInt32
+            )
+            cube.values[name] = df.select(columns).to_numpy(order="c").reshape(*shape, len(columns))
+        return cube
+
+    def add_variable(self, model_instance: pyo.ConcreteModel, var_name: str) -> None:
+        """
+        Store a variable of the model instance indexed by (``T``, ``Ω``) or (``T``, ``Ω``, ``K``). Missing indices
+        and variables without value are set to NaN.
+        """
+        component = getattr(model_instance, var_name)
+        index_names: list[str] = [subset.name for subset in component.index_set().subsets()]
+        values = component.extract_values()
+        keys = np.array(list(values.keys()))
+        position = [
+            np.searchsorted(self.T.to_numpy(), keys[:, 0]), np.searchsorted(self.Ω.to_numpy(), keys[:, 1])
+        ]
+        shape: tuple[int, ...] = self.shape
+        if len(index_names) == 3:
+            self.axes[var_name] = pl.Series(index_names[2], np.unique(keys[:, 2]), dtype=pl.UInt32)
+            position.append(np.searchsorted(self.axes[var_name].to_numpy(), keys[:, 2]))
+            shape = (*shape, self.axes[var_name].len())
+        array = np.full(shape, np.nan)
+        array[tuple(position)] = np.array(list(values.values()), dtype=np.float64)
+        self.values[var_name] = array
+
+    def param_data(self, name: str) -> dict[tuple, float]:
+        """
+        Pyomo parameter data of a value, with (``T``, ``Ω``) or (``T``, ``Ω``, ``K``) keys.
+
+        Example:
+            >>> ScenarioCube(
+            ...     T=pl.Series("T", [0, 1]), Ω=pl.Series("Ω", [4]), timestamp=pl.Series([None, None]),
+            ...     values={"market_price": np.array([[10.], [20.]])}
+            ... ).param_data("market_price")
+            {(0, 4): 10.0, (1, 4): 20.0}
+        """
+        index = [self.T.to_list(), self.Ω.to_list()]
+        if name in self.axes:
+            index.append(self.axes[name].to_list())
+        return dict(zip(product(*index), self.values[name].ravel().tolist()))
+
+    def select(self, name: str, index: Optional[int] = None) -> np.ndarray:
+        """``(T, Ω)`` array of a value, or of the index ``index`` of a ``(T, Ω, K)`` value."""
+        if index is None:
+            return self.values[name]
+        return self.values[name][:, :, self.axes[name].index_of(index)]
+
+    def index_frame(self) -> pl.DataFrame:
+        """Long frame of the ``timestamp``, ``T``, ``Ω`` (and ``probability``) of every row of the cube."""
+        nb_timestamps, nb_scenarios = self.shape
+        columns: list[pl.Series] = [
+            self.timestamp.gather(np.repeat(np.arange(nb_timestamps), nb_scenarios)),
+            self.T.gather(np.repeat(np.arange(nb_timestamps), nb_scenarios)),
+            self.Ω.gather(np.tile(np.arange(nb_scenarios), nb_timestamps)),
+        ]
+        if self.probability is not None:
+            columns.append(pl.Series("probability", np.tile(self.probability, nb_timestamps)))
+        return pl.DataFrame(columns)
+
+    def to_frame(self, names: Optional[list[str]] = None) -> pl.DataFrame:
+        """
+        Wide frame with one row per (``T``, ``Ω``): ``(T, Ω)`` values are stored in the column of the same name and
+        ``(T, Ω, K)`` values in one ``{name}_{k}`` column per index ``k``.
+        """
+        if names is None:
+            names = list(self.values.keys())
+        columns: list[pl.Series] = []
+        for name in names:
+            array = self.values[name]
+            if array.ndim == 2:
+                columns.append(pl.Series(name, array.reshape(-1)))
+            else:
+                columns.extend(
+                    pl.Series(f"{name}_{k}", array[:, :, i].ravel())
+                    for i, k in enumerate(self.axes[name].to_list())
+                )
+        return self.index_frame().with_columns(columns)
+
+    def view(self, name: str) -> pl.DataFrame:
+        """
+        Long frame of one value with its ``T``, ``Ω`` (and ``B`` or ``H``) indices. The value column is a zero-copy
+        view of the array.
+        """
+        array = self.values[name]
+        nb_scenarios = self.shape[1]
+        nb_indices = array.shape[2] if array.ndim == 3 else 1
+        row = np.arange(array.size)
+        columns: list[pl.Series] = [
+            self.T.gather(row // (nb_scenarios * nb_indices)), self.Ω.gather(row // nb_indices % nb_scenarios)
+        ]
+        if array.ndim == 3:
+            columns.append(self.axes[name].gather(row % nb_indices))
+        return pl.DataFrame([*columns, pl.Series(name, array.reshape(-1))])
@@ -0,0 +1,114 @@
+"""
+Input schema shared between the worker processes through memory-mapped Arrow IPC files.
+
+A ``SmallflexInputSchema`` cannot be sent to a worker as is (the patito DataFrame classes are created at run
+time and cannot be pickled), and pickling its tables would give each worker its own copy of the large tables
+(``discharge_volume_synthesized``, weather ensembles...). The tables are instead exported once to uncompressed
+Arrow IPC files, which every process memory-maps: the data is shared through the page cache and
+``SharedInputSchema`` objects are pickled as the path of their IPC folder.
+"""
+import os
+from dataclasses import dataclass, fields
+from typing import Optional
+
+import patito as pt
+import polars as pl
+
+import smallflex_data_schema
+from smallflex_data_schema import SmallflexInputSchema
+from general_function import generate_log, snake_to_camel
+
+log = generate_log(name=__name__)
+
+TABLE_NAMES: list[str] = [table.name for table in fields(SmallflexInputSchema)]
+
+# Memory-mapped tables by IPC folder, loaded once per process
+_SHARED_TABLES: dict[str, dict[str, pt.DataFrame]] = {}
+
+
+@dataclass(frozen=True)
+class SharedInputSchema(SmallflexInputSchema):
+    """
+    ``SmallflexInputSchema`` whose tables are memory-mapped from an IPC folder. It is pickled as the folder path
+    and the tables which differ from the shared ones, so schemas derived from it (``add_table``,
+    ``replace_table``...) only send their modified tables to the workers.
+    """
+    ipc_folder: str = ""
+
+    def __post_init__(self):
+        # Tables were validated before being exported
+        pass
+
+    def __reduce__(self):
+        shared_tables = _SHARED_TABLES.get(self.ipc_folder, {})
+        modified_tables: dict[str, pl.DataFrame] = {
+            table_name: pl.DataFrame(getattr(self, table_name)) for table_name in TABLE_NAMES
+            if getattr(self, table_name) is not shared_tables.get(table_name)
+        }
+        return (load_shared_input_schema, (self.ipc_folder, modified_tables))
+
+
+def model_table(table_name: str, table: pl.DataFrame) -> pt.DataFrame:
+    return pt.DataFrame(table).set_model(getattr(smallflex_data_schema, snake_to_camel(table_name)))
+
+
+def ipc_file(ipc_folder: str, table_name: str) -> str:
+    return f"{ipc_folder}/{table_name}.arrow"
+
+
+def ipc_up_to_date(ipc_folder: str, source_file: Optional[str] = None) -> bool:
+    """Check that every table was exported, after the last modification of the source file if given."""
+    file_paths = [ipc_file(ipc_folder, table_name) for table_name in TABLE_NAMES]
+    if not all(os.path.exists(file_path) for file_path in file_paths):
+        return False
+    if source_file is None:
+        return True
+    return min(os.path.getmtime(file_path) for file_path in file_paths) >= os.path.getmtime(source_file)
+
+
+def export_input_schema(smallflex_input_schema: SmallflexInputSchema, ipc_folder: str) -> None:
+    """Write every table of the schema in an uncompressed (memory-mappable) Arrow IPC file."""
+    os.makedirs(ipc_folder, exist_ok=True)
+    for table_name in TABLE_NAMES:
+        file_path = ipc_file(ipc_folder, table_name)
+        # Write next to the file and rename, so that a process never maps a half written file
+        getattr(smallflex_input_schema, table_name).write_ipc(f"{file_path}.tmp", compression="uncompressed")
+        os.replace(f"{file_path}.tmp", file_path)
+    _SHARED_TABLES.pop(os.path.abspath(ipc_folder), None)
+    log.info(f"Input schema exported to {ipc_folder}")
+
+
+def load_shared_input_schema(
+    ipc_folder: str, modified_tables: Optional[dict[str, pl.DataFrame]] = None
+) -> SharedInputSchema:
+    """
+    Memory-map the tables exported in the IPC folder. The tables are mapped once per process.
+
+    Args:
+        ipc_folder (str): Folder of the exported tables.
+        modified_tables (Optional[dict[str, pl.DataFrame]]): Tables used instead of the exported ones.
+    """
+    ipc_folder = os.path.abspath(ipc_folder)
+    if ipc_folder not in _SHARED_TABLES:
+        _SHARED_TABLES[ipc_folder] = {
+            table_name: model_table(
+                table_name=table_name,
+                table=pl.read_ipc(ipc_file(ipc_folder, table_name), memory_map=True, rechunk=False)
+            )
+            for table_name in TABLE_NAMES
+        }
+    tables: dict[str, pt.DataFrame] = dict(_SHARED_TABLES[ipc_folder])
+    if modified_tables is not None:
+        tables.update({
+            table_name: model_table(table_name=table_name, table=table)
+            for table_name, table in modified_tables.items()
+        })
+    return SharedInputSchema(**tables, ipc_folder=ipc_folder)  # type: ignore
+
+
+def share_input_schema(
+    smallflex_input_schema: SmallflexInputSchema, ipc_folder: str
+) -> SharedInputSchema:
+    """Export the schema tables to the IPC folder and return the memory-mapped schema."""
+    export_input_schema(smallflex_input_schema=smallflex_input_schema, ipc_folder=ipc_folder)
+    return load_shared_input_schema(ipc_folder=ipc_folder)
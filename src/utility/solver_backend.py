@@ -0,0 +1,103 @@
+"""
+Solver backend used by every optimization stage.
+
+Pyomo solver plugins do not share option names (``TimeLimit`` for Gurobi,
+``time_limit`` for HiGHS, ``seconds`` for CBC, ...). This module maps the generic
+options stored in ``DataConfig`` to the option names of each supported solver, so the
+pipelines can switch solver without touching the model managers.
+
+``highs`` is resolved to the in-process APPSI interface of ``highspy`` (``appsi_highs``).
+The model is passed to HiGHS through its Python API, without subprocess nor LP file
+written on disk for every solve.
+"""
+from typing import Optional
+import pyomo.environ as pyo
+from pyomo.opt import SolverStatus, TerminationCondition
+
+from general_function import generate_log
+
+log = generate_log(name=__name__)
+
+SOLVER_ALIAS: dict[str, str] = {
+    "highs": "appsi_highs",
+    "highspy": "appsi_highs",
+}
+
+SOLVER_OPTION_NAMES: dict[str, dict[str, str]] = {
+    "gurobi": {"time_limit": "TimeLimit", "mip_gap": "MIPGap", "threads": "Threads"},
+    "gurobi_direct": {"time_limit": "TimeLimit", "mip_gap": "MIPGap", "threads": "Threads"},
+    "gurobi_persistent": {"time_limit": "TimeLimit", "mip_gap": "MIPGap", "threads": "Threads"},
+    "appsi_gurobi": {"time_limit": "TimeLimit", "mip_gap": "MIPGap", "threads": "Threads"},
+    "appsi_highs": {"time_limit": "time_limit", "mip_gap": "mip_rel_gap", "threads": "threads"},
+    "cbc": {"time_limit": "seconds", "mip_gap": "ratio", "threads": "threads"},
+    "appsi_cbc": {"time_limit": "seconds", "mip_gap": "ratio", "threads": "threads"},
+    "glpk": {"time_limit": "tmlim", "mip_gap": "mipgap"},
+    "cplex": {"time_limit": "timelimit", "mip_gap": "mipgap", "threads": "threads"},
+    "appsi_cplex": {"time_limit": "timelimit", "mip_gap": "mipgap", "threads": "threads"},
+}
+
+ABORTED_TERMINATION_CONDITION: list[TerminationCondition] = [
+    TerminationCondition.maxTimeLimit,
+    TerminationCondition.maxIterations,
+    TerminationCondition.maxEvaluations,
+    TerminationCondition.userInterrupt,
+    TerminationCondition.resourceInterrupt,
+]
+
+
+def resolve_solver_name(solver_name: str) -> str:
+    return SOLVER_ALIAS.get(solver_name.lower(), solver_name.lower())
+
+
+def build_solver(
+    solver_name: str, time_limit: Optional[float] = None, mip_gap: Optional[float] = None,
+    threads: Optional[int] = None
+    ):
+    """
+    Instantiate a Pyomo solver and set the generic options with the option names of
+    the chosen solver. Options which are not supported by the solver are ignored.
+
+    Args:
+        solver_name (str): Pyomo solver name (``gurobi``, ``highs``, ``appsi_highs``, ``cbc``, ...).
+        time_limit (Optional[float]): Time limit of each solve in seconds.
+        mip_gap (Optional[float]): Relative MIP gap.
+        threads (Optional[int]): Number of threads used by the solver.
+
+    Returns:
+        Pyomo solver object.
+    """
+    solver_name = resolve_solver_name(solver_name)
+    solver = pyo.SolverFactory(solver_name)
+    option_names: dict[str, str] = SOLVER_OPTION_NAMES.get(solver_name, {})
+    generic_options: dict[str, Optional[float]] = {
+        "time_limit": time_limit, "mip_gap": mip_gap, "threads": threads
+    }
+    for option, value in generic_options.items():
+        if value is None:
+            continue
+        if option not in option_names:
+            log.warning(f"Option {option} is not supported by {solver_name} solver and is ignored")
+            continue
+        solver.options[option_names[option]] = value
+    return solver
+
+
+def solve_instance(solver, model_instance: pyo.ConcreteModel, tee: bool = False, warmstart: bool = False):
+    """
+    Solve a model instance. With ``warmstart``, the current values of the variables are given to the solver as
+    starting solution, when the solver plugin supports it (Gurobi, APPSI HiGHS, CBC).
+    """
+    if warmstart and getattr(solver, "warm_start_capable", lambda: False)():
+        return solver.solve(model_instance, tee=tee, warmstart=True)
+    return solver.solve(model_instance, tee=tee)
+
+
+def is_solution_aborted(solution) -> bool:
+    """
+    Return True if the solver stopped before proving optimality (time limit reached,
+    iteration limit, interruption).
+    """
+    solver_results = solution["Solver"][0]
+    if solver_results["Status"] == SolverStatus.aborted:
+        return True
+    return solver_results["Termination condition"] in ABORTED_TERMINATION_CONDITION
@@ -0,0 +1,30 @@
+import math
+
+import numpy as np
+import pytest
+
+from utility.array_kernels import _clipped_cumsum_rows, clipped_cumsum
+
+NB_TIMESTAMPS = 50
+XMIN, XMAX = -3.0, 4.0
+
+
+def row_loop(a: np.ndarray, xmin: float, xmax: float) -> np.ndarray:
+    values = a.reshape(a.shape[0], -1).astype(np.float64)
+    res = np.empty_like(values)
+    _clipped_cumsum_rows(a=values, start=np.zeros(values.shape[1]), xmin=xmin, xmax=xmax, out=res)
+    return res.reshape(a.shape)
+
+
+@pytest.mark.parametrize("shape", [(NB_TIMESTAMPS,), (NB_TIMESTAMPS, 6), (NB_TIMESTAMPS, 4, 3)])
+@pytest.mark.parametrize("chunk_size", [None, 1, 2, math.isqrt(NB_TIMESTAMPS), NB_TIMESTAMPS])
+def test_clipped_cumsum_matches_row_loop(shape, chunk_size):
+    a = np.random.default_rng(0).normal(scale=2, size=shape)
+    res = clipped_cumsum(a, xmin=XMIN, xmax=XMAX, chunk_size=chunk_size)
+    assert res.shape == shape
+    np.testing.assert_allclose(res, row_loop(a, xmin=XMIN, xmax=XMAX), atol=1e-9)
+
+
+def test_clipped_cumsum_without_bounds_is_cumsum():
+    a = np.random.default_rng(1).normal(size=(NB_TIMESTAMPS, 3))
+    np.testing.assert_allclose(clipped_cumsum(a, chunk_size=7), np.cumsum(a, axis=0))
@@ -0,0 +1,65 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from data_display.baseline_plots import band_traces, lttb_indices, min_max_indices, stacked_bar_traces
+
+NB_POINTS = 1000
+
+
+@pytest.mark.parametrize("max_points", [3, 10, 101, NB_POINTS - 1])
+def test_lttb_indices(max_points):
+    x = np.arange(NB_POINTS, dtype=np.float64)
+    y = np.random.default_rng(0).normal(size=NB_POINTS)
+    indices = lttb_indices(x=x, y=y, max_points=max_points)
+    assert len(indices) == max_points
+    assert np.all(np.diff(indices) > 0)
+    assert indices[0] == 0 and indices[-1] == NB_POINTS - 1
+
+
+@pytest.mark.parametrize("max_points", [2, 10, 101, NB_POINTS - 1])
+def test_min_max_indices(max_points):
+    y = np.random.default_rng(1).normal(size=NB_POINTS)
+    indices = min_max_indices(y=y, max_points=max_points)
+    assert len(indices) <= max_points
+    assert np.all(np.diff(indices) > 0)
+    assert np.argmin(y) in indices and np.argmax(y) in indices
+
+
+@pytest.mark.parametrize("indices_function", [
+    lambda y, max_points: lttb_indices(x=np.arange(len(y), dtype=np.float64), y=y, max_points=max_points),
+    min_max_indices,
+])
+def test_every_point_kept_below_max_points(indices_function):
+    y = np.random.default_rng(2).normal(size=20)
+    np.testing.assert_array_equal(indices_function(y, max_points=20), np.arange(20))
+
+
+def test_stacked_bar_traces_share_indices():
+    rng = np.random.default_rng(3)
+    x = pl.Series("timestamp", np.arange(NB_POINTS))
+    forecast, diff = rng.uniform(0, 5, NB_POINTS), rng.normal(size=NB_POINTS)
+    traces = stacked_bar_traces(
+        x=x,
+        y_list=[pl.Series(forecast), pl.Series(diff.clip(min=0)), pl.Series(diff.clip(max=0))],
+        trace_kwargs=[dict(name="Forecast"), dict(name="Excess power"), dict(name="Power shortage")],
+        max_points=100,
+    )
+    assert [trace.fill for trace in traces] == ["tozeroy", "tonexty", "tonexty"]
+    indices = np.asarray(traces[0].x)
+    assert len(indices) <= 100
+    for trace in traces[1:]:
+        np.testing.assert_array_equal(trace.x, indices)
+    # Each trace is drawn on top of the previous ones
+    np.testing.assert_allclose(traces[1].y, forecast[indices] + diff[indices].clip(min=0))
+    np.testing.assert_allclose(traces[2].y, forecast[indices] + diff[indices])
+
+
+def test_band_traces_share_indices():
+    rng = np.random.default_rng(4)
+    lower = rng.normal(size=NB_POINTS)
+    upper = lower + rng.uniform(0, 1, NB_POINTS)
+    traces = band_traces(x=pl.Series(np.arange(NB_POINTS)), lower=lower, upper=upper, max_points=100)
+    np.testing.assert_array_equal(traces[0].x, traces[1].x)
+    assert traces[1].fill == "tonexty"
+    assert np.argmax(upper) in traces[1].x and np.argmin(lower) in traces[0].x
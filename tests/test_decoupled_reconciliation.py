@@ -0,0 +1,65 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from pipelines.model_manager.stochastic_second_stage import StochasticSecondStage
+
+START_VOLUME = 0.5
+# Volume variation of each timestamp of each simulation: basin 0 overflows, basin 1 runs empty
+VOLUME_DIFF: dict[int, dict[int, list[float]]] = {
+    0: {0: [0.3, 0.3], 1: [-0.4, 0.1], 2: [0.5, 0.2]},
+    1: {0: [-0.3, -0.3], 1: [0.4, -0.1], 2: [-0.5, -0.2]},
+}
+MARKET_PRICE = 10.0
+
+
+def decoupled_simulation(sim_idx: int) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """Results and end basin volumes of a decoupled simulation, which starts from the initial volume."""
+    volume = {b: START_VOLUME + np.cumsum([0.0, *diff[sim_idx]]) for b, diff in VOLUME_DIFF.items()}
+    results = pl.DataFrame({
+        "sim_idx": [sim_idx] * 2,
+        "T": [0, 1],
+        "market_price": [MARKET_PRICE] * 2,
+        **{f"basin_volume_{b}": volume[b][:-1] for b in VOLUME_DIFF},
+        **{f"spilled_volume_{b}": [0.0, 0.0] for b in VOLUME_DIFF},
+    })
+    end_basin_volume = pl.DataFrame(
+        {"sim_idx": [sim_idx] * 2, "B": list(VOLUME_DIFF), "end_basin_volume": [volume[b][-1] for b in VOLUME_DIFF]},
+        schema_overrides={"B": pl.UInt32},
+    )
+    return results, end_basin_volume
+
+
+@pytest.fixture
+def second_stage(monkeypatch) -> StochasticSecondStage:
+    second_stage = object.__new__(StochasticSecondStage)
+    second_stage.water_basin = pl.DataFrame({"B": [0, 1]}, schema={"B": pl.UInt32})
+    second_stage.first_start_basin_volume = pl.DataFrame(
+        {"B": [0, 1], "start_basin_volume": [START_VOLUME] * 2}, schema_overrides={"B": pl.UInt32}
+    )
+    # Basin 1 is the only upstream basin: 3600 m3 of missing water is 2 MWh
+    second_stage.data = {"basin_volume_range": {0: 1000.0, 1: 3600.0}, "rated_alpha": {1: 2.0}}
+    monkeypatch.setattr(second_stage, "generate_constant_parameters", lambda: None)
+    # Simulations arrive out of order, as with the chunks of several workers
+    simulations = [decoupled_simulation(sim_idx) for sim_idx in [2, 0, 1]]
+    second_stage.sim_results = [results for results, _ in simulations]
+    second_stage.decoupled_end_basin_volume = [end_basin_volume for _, end_basin_volume in simulations]
+    return second_stage
+
+
+def test_reconcile_decoupled_results(second_stage):
+    second_stage.reconcile_decoupled_results()
+    results = second_stage.sim_results[0]
+
+    assert results.select("sim_idx", "T").rows() == [(0, 0), (0, 1), (1, 0), (1, 1), (2, 0), (2, 1)]
+    np.testing.assert_allclose(results["basin_volume_0"], [0.5, 0.8, 1.0, 0.6, 0.7, 1.0], atol=1e-12)
+    np.testing.assert_allclose(results["basin_volume_1"], [0.5, 0.2, 0.0, 0.4, 0.3, 0.0], atol=1e-12)
+    np.testing.assert_allclose(results["spilled_volume_0"], [0, 100, 0, 0, 200, 200], atol=1e-9)
+    np.testing.assert_allclose(results["spilled_volume_1"], [0] * 6, atol=1e-9)
+    np.testing.assert_allclose(results["reconciliation_income"], [0, -2, 0, 0, -4, -4], atol=1e-9)
+    np.testing.assert_allclose(
+        results["volume_deviation_1"], [0.0, 0.0, -0.5, -0.5, -0.2, 0.0], atol=1e-12
+    )
+    np.testing.assert_allclose(
+        second_stage.second_stage_end_basin_volume.sort("B")["end_basin_volume"], [1.0, 0.0], atol=1e-12
+    )
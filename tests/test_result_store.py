@@ -0,0 +1,55 @@
+import duckdb
+import polars as pl
+
+from utility.result_store import (
+    StudyResultWriter, build_result_views, scan_result_store, write_result_partition
+)
+
+
+def test_append_adds_missing_columns(tmp_path, monkeypatch):
+    # build_non_existing_dirs only handles relative paths
+    monkeypatch.chdir(tmp_path)
+    file_path = "study/results.duckdb"
+    with StudyResultWriter(file_path) as writer:
+        writer.append("results", pl.DataFrame({"T": [0, 1], "income": [1.0, 2.0]}), hydro="DT")
+        writer.append(
+            "results",
+            pl.DataFrame({"T": [0], "income": [3.0], "hydro_power_1": [4.0], "flow_1": [5.0]}),
+            hydro="DTP",
+        )
+        writer.append("results", pl.DataFrame({"T": [2], "income": [6.0]}), hydro="DT")
+
+    with duckdb.connect(file_path, read_only=True) as con:
+        results = con.execute('SELECT * FROM "results" ORDER BY income').pl()
+
+    assert results.columns == ["hydro", "T", "income", "hydro_power_1", "flow_1"]
+    assert results["hydro"].to_list() == ["DT", "DT", "DTP", "DT"]
+    assert results["hydro_power_1"].to_list() == [None, None, 4.0, None]
+    assert results["flow_1"].to_list() == [None, None, 5.0, None]
+
+
+def test_read_partitions_with_different_columns(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_result_partition(
+        pl.DataFrame({"T": [0, 1], "hydro_power_0": [1.0, 2.0]}),
+        store_folder="store", study="design", scenario="DT_DA_0MW", year=2024,
+    )
+    write_result_partition(
+        pl.DataFrame({"T": [0], "hydro_power_0": [3.0], "hydro_power_1": [4.0], "battery_soc": [0.5]}),
+        store_folder="store", study="design", scenario="DTP_DA_1MW_2MWh", year=2024,
+    )
+
+    results = scan_result_store("store", study="design").sort("scenario", "T").collect()
+    assert results["hydro_power_0"].to_list() == [3.0, 1.0, 2.0]
+    assert results["hydro_power_1"].to_list() == [4.0, None, None]
+    assert results["battery_soc"].to_list() == [0.5, None, None]
+    dt_results = scan_result_store("store", scenario="DT_DA_0MW").collect()
+    assert dt_results["hydro_power_0"].to_list() == [1.0, 2.0]
+
+    build_result_views(store_folder="store", study="design", file_path="design/results.duckdb")
+    with duckdb.connect("design/results.duckdb", read_only=True) as con:
+        results = con.execute("SELECT * FROM results ORDER BY scenario, T").pl()
+        dtp_results = con.execute('SELECT * FROM "DTP_DA_1MW_2MWh"').pl()
+    assert results["hydro_power_1"].to_list() == [4.0, None, None]
+    assert results["battery_soc"].to_list() == [0.5, None, None]
+    assert dtp_results.select("T", "hydro_power_0", "hydro_power_1", "battery_soc").rows() == [(0, 3.0, 4.0, 0.5)]
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+import numpy as np
+import polars as pl
+import pytest
+
+from timeseries_preparation.scenario_reduction import reduce_scenarios
+
+NB_SCENARIOS = 12
+NB_DAYS = 30
+
+
+@pytest.fixture
+def timeseries() -> pl.DataFrame:
+    rng = np.random.default_rng(0)
+    timestamp = pl.datetime_range(
+        datetime(2024, 1, 1), datetime(2024, 1, NB_DAYS), interval="1d", eager=True
+    )
+    return pl.DataFrame({
+        "timestamp": timestamp.gather(np.repeat(np.arange(NB_DAYS), NB_SCENARIOS)),
+        "Ω": np.tile(np.arange(NB_SCENARIOS), NB_DAYS),
+        "market_price": rng.normal(80, 20, size=NB_DAYS * NB_SCENARIOS),
+        "discharge_volume_0": rng.gamma(2, 1e4, size=NB_DAYS * NB_SCENARIOS),
+    })
+
+
+@pytest.mark.parametrize("method", ["fast_forward", "k_medoids"])
+@pytest.mark.parametrize("nb_scenarios", [1, 4, NB_SCENARIOS - 1])
+def test_reduced_scenarios_are_a_weighted_subset(timeseries, method, nb_scenarios):
+    reduced = reduce_scenarios(timeseries=timeseries, nb_scenarios=nb_scenarios, method=method)
+    assert reduced.height == nb_scenarios
+    assert reduced["Ω"].is_unique().all()
+    assert set(reduced["Ω"].to_list()) <= set(timeseries["Ω"].to_list())
+    assert reduced["Ω"].dtype == timeseries["Ω"].dtype
+    assert (reduced["probability"] > 0).all()
+    assert reduced["probability"].sum() == pytest.approx(1.0)
+
+
+def test_every_scenario_kept(timeseries):
+    reduced = reduce_scenarios(timeseries=timeseries, nb_scenarios=NB_SCENARIOS)
+    assert reduced["Ω"].to_list() == list(range(NB_SCENARIOS))
+    assert reduced["probability"].sum() == pytest.approx(1.0)
+
+
+def test_unknown_method(timeseries):
+    with pytest.raises(ValueError):
+        reduce_scenarios(timeseries=timeseries, nb_scenarios=2, method="random")
@@ -0,0 +1,48 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from pipelines.result_manager import scenario_statistics
+
+QUANTILES = [0.0, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 1.0]
+
+
+@pytest.mark.parametrize("nb_scenarios", [1, 2, 3, 4, 7, 20, 21])
+def test_uniform_probability_matches_unweighted(nb_scenarios):
+    basin_volume = np.random.default_rng(nb_scenarios).normal(size=(5, nb_scenarios, 2))
+    mean, quantile = scenario_statistics(basin_volume, quantiles=QUANTILES)
+    weighted_mean, weighted_quantile = scenario_statistics(
+        basin_volume, quantiles=QUANTILES, probability=np.full(nb_scenarios, 1 / nb_scenarios)
+    )
+    np.testing.assert_allclose(weighted_mean, mean)
+    np.testing.assert_array_equal(weighted_quantile, quantile)
+
+
+def test_unweighted_matches_polars():
+    nb_timestamps, nb_scenarios, nb_basins = 4, 11, 2
+    basin_volume = np.random.default_rng(0).normal(size=(nb_timestamps, nb_scenarios, nb_basins))
+    mean, quantile = scenario_statistics(basin_volume, quantiles=QUANTILES)
+
+    long_frame = pl.DataFrame({
+        "T": np.repeat(np.arange(nb_timestamps), nb_scenarios * nb_basins),
+        "B": np.tile(np.arange(nb_basins), nb_timestamps * nb_scenarios),
+        "volume": basin_volume.ravel(),
+    })
+    expected = long_frame.group_by("T", "B").agg(
+        pl.col("volume").mean().alias("mean"),
+        *[
+            pl.col("volume").quantile(q, interpolation="nearest").alias(f"q_{i}")
+            for i, q in enumerate(QUANTILES)
+        ],
+    ).sort("T", "B")
+    np.testing.assert_allclose(mean.ravel(), expected["mean"].to_numpy())
+    for i in range(len(QUANTILES)):
+        np.testing.assert_array_equal(quantile[i].ravel(), expected[f"q_{i}"].to_numpy())
+
+
+def test_weighted_quantiles_follow_probability():
+    basin_volume = np.array([3.0, 1.0, 2.0, 4.0]).reshape(1, 4, 1)
+    probability = np.array([0.1, 0.1, 0.7, 0.1])
+    mean, quantile = scenario_statistics(basin_volume, quantiles=[0.0, 0.5, 1.0], probability=probability)
+    np.testing.assert_allclose(mean, [[0.3 + 0.1 + 1.4 + 0.4]])
+    np.testing.assert_array_equal(quantile[:, 0, 0], [1.0, 2.0, 4.0])
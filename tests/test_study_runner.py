@@ -0,0 +1,90 @@
+import time
+from dataclasses import dataclass
+
+from pipelines.study_runner import StudyRunner, config_hash
+
+CALLS: list[str] = []
+
+
+@dataclass
+class Config:
+    value: int
+    verbose: bool = False
+
+
+def load(config: Config) -> int:
+    CALLS.append("load")
+    return config.value
+
+
+def scale(data: int, factor: int) -> int:
+    CALLS.append("scale")
+    return data * factor
+
+
+def total(data: list[int]) -> int:
+    CALLS.append("total")
+    return sum(data)
+
+
+def test_nodes_with_the_same_key_are_run_once():
+    CALLS.clear()
+    runner = StudyRunner()
+    first = runner.add_node("first", load, config=Config(value=2), ignored_fields=("verbose",))
+    # Only differs by an ignored field, so it shares the output of the first node
+    second = runner.add_node("second", load, config=Config(value=2, verbose=True), ignored_fields=("verbose",))
+    scaled = [
+        runner.add_node(f"scaled_{i}", scale, inputs={"data": parent}, factor=3)
+        for i, parent in enumerate([first, second])
+    ]
+    runner.add_node("total", total, inputs={"data": scaled})
+
+    outputs = runner.run()
+    assert outputs == {"first": 2, "second": 2, "scaled_0": 6, "scaled_1": 6, "total": 12}
+    assert CALLS == ["load", "scale", "total"]
+    assert runner.nodes["first"].key == runner.nodes["second"].key
+
+
+def test_outputs_are_reused_between_runs():
+    CALLS.clear()
+    runner = StudyRunner()
+    data = runner.add_node("data", load, config=Config(value=1))
+    runner.run()
+    runner.add_node("scaled", scale, inputs={"data": data}, factor=5)
+    assert runner.run(targets=["scaled"]) == {"scaled": 5}
+    assert CALLS == ["load", "scale"]
+
+
+def test_different_inputs_give_different_keys():
+    CALLS.clear()
+    runner = StudyRunner()
+    runner.add_node("first", load, config=Config(value=1))
+    runner.add_node("second", load, config=Config(value=2))
+    assert runner.run() == {"first": 1, "second": 2}
+    assert CALLS == ["load", "load"]
+    assert config_hash(Config(value=1)) != config_hash(Config(value=2))
+    assert config_hash(Config(value=1), ignored_fields=("verbose",)) == config_hash(
+        Config(value=1, verbose=True), ignored_fields=("verbose",)
+    )
+
+
+def timed(label: str) -> tuple[float, float]:
+    start = time.monotonic()
+    time.sleep(0.5)
+    return start, time.monotonic()
+
+
+def test_running_nodes_fit_in_the_worker_slots():
+    runner = StudyRunner(nb_workers=2, thread_budget=1)
+    runner.add_node("wide_0", timed, nb_slots=2, label="wide_0")
+    runner.add_node("wide_1", timed, nb_slots=2, label="wide_1")
+    runner.add_node("too_wide", timed, nb_slots=3, label="too_wide")
+    runner.add_node("narrow_0", timed, label="narrow_0")
+    runner.add_node("narrow_1", timed, label="narrow_1")
+    outputs = runner.run()
+
+    def overlap(first: str, second: str) -> bool:
+        return outputs[first][0] < outputs[second][1] and outputs[second][0] < outputs[first][1]
+
+    for wide in ["wide_0", "wide_1", "too_wide"]:
+        assert not any(overlap(wide, other) for other in outputs if other != wide)